@@ -10,6 +10,18 @@ from   select   import select
 import socket
 import ssl
 
+try :
+    from select import poll, POLLIN, POLLOUT, POLLHUP
+except :
+    poll = None
+
+try :
+    import selectors
+except :
+    selectors = None
+
+_BYTEARRAY_FIND = hasattr(bytearray, 'find')
+
 try :
     from time import perf_counter
 except :
@@ -17,6 +29,136 @@ except :
     def perf_counter() :
         return ticks_ms() / 1000
 
+# ============================================================================
+# ===( XAsyncSocketsPool backends )===========================================
+# ============================================================================
+
+# Events of a socket, as a bit mask
+_EV_READ   = 0x01
+_EV_WRITE  = 0x02
+_EV_EXCEPT = 0x04
+
+# Each backend follows the sockets' masks through Modify() (from 0 when a socket is first watched, to 0 when it
+# no longer is) and returns [ (socket, events), ... ] from Wait().
+
+class _XSelectBackend :
+
+    Name = 'select'
+
+    def __init__(self) :
+        self._readList  = [ ]
+        self._writeList = [ ]
+
+    # ------------------------------------------------------------------------
+
+    def Modify(self, socket, oldMask, newMask) :
+        changed = oldMask ^ newMask
+        if changed & _EV_READ :
+            if newMask & _EV_READ :
+                self._readList.append(socket)
+            else :
+                self._readList.remove(socket)
+        if changed & _EV_WRITE :
+            if newMask & _EV_WRITE :
+                self._writeList.append(socket)
+            else :
+                self._writeList.remove(socket)
+
+    # ------------------------------------------------------------------------
+
+    def Wait(self, timeoutSec) :
+        rd, wr, ex = select( self._readList,
+                             self._writeList,
+                             self._readList,
+                             timeoutSec )
+        events = { }
+        for socketsList, event in (ex, _EV_EXCEPT), (wr, _EV_WRITE), (rd, _EV_READ) :
+            for socket in socketsList :
+                item = events.get(id(socket), None)
+                if item :
+                    item[1] |= event
+                else :
+                    events[id(socket)] = [socket, event]
+        return events.values()
+
+# ----------------------------------------------------------------------------
+
+class _XPollBackend :
+
+    Name = 'poll'
+
+    def __init__(self) :
+        self._poll    = poll()
+        self._sockets = { }     # File descriptor -> socket, for ports whose poll() returns descriptors
+
+    # ------------------------------------------------------------------------
+
+    def Modify(self, socket, oldMask, newMask) :
+        if not newMask :
+            self._poll.unregister(socket)
+            try :
+                del self._sockets[socket.fileno()]
+            except :
+                pass
+            return
+        pollMask = (POLLIN  if newMask & _EV_READ  else 0) | \
+                   (POLLOUT if newMask & _EV_WRITE else 0)
+        if oldMask :
+            self._poll.modify(socket, pollMask)
+        else :
+            self._poll.register(socket, pollMask)
+            try :
+                self._sockets[socket.fileno()] = socket
+            except :
+                pass
+
+    # ------------------------------------------------------------------------
+
+    def Wait(self, timeoutSec) :
+        events = [ ]
+        for item in self._poll.poll(int(timeoutSec * 1000)) :
+            socket, pollMask = item[0], item[1]
+            if type(socket) is int :
+                socket = self._sockets.get(socket, None)
+            # A hang-up is seen by reading (or writing) as usual, anything else (error, invalid) is exceptional
+            event = (_EV_READ | _EV_WRITE if pollMask & POLLHUP else 0) | \
+                    (_EV_READ   if pollMask & POLLIN  else 0)          | \
+                    (_EV_WRITE  if pollMask & POLLOUT else 0)          | \
+                    (_EV_EXCEPT if pollMask & ~(POLLIN | POLLOUT | POLLHUP) else 0)
+            events.append((socket, event))
+        return events
+
+# ----------------------------------------------------------------------------
+
+class _XSelectorsBackend :
+
+    def __init__(self) :
+        self._selector = selectors.DefaultSelector()
+        self.Name      = type(self._selector).__name__.replace('Selector', '').lower()
+
+    # ------------------------------------------------------------------------
+
+    def Modify(self, socket, oldMask, newMask) :
+        if not newMask :
+            self._selector.unregister(socket)
+            return
+        selMask = (selectors.EVENT_READ  if newMask & _EV_READ  else 0) | \
+                  (selectors.EVENT_WRITE if newMask & _EV_WRITE else 0)
+        if oldMask :
+            self._selector.modify(socket, selMask, socket)
+        else :
+            self._selector.register(socket, selMask, socket)
+
+    # ------------------------------------------------------------------------
+
+    def Wait(self, timeoutSec) :
+        events = [ ]
+        for key, selMask in self._selector.select(timeoutSec) :
+            events.append( ( key.data,
+                             (_EV_READ  if selMask & selectors.EVENT_READ  else 0) | \
+                             (_EV_WRITE if selMask & selectors.EVENT_WRITE else 0) ) )
+        return events
+
 # ============================================================================
 # ===( XAsyncSocketsPool )====================================================
 # ============================================================================
@@ -26,14 +168,25 @@ class XAsyncSocketsPoolException(Exception) :
 
 class XAsyncSocketsPool :
 
-    def __init__(self) :
+    # Readiness backends, best first - selectors (epoll, kqueue...) on CPython, poll on MicroPython, else select
+    BACKENDS = ( ('selectors', _XSelectorsBackend, selectors is not None),
+                 ('poll',      _XPollBackend,      poll      is not None),
+                 ('select',    _XSelectBackend,    True) )
+
+    def __init__(self, backend=None) :
         self._processing   = False
         self._threadsCount = 0
         self._opLock       = allocate_lock()
         self._asyncSockets = { }
-        self._readList     = [ ]
-        self._writeList    = [ ]
-        self._handlingList = [ ]
+        self._eventsMasks  = { }
+        self._handlingIDs  = set()
+        self._backend      = None
+        for name, backendClass, available in self.BACKENDS :
+            if available and (backend is None or backend == name) :
+                self._backend = backendClass()
+                break
+        if not self._backend :
+            raise XAsyncSocketsPoolException('Backend "%s" is not available.' % backend)
 
     # ------------------------------------------------------------------------
 
@@ -58,6 +211,7 @@ class XAsyncSocketsPool :
             ok = (socketno not in self._asyncSockets)
             if ok :
                 self._asyncSockets[socketno] = asyncSocket
+                self._eventsMasks[socketno]  = 0
             self._opLock.release()
             return ok
         return False
@@ -71,36 +225,53 @@ class XAsyncSocketsPool :
             ok = (socketno in self._asyncSockets)
             if ok :
                 del self._asyncSockets[socketno]
-                if socket in self._readList :
-                    self._readList.remove(socket)
-                if socket in self._writeList :
-                    self._writeList.remove(socket)
+                mask = self._eventsMasks.pop(socketno)
+                if mask :
+                    try :
+                        self._backend.Modify(socket, mask, 0)
+                    except :
+                        pass
             self._opLock.release()
             return ok
         return False
 
     # ------------------------------------------------------------------------
 
-    def _socketListAdd(self, socket, socketsList) :
+    def _setEvent(self, socket, event, notify) :
+        socketno = id(socket)
         self._opLock.acquire()
-        ok = (id(socket) in self._asyncSockets and socket not in socketsList)
+        oldMask = self._eventsMasks.get(socketno, None)
+        ok      = (oldMask is not None)
         if ok :
-            socketsList.append(socket)
+            newMask = (oldMask | event) if notify else (oldMask & ~event)
+            if newMask != oldMask :
+                try :
+                    self._backend.Modify(socket, oldMask, newMask)
+                    self._eventsMasks[socketno] = newMask
+                except :
+                    ok = False
         self._opLock.release()
         return ok
 
     # ------------------------------------------------------------------------
 
-    def _socketListRemove(self, socket, socketsList) :
+    def _startHandling(self, socketno) :
         self._opLock.acquire()
-        ok = (id(socket) in self._asyncSockets and socket in socketsList)
+        ok = (socketno in self._asyncSockets and socketno not in self._handlingIDs)
         if ok :
-            socketsList.remove(socket)
+            self._handlingIDs.add(socketno)
         self._opLock.release()
         return ok
 
     # ------------------------------------------------------------------------
 
+    def _endHandling(self, socketno) :
+        self._opLock.acquire()
+        self._handlingIDs.discard(socketno)
+        self._opLock.release()
+
+    # ------------------------------------------------------------------------
+
     _CHECK_SEC_INTERVAL = 1.0
 
     def _processWaitEvents(self) :
@@ -109,27 +280,26 @@ class XAsyncSocketsPool :
         while self._processing :
             try :
                 try :
-                    rd, wr, ex = select( self._readList,
-                                         self._writeList,
-                                         self._readList,
-                                         self._CHECK_SEC_INTERVAL )
+                    events = self._backend.Wait(self._CHECK_SEC_INTERVAL)
                 except KeyboardInterrupt as ex :
                     raise ex
                 except :
                     continue
                 if not self._processing :
                     break
-                for socketsList in ex, wr, rd :
-                    for socket in socketsList :
-                        asyncSocket = self._asyncSockets.get(id(socket), None)
-                        if asyncSocket and self._socketListAdd(socket, self._handlingList) :
-                            if socketsList is ex :
-                                asyncSocket.OnExceptionalCondition()
-                            elif socketsList is wr :
-                                asyncSocket.OnReadyForWriting()
-                            else :
-                                asyncSocket.OnReadyForReading()
-                            self._socketListRemove(socket, self._handlingList)
+                for socket, event in events :
+                    socketno = id(socket)
+                    if self._startHandling(socketno) :
+                        asyncSocket = self._asyncSockets.get(socketno, None)
+                        if asyncSocket and event & _EV_EXCEPT :
+                            asyncSocket.OnExceptionalCondition()
+                        asyncSocket = self._asyncSockets.get(socketno, None)
+                        if asyncSocket and event & _EV_WRITE & self._eventsMasks.get(socketno, 0) :
+                            asyncSocket.OnReadyForWriting()
+                        asyncSocket = self._asyncSockets.get(socketno, None)
+                        if asyncSocket and event & _EV_READ & self._eventsMasks.get(socketno, 0) :
+                            asyncSocket.OnReadyForReading()
+                        self._endHandling(socketno)
                 sec = perf_counter()
                 if sec > timeSec + self._CHECK_SEC_INTERVAL :
                     timeSec = sec
@@ -176,10 +346,7 @@ class XAsyncSocketsPool :
             socket = asyncSocket.GetSocketObj()
         except :
             raise XAsyncSocketsPoolException('NotifyNextReadyForReading : "asyncSocket" is incorrect.')
-        if notify :
-            self._socketListAdd(socket, self._readList)
-        else :
-            self._socketListRemove(socket, self._readList)
+        self._setEvent(socket, _EV_READ, notify)
 
     # ------------------------------------------------------------------------
 
@@ -188,10 +355,7 @@ class XAsyncSocketsPool :
             socket = asyncSocket.GetSocketObj()
         except :
             raise XAsyncSocketsPoolException('NotifyNextReadyForWriting : "asyncSocket" is incorrect.')
-        if notify :
-            self._socketListAdd(socket, self._writeList)
-        else :
-            self._socketListRemove(socket, self._writeList)
+        self._setEvent(socket, _EV_WRITE, notify)
 
     # ------------------------------------------------------------------------
 
@@ -224,6 +388,10 @@ class XAsyncSocketsPool :
     def WaitEventsProcessing(self) :
         return (self._threadsCount > 0)
 
+    @property
+    def Backend(self) :
+        return self._backend.Name
+
 # ============================================================================
 # ===( XClosedReason )========================================================
 # ============================================================================
@@ -525,6 +693,9 @@ class XAsyncTCPClient(XAsyncSocket) :
             self._rdLinePos        = None
             self._rdLineEncoding   = None
             self._rdBufView        = None
+            self._rdStart          = 0
+            self._rdEnd            = 0
+            self._rdReading        = False
             self._wrBufView        = None
             self._socketOpened     = (cliAddr is not None)
         except :
@@ -546,101 +717,148 @@ class XAsyncTCPClient(XAsyncSocket) :
 
     # ------------------------------------------------------------------------
 
+    def _recvInto(self, buf) :
+        try :
+            try :
+                return self._socket.recv_into(buf)
+            except AttributeError :
+                return self._socket.readinto(buf)
+        except ssl.SSLError as sslErr :
+            if sslErr.args[0] != ssl.SSL_ERROR_WANT_READ :
+                self._close()
+            return None
+        except OSError as osErr :
+            if osErr.args[0] not in (11, 35) :   # EAGAIN on Linux/ESP32 and on macOS - wait for more
+                self._close()
+            return None
+        except :
+            self._close()
+            return None
+
+    # ------------------------------------------------------------------------
+
+    def _findLF(self, start, end) :
+        buf = self._recvBufSlot.Buffer
+        if _BYTEARRAY_FIND :
+            return buf.find(b'\n', start, end)
+        for i in range(start, end) :
+            if buf[i] == 10 :
+                return i
+        return -1
+
+    # ------------------------------------------------------------------------
+
+    def _moreToRead(self) :
+        return ( self._rdEnd > self._rdStart or \
+                 (self._rdBufView is not None and not self._sizeToRecv) or \
+                 (self.IsSSL and self._socket.pending() > 0) )
+
+    # ------------------------------------------------------------------------
+
     def OnReadyForReading(self) :
-        while True :
+        self._rdReading = True
+        try :
+            self._processReading()
+        finally :
+            self._rdReading = False
+
+    # ------------------------------------------------------------------------
+
+    def _processReading(self) :
+        while self._socket :
             if self._rdLinePos is not None :
-                # In the context of reading a line,
+                # In the context of reading a line, bytes already received are scanned first,
+                # then as much as fits is received into the buffer slot, after those bytes,
                 while True :
-                    try :
-                        try :
-                            b = self._socket.recv(1)
-                        except ssl.SSLError as sslErr :
-                            if sslErr.args[0] != ssl.SSL_ERROR_WANT_READ :
-                                self._close()
-                            return
-                        except BlockingIOError as bioErr :
-                            if bioErr.errno != 35 :
-                                self._close()
-                            return
-                        except :
+                    pos = self._findLF(self._rdStart + self._rdLinePos, self._rdEnd)
+                    if pos >= 0 :
+                        break
+                    self._rdLinePos = self._rdEnd - self._rdStart
+                    size = self._recvBufSlot.Size
+                    if self._rdEnd == size :
+                        if self._rdStart == 0 :
                             self._close()
                             return
-                    except :
-                        self._close()
+                        buf = memoryview(self._recvBufSlot.Buffer)
+                        buf[:self._rdLinePos] = buf[self._rdStart:self._rdEnd]
+                        self._rdStart = 0
+                        self._rdEnd   = self._rdLinePos
+                    n = self._recvInto(memoryview(self._recvBufSlot.Buffer)[self._rdEnd:])
+                    if n is None :
                         return
-                    if b :
-                        if b == b'\n' :
-                            lineLen = self._rdLinePos 
-                            self._rdLinePos = None
-                            self._asyncSocketsPool.NotifyNextReadyForReading(self, False)
-                            self._removeExpireTimeout()
-                            if self._onDataRecv :
-                                line = self._recvBufSlot.Buffer[:lineLen]
-                                try :
-                                    line = bytes(line).decode(self._rdLineEncoding)
-                                except :
-                                    line = None
-                                try :
-                                    self._onDataRecv(self, line, self._onDataRecvArg)
-                                except Exception as ex :
-                                    raise XAsyncTCPClientException('Error when handling the "OnDataRecv" event : %s' % ex)
-                            if self.IsSSL and self._socket.pending() > 0 :
-                                break
-                            return
-                        elif b != b'\r' :
-                            if self._rdLinePos < self._recvBufSlot.Size :
-                                self._recvBufSlot.Buffer[self._rdLinePos] = ord(b)
-                                self._rdLinePos += 1
-                            else :
-                                self._close()
-                                return
-                    else :
+                    if not n :
                         self._close(XClosedReason.ClosedByPeer)
                         return
-            elif self._sizeToRecv :
-                # In the context of reading data,
-                recvBuf = self._rdBufView[-self._sizeToRecv:]
-                try :
+                    self._rdEnd += n
+                lineStart = self._rdStart
+                lineEnd   = pos
+                if lineEnd > lineStart and self._recvBufSlot.Buffer[lineEnd-1] == 13 :
+                    lineEnd -= 1
+                self._rdStart = pos + 1
+                if self._rdStart == self._rdEnd :
+                    self._rdStart = 0
+                    self._rdEnd   = 0
+                self._rdLinePos = None
+                self._removeExpireTimeout()
+                if self._onDataRecv :
+                    line = self._recvBufSlot.Buffer[lineStart:lineEnd]
                     try :
-                        n = self._socket.recv_into(recvBuf)
-                    except ssl.SSLError as sslErr :
-                        if sslErr.args[0] != ssl.SSL_ERROR_WANT_READ :
-                            self._close()
-                        return
-                    except BlockingIOError as bioErr :
-                        if bioErr.errno != 35 :
-                            self._close()
-                        return
+                        line = bytes(line).decode(self._rdLineEncoding)
                     except :
-                        self._close()
-                        return
-                except :
+                        line = None
                     try :
-                        n = self._socket.readinto(recvBuf)
-                    except :
-                        self._close()
-                        return
-                if not n :
-                    self._close(XClosedReason.ClosedByPeer)
+                        self._onDataRecv(self, line, self._onDataRecvArg)
+                    except Exception as ex :
+                        self._endReading()
+                        raise XAsyncTCPClientException('Error when handling the "OnDataRecv" event : %s' % ex)
+                self._endReading()
+                if not self._socket or not self._moreToRead() :
                     return
-                self._sizeToRecv -= n
+            elif self._rdBufView is not None :
+                # In the context of reading data,
+                if self._sizeToRecv :
+                    recvBuf = self._rdBufView[-self._sizeToRecv:]
+                    n = self._recvInto(recvBuf)
+                    if n is None :
+                        return
+                    if not n :
+                        self._close(XClosedReason.ClosedByPeer)
+                        return
+                    self._sizeToRecv -= n
                 if not self._sizeToRecv :
                     data = self._rdBufView
                     self._rdBufView = None
-                    self._asyncSocketsPool.NotifyNextReadyForReading(self, False)
                     self._removeExpireTimeout()
                     if self._onDataRecv :
                         try :
                             self._onDataRecv(self, data, self._onDataRecvArg)
                         except Exception as ex :
+                            self._endReading()
                             raise XAsyncTCPClientException('Error when handling the "OnDataRecv" event : %s' % ex)
-                    if not self.IsSSL or self._socket.pending() == 0 :
+                    self._endReading()
+                    if not self._socket or not self._moreToRead() :
                         return
             else :
                 return
 
     # ------------------------------------------------------------------------
 
+    def _endReading(self) :
+        # After a receive completes, the socket stays watched for reading if the "OnDataRecv" event
+        # started another one, so back-to-back receives don't register and unregister it each time.
+        if self._socket and self._rdLinePos is None and self._rdBufView is None :
+            self._asyncSocketsPool.NotifyNextReadyForReading(self, False)
+
+    # ------------------------------------------------------------------------
+
+    def _useBufferedData(self) :
+        # The socket may never become ready for reading again for bytes already received,
+        # so any asynchronous receive they complete is processed now.
+        if not self._rdReading and self._moreToRead() :
+            self.OnReadyForReading()
+
+    # ------------------------------------------------------------------------
+
     def OnReadyForWriting(self) :
         if not self._socketOpened :
             if hasattr(self._socket, "getsockopt") :
@@ -677,7 +895,7 @@ class XAsyncTCPClient(XAsyncSocket) :
     # ------------------------------------------------------------------------
 
     def AsyncRecvLine(self, lineEncoding='UTF-8', onLineRecv=None, onLineRecvArg=None, timeoutSec=None) :
-        if self._rdLinePos is not None or self._sizeToRecv :
+        if self._rdLinePos is not None or self._rdBufView is not None :
             raise XAsyncTCPClientException('AsyncRecvLine : Already waiting asynchronous receive.')
         if self._socket :
             self._setExpireTimeout(timeoutSec)
@@ -686,31 +904,46 @@ class XAsyncTCPClient(XAsyncSocket) :
             self._onDataRecv     = onLineRecv
             self._onDataRecvArg  = onLineRecvArg
             self._asyncSocketsPool.NotifyNextReadyForReading(self, True)
+            self._useBufferedData()
             return True
         return False
 
     # ------------------------------------------------------------------------
 
     def AsyncRecvData(self, size=None, onDataRecv=None, onDataRecvArg=None, timeoutSec=None) :
-        if self._rdLinePos is not None or self._sizeToRecv :
+        if self._rdLinePos is not None or self._rdBufView is not None :
             raise XAsyncTCPClientException('AsyncRecvData : Already waiting asynchronous receive.')
         if self._socket :
             if size is None :
                 size = self._recvBufSlot.Size
             elif not isinstance(size, int) or size <= 0 :
                 raise XAsyncTCPClientException('AsyncRecvData : "size" is incorrect.')
-            if size <= self._recvBufSlot.Size :
-                self._rdBufView = memoryview(self._recvBufSlot.Buffer)[:size]
+            # Bytes received after the end of the last line are the start of the data,
+            buffered = self._rdEnd - self._rdStart
+            buf      = memoryview(self._recvBufSlot.Buffer)
+            if buffered >= size :
+                self._rdBufView = buf[self._rdStart:self._rdStart+size]
+                self._rdStart  += size
+                buffered        = size
             else :
-                try :
-                    self._rdBufView = memoryview(bytearray(size))
-                except :
-                    raise XAsyncTCPClientException('AsyncRecvData : No enought memory to receive %s bytes.' % size)
+                if size <= self._recvBufSlot.Size :
+                    self._rdBufView = buf[:size]
+                else :
+                    try :
+                        self._rdBufView = memoryview(bytearray(size))
+                    except :
+                        raise XAsyncTCPClientException('AsyncRecvData : No enought memory to receive %s bytes.' % size)
+                self._rdBufView[:buffered] = buf[self._rdStart:self._rdEnd]
+                self._rdStart = self._rdEnd
+            if self._rdStart == self._rdEnd :
+                self._rdStart = 0
+                self._rdEnd   = 0
             self._setExpireTimeout(timeoutSec)
-            self._sizeToRecv    = size
+            self._sizeToRecv    = size - buffered
             self._onDataRecv    = onDataRecv
             self._onDataRecvArg = onDataRecvArg
             self._asyncSocketsPool.NotifyNextReadyForReading(self, True)
+            self._useBufferedData()
             return True
         return False
 
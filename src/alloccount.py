@@ -0,0 +1,63 @@
+""" Count heap allocations made by a section of code
+"""
+
+import gc
+
+class AllocCounter:
+    def __init__(self, name):
+        """ Initialise the counter
+
+        Args:
+            name (string): What is being measured - used in the report
+        """
+        self.name    = name
+        self.start   = 0
+        self.count   = 0  # Number of measurements
+        self.nonzero = 0  # Number of measurements which allocated something
+        self.total   = 0  # Total bytes allocated
+        self.max     = 0  # Most bytes allocated by one measurement
+        self.skipped = 0  # Measurements discarded because a garbage collection happened part way through
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r})".format(self.__class__.__name__, self.name)
+
+    def begin(self):
+        """ Start measuring
+        """
+        self.start = gc.mem_alloc()
+
+    def end(self):
+        """ Stop measuring and record how much was allocated since begin()
+
+        Returns:
+            int: Bytes allocated, or -1 if a garbage collection made the measurement meaningless
+        """
+        allocated = gc.mem_alloc() - self.start
+        if allocated < 0:
+            self.skipped += 1
+            return -1
+
+        self.count += 1
+        self.total += allocated
+        if allocated > 0:
+            self.nonzero += 1
+        if allocated > self.max:
+            self.max = allocated
+        return allocated
+
+    def reset(self):
+        """ Clear the statistics
+        """
+        self.count   = 0
+        self.nonzero = 0
+        self.total   = 0
+        self.max     = 0
+        self.skipped = 0
+
+    def report(self):
+        """ Print the statistics
+        """
+        print("{}: {} measured, {} allocated ({} bytes total, max {}), {} skipped".format(
+            self.name, self.count, self.nonzero, self.total, self.max, self.skipped))
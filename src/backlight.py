@@ -0,0 +1,111 @@
+""" Display power management - dim and then turn off the TFT backlight when nobody is using the clock
+"""
+
+from machine import PWM
+from utime import ticks_ms, ticks_diff
+
+# States, in order of decreasing power
+ON  = 0
+DIM = 1
+OFF = 2
+
+STATES = ("On", "Dim", "Off")
+
+class Backlight:
+    __slots__ = ('pwm', 'dim_after_ms', 'off_after_ms', 'levels', 'state', 'last_activity', 'last_change',
+                 'time_in', 'wakes')
+
+    def __init__(self, pin = 4, dim_after = 60, off_after = 300, bright = 100, dim = 10):
+        """ Take over the backlight pin and turn the backlight fully on
+
+        Args:
+            pin       (int): The backlight GPIO - the same as backl_pin given to TFT.init()
+            dim_after (int): Seconds without a button press before dimming, or 0 never to dim
+            off_after (int): Seconds without a button press before turning off, or 0 never to turn off
+            bright    (int): Normal brightness, as a PWM duty cycle percentage
+            dim       (int): Dimmed brightness, as a PWM duty cycle percentage
+        """
+        self.pwm           = PWM(pin, freq = 5000, duty = bright)
+        self.dim_after_ms  = dim_after * 1000
+        self.off_after_ms  = off_after * 1000
+        self.levels        = (bright, dim, 0)
+        self.state         = ON
+        self.last_activity = ticks_ms()
+        self.last_change   = self.last_activity
+        self.time_in       = [0, 0, 0]  # Milliseconds spent in each state, up to last_change
+        self.wakes         = 0          # Button presses which turned the backlight back on
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r}, {!r})".format(self.__class__.__name__, self.dim_after_ms // 1000, self.off_after_ms // 1000)
+
+    @property
+    def visible(self):
+        """ Whether anyone can see the screen - rendering can be suspended when they can't
+        """
+        return self.state != OFF
+
+    def _set(self, state, now):
+        """ Change the backlight state, accounting for the time spent in the old one
+        """
+        self.time_in[self.state] += ticks_diff(now, self.last_change)
+        self.last_change          = now
+        self.state                = state
+        self.pwm.duty(self.levels[state])
+
+    def wake(self):
+        """ Note some user activity, turning the backlight straight back on
+
+        Returns:
+            bool: True if the screen was off, so the user couldn't see what they were pressing
+        """
+        now                = ticks_ms()
+        self.last_activity = now
+        if self.state == ON:
+            return False
+
+        was_off = self.state == OFF
+        if was_off:
+            self.wakes += 1
+        self._set(ON, now)
+        return was_off
+
+    def poll(self):
+        """ Dim or turn off the backlight if there's been no activity for long enough
+
+        Returns:
+            bool: True if the screen is visible and should be kept up to date
+        """
+        now  = ticks_ms()
+        idle = ticks_diff(now, self.last_activity)
+        if self.off_after_ms and idle >= self.off_after_ms:
+            state = OFF
+        elif self.dim_after_ms and idle >= self.dim_after_ms:
+            state = DIM
+        else:
+            state = ON
+
+        if state != self.state:
+            self._set(state, now)
+        return self.state != OFF
+
+    def stats(self):
+        """ How long the backlight has spent in each state, and the resulting average duty cycle
+
+        Returns:
+            dict: Seconds in each state, the mean duty cycle percentage and the number of wakes
+        """
+        time_in = list(self.time_in)
+        time_in[self.state] += ticks_diff(ticks_ms(), self.last_change)
+        total = sum(time_in)
+
+        summary = {}
+        duty    = 0
+        for state in range(len(STATES)):
+            summary[STATES[state]] = time_in[state] // 1000
+            duty += time_in[state] * self.levels[state]
+        summary["mean_duty"] = duty // total if total else self.levels[self.state]
+        summary["wakes"]     = self.wakes
+        summary["state"]     = STATES[self.state]
+        return summary
@@ -0,0 +1,46 @@
+""" Boot timeline - when each stage of startup finished, in milliseconds since reset
+
+Usage:
+    boottime.mark("display")    # As each stage finishes
+    boottime.report()           # At the REPL
+"""
+
+from utime import ticks_ms
+
+_stages = [] # [name, ticks_ms when it finished]
+
+def mark(name):
+    """ Record that a boot stage has finished
+
+    Args:
+        name (string): The stage name
+    """
+    _stages.append([name, ticks_ms()])
+
+def total():
+    """ How long the boot took
+
+    Returns:
+        int: Milliseconds from reset to the last stage finishing
+    """
+    return _stages[-1][1] if _stages else 0
+
+def timeline():
+    """ Collect the timeline - e.g. to return from a web endpoint
+
+    Returns:
+        list: [name, milliseconds since reset, milliseconds the stage took] for each stage, in order
+    """
+    result = []
+    last   = 0
+    for (name, at) in _stages:
+        result.append([name, at, at - last])
+        last = at
+    return result
+
+def report():
+    """ Print the timeline at the REPL
+    """
+    print("{:16s} {:>8s} {:>8s}".format("Boot stage", "At ms", "Took ms"))
+    for (name, at, took) in timeline():
+        print("{:16s} {:8d} {:8d}".format(name, at, took))
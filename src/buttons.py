@@ -0,0 +1,190 @@
+""" Interrupt-driven button input
+
+The pin interrupt handlers only copy (button, edge, ticks_ms) into a preallocated ring buffer, so they never
+allocate and never lose a press however long the main loop is busy, e.g. fast-stepping the hands. The main
+loop then drains the queue, filtering contact bounce by timestamp and turning edges into short, long and
+double presses.
+"""
+
+from array import array
+from machine import Pin
+from utime import ticks_ms, ticks_diff
+
+# Gestures returned by ButtonEvents.pop()
+NONE   = 0
+SHORT  = 1
+LONG   = 2
+DOUBLE = 3
+
+# Edges, as recorded by the interrupt handler
+RELEASED = 0
+PRESSED  = 1
+
+LATE_LONG = 2 # Pending state - a long press to report after the short press it followed
+
+class ButtonEvents:
+    __slots__ = ('size', 'debounce_ms', 'long_ms', 'double_ms', 'pins', 'active', '_button', '_edge', '_at',
+                 'head', 'tail', 'overflows', 'bounces', 'presses', 'button', '_state', '_changed', '_down_at',
+                 '_pending', '_released_at')
+
+    def __init__(self, size = 16, debounce_ms = 30, long_ms = 800, double_ms = 300):
+        """ Initialise the queue - add buttons to it with add()
+
+        Args:
+            size        (int): Number of edges which can be queued - one slot is always left empty
+            debounce_ms (int): Edges this soon after the last accepted edge on the same button are contact bounce
+            long_ms     (int): Presses held at least this long are long presses
+            double_ms   (int): A second short press released within this time of the first makes a double press
+        """
+        self.size         = size
+        self.debounce_ms  = debounce_ms
+        self.long_ms      = long_ms
+        self.double_ms    = double_ms
+        self.pins         = []
+        self.active       = bytearray(0)   # Pin level when each button is pressed
+
+        # Raw edges, written by the interrupt handlers and read by pop()
+        self._button      = bytearray(size)
+        self._edge        = bytearray(size)
+        self._at          = array('l', [0] * size)
+        self.head         = 0  # Next slot to write - only ever changed by the interrupt handlers
+        self.tail         = 0  # Next slot to read  - only ever changed by pop()
+        self.overflows    = 0  # Edges dropped because the queue was full
+        self.bounces      = 0  # Edges discarded as contact bounce
+        self.presses      = 0  # Press edges recorded, bounce and all - changes as soon as a button goes down
+
+        # Per-button gesture state, sized by add()
+        self.button       = 0  # Button of the most recently popped gesture
+        self._state       = bytearray(0)
+        self._changed     = array('l')
+        self._down_at     = array('l')
+        self._pending     = bytearray(0)   # 1 if a short press is waiting to see if it becomes a double press
+        self._released_at = array('l')
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r}, {!r}, {!r}, {!r})".format(self.__class__.__name__, self.size, self.debounce_ms,
+                                                    self.long_ms, self.double_ms)
+
+    def add(self, pin_id, pull = None, active = 0):
+        """ Configure a pin as a button and start queueing its edges
+
+        Args:
+            pin_id (int): GPIO number
+            pull   (int): Pin.PULL_UP etc, or None if the board has its own resistor
+            active (int): Pin level when the button is pressed
+
+        Returns:
+            int: The button number, as left in self.button by pop()
+        """
+        index = len(self.pins)
+
+        def handler(pin):
+            self._record(index, PRESSED if pin.value() == active else RELEASED)
+
+        self.active       = self.active + bytes((active,))
+        self._state       = self._state + bytes(1)
+        self._pending     = self._pending + bytes(1)
+        now               = ticks_ms()
+        self._changed.append(now)
+        self._down_at.append(now)
+        self._released_at.append(now)
+
+        if pull is None:
+            pin = Pin(pin_id, Pin.IN,       handler = handler, trigger = Pin.IRQ_ANYEDGE)
+        else:
+            pin = Pin(pin_id, Pin.IN, pull, handler = handler, trigger = Pin.IRQ_ANYEDGE)
+        self.pins.append(pin)
+        return index
+
+    def refresh(self):
+        """ Queue an edge for any button whose level no longer matches its last known state - e.g. after a light
+        sleep, during which the interrupt handlers may not have run
+        """
+        if self.tail != self.head:
+            return # Edges are still waiting to be processed, so the state isn't known yet
+        for button in range(len(self.pins)):
+            edge = PRESSED if self.pins[button].value() == self.active[button] else RELEASED
+            if edge != self._state[button]:
+                self._record(button, edge)
+
+    def _record(self, button, edge):
+        """ Queue an edge (interrupt handler side only) - must not allocate
+
+        Args:
+            button (int): Button number
+            edge   (int): PRESSED or RELEASED
+        """
+        head = self.head
+        nxt  = (head + 1) % self.size
+        if nxt == self.tail:
+            self.overflows += 1
+            return
+        self._button[head] = button
+        self._edge[head]   = edge
+        self._at[head]     = ticks_ms()
+        self.head          = nxt  # Publish only once the slot has been filled in
+        if edge == PRESSED:
+            self.presses  += 1
+
+    def _gesture(self, button, edge, at):
+        """ Update a button's state with a queued edge
+
+        Returns:
+            int: The gesture this edge completes, or NONE
+        """
+        if edge == self._state[button] or ticks_diff(at, self._changed[button]) < self.debounce_ms:
+            self.bounces += 1
+            return NONE
+        self._state[button]   = edge
+        self._changed[button] = at
+
+        if edge == PRESSED:
+            self._down_at[button] = at
+            if self._pending[button] and ticks_diff(at, self._released_at[button]) > self.double_ms:
+                self._pending[button] = 0   # Too late to be a double press, so the earlier press was a short one
+                return SHORT
+            return NONE
+
+        if ticks_diff(at, self._down_at[button]) >= self.long_ms:
+            if self._pending[button]:
+                self._pending[button] = LATE_LONG
+                return SHORT                        # The earlier press wasn't the start of a double press after all
+            return LONG
+        if self._pending[button]:
+            self._pending[button] = 0
+            return DOUBLE
+        self._pending[button]     = 1
+        self._released_at[button] = at
+        return NONE
+
+    def pop(self):
+        """ Remove the next gesture from the queue
+
+        Returns:
+            int: SHORT, LONG or DOUBLE, or NONE if nothing has happened. The button is left in self.button
+        """
+        for button in range(len(self._pending)):
+            if self._pending[button] == LATE_LONG:
+                self._pending[button] = 0
+                self.button = button
+                return LONG
+
+        while self.tail != self.head:
+            tail    = self.tail
+            button  = self._button[tail]
+            gesture = self._gesture(button, self._edge[tail], self._at[tail])
+            self.tail = (tail + 1) % self.size  # Release the slot only once it has been used
+            if gesture != NONE:
+                self.button = button
+                return gesture
+
+        # A short press only becomes definite once it's too late for it to be the first of a double press
+        now = ticks_ms()
+        for button in range(len(self._pending)):
+            if self._pending[button] == 1 and ticks_diff(now, self._released_at[button]) > self.double_ms:
+                self._pending[button] = 0
+                self.button = button
+                return SHORT
+        return NONE
@@ -0,0 +1,126 @@
+""" What both firmwares (main_new and main_async) share: bringing up the hardware the hands depend on, saving the
+hand state, the LED, the housekeeping done once a minute and the shutdown. Each firmware builds a ClockCore and
+schedules its own loop (or tasks) around it.
+"""
+
+from machine import Pin
+
+import i2cbus
+import ds3231
+import eeprom
+import dgclock
+import todcounter
+import instrument
+import settings
+import steplog
+
+class ClockCore:
+    def __init__(self, config_filename = "clock.json"):
+        """ Bring up everything needed to move the hands, and plan the catch-up for the time the power was off
+
+        Args:
+            config_filename (string): The clock configuration file
+        """
+        # LED output - turn it on whilst we're booting...
+        self.led      = Pin(2, Pin.OUT)
+        self.led.value(1)
+
+        # Initialise the DS3231 battery-backed RTC - the bus is shared with its EEPROM and the other threads, and
+        # drops back to 100kHz by itself if 400kHz proves unreliable
+        self.i2c      = i2cbus.I2CBus(0, scl=22, sda=21, freq=400000)
+        self.ds       = ds3231.DS3231(self.i2c)
+        print("DS3231 time   : {}".format(self.ds.rtc_tm))
+
+        # The hands are saved in Alarm 1 after every step, and the hand state is journalled in the module's EEPROM
+        # now and again - the journal's hands are only used if the DS3231 lost Alarm 1 when its battery went flat.
+        # Some DS3231 modules have no EEPROM, and then Alarm 1 is all there is.
+        try:
+            self.hand_log = eeprom.HandJournal(eeprom.EEPROM(self.i2c))
+            last          = self.hand_log.recover()
+        except (RuntimeError, OSError) as e:
+            print("No hand journal: {}".format(e))
+            self.hand_log = None
+            last          = None
+        hands         = eeprom.recovered_hands(self.ds, last)
+        print("Hands position: {} {}".format(hands, last))
+
+        # Initialise the mechanical clock at the last known position
+        self.clock    = dgclock.DGClock(config_filename, hands)
+        if last is not None:
+            self.clock.pc.polarity   = last[1]
+            self.clock.pc.whitephase = last[2]
+        config        = self.clock.pc.config
+
+        # Section timings are only recorded if asked for - use instrument.report() at the REPL to see them
+        instrument.enable(config.get("Profile", False))
+
+        # Every step is recorded in the binary step log if asked for, instead of printing a summary each minute
+        if config.get("StepLog", False):
+            steplog.start("steps.bin")
+
+        # Keep track of the local time without re-reading and converting the DS3231 every time around the loop
+        self.tod      = todcounter.TimeOfDay(self.ds, 60, config.get("SQW"))
+        if steplog.log is not None:
+            steplog.log.tod = self.tod
+
+        # The hands were saved as the power went, so the time since is how far they are behind - plan the catch-up now
+        if last is not None:
+            print("Power off for : {}s".format(self.tod.utc - last[3]))
+        self.clock.plan(self.tod.secs)
+
+        # If the supply is sensed the hand state is only saved as the power fails, not after every step
+        self.supply   = None
+        if config.get("PowerFail") is not None:
+            import powerfail
+            self.supply = powerfail.PowerFail(self.save_hands, config["PowerFail"], config.get("PowerLevel"))
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r})".format(self.__class__.__name__, self.clock)
+
+    def save_hands(self, force = True):
+        """ Save the hands to Alarm 1, and the hand state to the EEPROM journal (if there is one) if a record is due
+
+        Args:
+            force (bool): Write a journal record now
+        """
+        clock          = self.clock
+        self.ds.alarm1 = clock.hands
+        if self.hand_log is not None:
+            self.hand_log.save(clock.hands, clock.pc.polarity, clock.pc.whitephase, self.tod.utc, force)
+
+    def led_state(self):
+        """ Show the clock mode on the LED
+        """
+        clock = self.clock
+        if clock.mode == "Run" and self.tod.tm[3] == 22 and self.tod.tm[4] == 0:
+            self.led.value(1)                   # Run mode  - on at 22:00:00 until 22:01:00
+        elif clock.mode == "Wait":
+            self.led.value(1)                   # Wait mode - on
+        elif clock.mode == "Fast" and clock.hands % 2 == 0:
+            self.led.value(1)                   # Fast mode - on for even seconds
+        else:
+            self.led.value(0)                   # Otherwise off
+
+    def minutely(self):
+        """ Once a minute, on the tick at half past - pick up settings files changed behind our back, and note the
+        temperature for the step log
+        """
+        settings.check()
+        if steplog.log is not None:
+            steplog.log.temp = int(self.ds.temp * 4)
+
+    def shutdown(self, ui = None):
+        """ Save where the hands are and what's in the step log, and try to relinquish the I2C bus and the display
+
+        Args:
+            ui (DGUI): The user interface, if it was started
+        """
+        self.save_hands()
+        if steplog.log is not None:
+            steplog.log.flush()
+        print("Hands left at : {}".format(self.clock.hands_tm))
+        self.i2c.deinit()
+        if ui is not None:
+            ui.tft.deinit()
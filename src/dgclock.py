@@ -3,17 +3,22 @@ from machine import Pin
 
 import pulseclock
 import settings
+import steplog
 
 class DGClock:
-    def __init__(self, config_filename, hands):
+    __slots__ = ('pc', '_hands', 'mode')
+
+    def __init__(self, config_filename, hands, clock_settings = None):
         """ Constructor
 
         Args:
             config_filename (string): Name of the file to read
             hands           (int)   : The current hand position as seconds from 12:00:00
+            clock_settings  (dict)  : Use these settings rather than reading config_filename
         """        
         # Read the config file describing the pulse clock setup
-        clock_settings = settings.load_settings(config_filename)
+        if clock_settings is None:
+            clock_settings = settings.load_settings(config_filename)
 
         # Initialise the actual pulse clock
         self.pc = pulseclock.PulseClock(clock_settings, hands % 60)
@@ -22,6 +27,8 @@ class DGClock:
         #print("Initialising hands to {}".format(hands))
         self.hands = hands
         self.mode  = "Wait"
+        if steplog.log is not None: # The pulse PulseClock made to align the mechanism is logged with these hands
+            steplog.log.stepped(self.pc.channel, self.hands)
 
 
     def __repr__(self):
@@ -36,6 +43,8 @@ class DGClock:
 
     @property
     def hands_tm(self):
+        # A new tuple every time, so callers can keep it without it changing under them - but it allocates, so
+        # read hands instead where that matters
         value = (0,0,0, (self._hands // 3600) % 24, (self._hands // 60) % 60, self._hands % 60, 0, 0) # TM structure YMDHMS00
         return value
 
@@ -53,7 +62,15 @@ class DGClock:
         self.pc.sec_pos    = self.hands % 60
         self.pc.edgecount  = 0
 
-    def move(self, wanted_time):
+    def plan(self, wanted_time):
+        """ Decide how the hands need to move to show the given time, and update the mode - but don't move them
+
+        Args:
+            wanted_time (int): The time the clock should be displaying, in seconds
+
+        Returns:
+            string: None if no step is needed, "S" for a normal step or "F" for a fast step
+        """
         wanted_time %= 43200 # Only care about the 12-hour portion of the time
 
         diff = (wanted_time - self._hands) % 43200
@@ -63,19 +80,46 @@ class DGClock:
         if diff == 0:                                 # Hands are correct
             self.mode = "Run"
         elif diff == 1:                               # Just need a single step
-            self.mode   = "Run"
-            self.pc.step()
-            self.hands += 1
+            self.mode = "Run"
+            return "S"
         elif diff > 43140:                            # Small backward error - don't set hand to 12
             self.mode = "Wait"
         elif diff > 36000 and self._hands % 60 == 0:  # >10hr difference and second hand on 12 - just wait!
             self.mode = "Wait"
         else:                                         # Need to move fast to catch up
-            self.mode   = "Fast"
-            self.pc.faststep()
+            self.mode = "Fast"
+            return "F"
+
+        return None
+
+    def stepped(self, step):
+        """ Update the hand position once the step chosen by plan() has been made
+
+        Args:
+            step (string): The value returned by plan()
+        """
+        if step is not None:
             self.hands += 1
 
         # Check the second hand position at the bottom of the minute to avoid fence-post errors
         if (self.hands % 60) == 30 and self.pc.read_secondhand() != 30:
             print("Second hand adjusted from {} to {}".format(self.hands % 60, self.pc.read_secondhand()))
-            self.hands = (self.hands // 60) * 60 + self.pc.read_secondhand()
\ No newline at end of file
+            self.hands = (self.hands // 60) * 60 + self.pc.read_secondhand()
+
+        if steplog.log is not None: # Recorded with the outcome of the step, when the next one starts
+            steplog.log.stepped(self.pc.channel, self.hands)
+
+    def move(self, wanted_time):
+        """ Move the clock one step toward the given time
+
+        Args:
+            wanted_time (int): The time the clock should be displaying, in seconds
+        """
+        step = self.plan(wanted_time)
+
+        if step == "S":
+            self.pc.step()
+        elif step == "F":
+            self.pc.faststep()
+
+        self.stepped(step)
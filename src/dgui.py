@@ -2,21 +2,52 @@
 """
 
 from machine import Pin
-from utime   import mktime, sleep_ms
+from utime   import mktime, sleep_ms, ticks_us, ticks_diff
 import network
 import display
+
+import backlight
+import buttons
+import instrument
+import textcache
+import widgets
+
+_SECT_UPDATE = instrument.section("update_screen")
+
+BUTTON_TOP    = 0
+BUTTON_BOTTOM = 1
+
+ALIGNS        = ('Left', 'Centre', 'Right') # TextField alignments, in the order text_field() numbers them
+
 class DGUI:
-    def __init__(self, current_hands):
+    __slots__ = ('mode', 'timeout', 'clock_mode', 'redraw', 'updated', 'drawn_second', 'setmode',
+                 'now_tm', 'ntp_sync', 'current_h', 'current_m', 'current_s', 'buttons', 'tft', 'sta', 'fields', 'labels', 'drawn_mode', 'time_x',
+                 'metrics', 'strings', 'power', 'boot_ms', 'presses', 'woken')
+
+    def __init__(self, current_hands, dim_after = 60, off_after = 300):
+        """ Initialise the display and buttons
+
+        Args:
+            current_hands (tuple): TM structure of where the hands are pointing
+            dim_after     (int)  : Seconds without a button press before dimming the backlight, or 0 never to dim
+            off_after     (int)  : Seconds without a button press before turning the backlight off, or 0 never to
+        """
         # Fixed initialisation
         self.mode            = "Normal"
         self.timeout         = 0
         self.clock_mode      = "Starting"
         self.redraw          = True         # The screen changes completely - clear and re-write
+        self.updated         = False        # Something on the screen has changed
+        self.drawn_second    = -1           # The time of day second last drawn
+        self.drawn_mode      = None         # The screen layout currently drawn
+        self.fields          = {}           # Text fields on the current screen, by position
+        self.labels          = {}           # Clock mode -> its label, so it isn't rebuilt for every frame
         self.setmode         = 0
-        self.pressed_top     = False
-        self.pressed_bottom  = False
         self.now_tm          = (0,0,0,0,0,0,0,0)
         self.ntp_sync        = False
+        self.boot_ms         = None         # How long the clock took to start, once it has
+        self.presses         = 0            # buttons.presses when last looked at
+        self.woken           = False        # A press turned the screen back on - ignore the gesture it makes
 
         # Input parameter initialisation
         self.current_h       = current_hands[3]
@@ -24,10 +55,12 @@ class DGUI:
         self.current_s       = current_hands[5]
 
         # Functional initialisation
-        self.button1         = Pin( 0, Pin.IN, Pin.PULL_UP, handler = self._B1interrupt, trigger = Pin.IRQ_RISING) # Button released
-        self.button2         = Pin(35, Pin.IN,              handler = self._B2interrupt, trigger = Pin.IRQ_RISING) # Button released
+        self.buttons         = buttons.ButtonEvents()
+        self.buttons.add( 0, Pin.PULL_UP)   # BUTTON_TOP
+        self.buttons.add(35)                # BUTTON_BOTTOM - the board has its own pull-up
         self.tft             = display.TFT()
         self.sta             = network.WLAN(network.STA_IF)
+        self.strings         = textcache.FormatCache()
         
         # Configure the display
         tft = self.tft
@@ -35,7 +68,9 @@ class DGUI:
                  miso=17, backl_pin=4, backl_on=1, mosi=19, clk=18, cs=5, dc=16, 
                  splash = False)
         tft.setwin(40,52,320,240)
-        tft.font(tft.FONT_Comic) # It's big and easy to read...
+        self.power           = backlight.Backlight(4, dim_after, off_after)
+        self.metrics         = textcache.TextMetrics(tft, tft.FONT_Comic)
+        self.metrics.set_font(tft.FONT_Comic) # It's big and easy to read...
         tft.set_bg(0xffffff)     # Should be black
         tft.set_fg(0x000000)     # Should be white
         tft.clear()
@@ -43,16 +78,13 @@ class DGUI:
         self.text_alignYX("Initialising...", 60)
         self.text_alignYX("Please wait",    104)
 
-    def _B1interrupt(self, pin):
-        self.pressed_top = True
-
-    def _B2interrupt(self, pin):
-        self.pressed_bottom = True
+        # Times are left-aligned so that the unchanging digits don't move (and so don't need redrawing)
+        self.time_x          = 180 - self.metrics.text_width(" 00:00:00 ") // 2
 
     def __repr__(self_):
         """ Returns representation of the object
         """
-        return("{}({!r})".format(self.__class__.__name__, self.button1, self.button2, self.tft))
+        return("{}({!r})".format(self.__class__.__name__, self.buttons, self.tft))
 
     def text_alignYX(self, text, vpos, hpos = False, align = 'Centre', color = False):
         """ Display some text on the screen
@@ -70,9 +102,9 @@ class DGUI:
         if align == 'Left':
             offset = 0
         elif align == 'Right':
-            offset = self.tft.textWidth(text)
+            offset = self.metrics.text_width(text)
         else: # Assume centre/center
-            offset = self.tft.textWidth(text) // 2
+            offset = self.metrics.text_width(text) // 2
 
         if not hpos:
             if align == 'Left':
@@ -82,51 +114,84 @@ class DGUI:
             else: # Assume centre/center
                 hpos = 120
 
-        self.tft.text(hpos - offset, vpos - self.tft.fontSize()[1] //2, text, color)
+        self.tft.text(hpos - offset, vpos - self.metrics.font_height() //2, text, color)
 
     def handle_buttons(self):
+        """ Act on every button press since the last call
+
+        A long press on either button abandons whatever is being set and goes back to Normal mode, and a
+        double press counts as two presses.
+
+        Returns:
+            bool: True if the hands should be set to time_to_set
+        """
         if self.mode != "Normal" and self.timeout == self.now_tm[4]: 
             # No button push for a couple of minutes - automatically select Normal mode
             self.mode   = "Normal"
             self.redraw = True
             return False
 
-        if not self.pressed_top and not self.pressed_bottom:
-            return False # Nothing to do
+        # Light the screen as soon as a button goes down, not once the gesture is known
+        if self.buttons.presses != self.presses:
+            self.presses = self.buttons.presses
+            if self.power.wake():
+                self.woken = True
 
-        # When should the current setting mode time out?
-        self.timeout = (self.now_tm[4] + 3) % 60 
-        
-        # Make sure the screen is redrawn next time around
-        self.redraw  = True
-
-        # Simple state machine to got through Info -> Normal, Stop -> Adjust -> Normal
-        if self.pressed_top: # Back button
-            self.pressed_top = False # Acknowledge the button press
-            self.pressed_bottom = False # Both buttons at the same time not allowed
-            if self.mode == "Set":
-                self.mode = "Normal"
-            elif self.mode == "Stop":
-                self.mode = "Adjust"
-                self.setmode = 0 # Should be no change
-            elif self.mode == "Adjust":
-                self.mode = "Normal"
-                return True                 # Only executive exit - flag True to say read set_time and execute
-
-        # Simple state machine to go through Normal -> Info -> Stop -> Adjust -> Normal
-        if self.pressed_bottom:
-            self.pressed_bottom = False # Acknowledge the button press
-            if self.mode == "Normal":
-                self.mode = "Set"
-            elif self.mode == "Set":
-                self.mode = "Stop"
-            elif self.mode == "Stop":
+        while True:
+            gesture = self.buttons.pop()
+            if gesture == buttons.NONE:
+                return False # Nothing (more) to do
+
+            if self.woken:
+                self.woken = False
+                continue     # The press turned the screen back on - the user couldn't see what it would do
+
+            # When should the current setting mode time out?
+            self.timeout = (self.now_tm[4] + 3) % 60 
+
+            # Make sure the screen is redrawn next time around
+            self.redraw  = True
+
+            if gesture == buttons.LONG:
                 self.mode = "Normal"
-            elif self.mode == "Adjust":
-                self.setmode = (self.setmode + 1) % 14 # Modes are Current / HH:M5:00 / [1-12]:00:00
+                continue
+
+            presses = 2 if gesture == buttons.DOUBLE else 1
+            for _ in range(presses):
+                if self.buttons.button == BUTTON_TOP:
+                    if self.press_top():
+                        return True  # Leave any further presses queued until the hands have been set
+                else:
+                    self.press_bottom()
 
+    def press_top(self):
+        """ Simple state machine to got through Info -> Normal, Stop -> Adjust -> Normal
+
+        Returns:
+            bool: True if the hands should be set to time_to_set
+        """
+        if self.mode == "Set":
+            self.mode = "Normal"
+        elif self.mode == "Stop":
+            self.mode = "Adjust"
+            self.setmode = 0 # Should be no change
+        elif self.mode == "Adjust":
+            self.mode = "Normal"
+            return True                 # Only executive exit - flag True to say read set_time and execute
         return False
 
+    def press_bottom(self):
+        """ Simple state machine to go through Normal -> Info -> Stop -> Adjust -> Normal
+        """
+        if self.mode == "Normal":
+            self.mode = "Set"
+        elif self.mode == "Set":
+            self.mode = "Stop"
+        elif self.mode == "Stop":
+            self.mode = "Normal"
+        elif self.mode == "Adjust":
+            self.setmode = (self.setmode + 1) % 14 # Modes are Current / HH:M5:00 / [1-12]:00:00
+
     @property
     def time_to_set(self):
         return self.time_seq(self.setmode)
@@ -150,12 +215,31 @@ class DGUI:
     def time_seq_pr(self, index):
         tm = self.time_seq(index)
 
-        return "{:2d}:{:02d}:{:02d}".format(tm[3], tm[4], tm[5])
+        return self.strings.hms("adjust", "{:2d}:{:02d}:{:02d}", tm[3], tm[4], tm[5])
+
+    def text_field(self, text, vpos, hpos = False, align = 'Centre', color = False):
+        """ Display some text on the screen, only redrawing what has changed since the last time text was shown
+        at the same position
+
+        Args:
+            text  (string)    : The text to display
+            vpos  (int)       : The vertical position on the screen
+            hpos  (int)       : The horizontal position on the screen (defaults to edges/middle)
+            align (string)    : Left, Centre or Right
+            color (int)       : Colour code (0xffffff = black, 0x00ffff = red etc)
+        """
+        key = (vpos * 512 + (0 if hpos is False else hpos + 1)) * 4 + ALIGNS.index(align) # A small int, so finding the field doesn't allocate
+        if key not in self.fields:
+            self.fields[key] = widgets.TextField(self.tft, self.metrics, vpos, hpos, align)
+        self.fields[key].draw(text, color)
 
     def _doredraw(self):
-        """ Clear and redraw the screen right now
+        """ Redraw the screen right now - only clearing it if the layout has changed
         """
-        self.tft.clear()   
+        if self.drawn_mode != self.mode:
+            self.tft.clear()   
+            self.fields.clear()
+            self.drawn_mode = self.mode
         self._doupdate()
 
     def _doupdate(self):
@@ -182,25 +266,66 @@ class DGUI:
                 self.current_h = 12
             else:
                 self.current_h = value[3]
-            self.redraw = True
+            self.updated = True
                 
         if self.current_m != value[4]:
             self.current_m = value[4]
-            self.redraw = True
+            self.updated = True
 
         if self.current_s != value[5]:
             self.current_s = value[5]
             self.updated = True
 
+    def show(self, snapshot):
+        """ Take the clock state to draw from a snapshot
+
+        Args:
+            snapshot (tuple): (now_tm, hands_tm, clock_mode, ntp_sync)
+        """
+        (self.now_tm, self.hands_tm, self.clock_mode, self.ntp_sync) = snapshot
+
     def update_screen(self):
         """ Update the screen at any time, but don't repeatedly update the screen if nothing's changed.
         """
-        if self.redraw:
-            self._doredraw()
-        else:
-            self._doupdate()
+        if not self.redraw and not self.updated and self.drawn_second == self.now_tm[5]:
+            return # Nothing to do - and nothing allocated
+
+        self.drawn_second = self.now_tm[5]
+        self.updated      = False
+
+        with _SECT_UPDATE:
+            if self.redraw:
+                self._doredraw()
+            else:
+                self._doupdate()
+
+            self.redraw      = False
 
-        self.redraw      = False
+    def benchmark(self, frames = 60):
+        """ Time drawing the current screen with the seconds ticking, and print the cost per frame and how often
+        the text caches saved asking the display driver to measure something
+
+        Args:
+            frames (int): How many frames to draw
+        """
+        now     = list(self.now_tm)
+        calls   = self.metrics.driver_calls
+        total   = 0
+        longest = 0
+        for i in range(frames):
+            now[5]       = i % 60
+            self.now_tm  = now
+            self.updated = True
+            start  = ticks_us()
+            self.update_screen()
+            took   = ticks_diff(ticks_us(), start)
+            total += took
+            if took > longest:
+                longest = took
+
+        widths = self.metrics.widths[self.metrics.font]
+        print("{} frames: mean {}us, max {}us, {} driver measurements, width cache {} hits {} misses".format(
+              frames, total // frames, longest, self.metrics.driver_calls - calls, widths.hits, widths.misses))
 
     ###############################################################################
     ###############################################################################
@@ -219,56 +344,62 @@ class DGUI:
 
     def drawscreen_normal(self):
         # Title the display
-        self.text_alignYX("DG Clock", 8)
+        self.text_field("DG Clock", 8)
         
         # Show the current network config
         if not self.sta.active():
-            self.text_alignYX("WiFi not active",                     38, color = 0x0088ff)   # Amber
+            self.text_field("WiFi not active",                     38, color = 0x0088ff)   # Amber
         elif not self.sta.isconnected():
-            self.text_alignYX(" WiFi not connected ",                38, color = 0x00ffff)   # Red
+            self.text_field(" WiFi not connected ",                38, color = 0x00ffff)   # Red
         else:
-            self.text_alignYX(" {} ".format(self.sta.ifconfig()[0]), 38, color = 0xff00ff)   # Green
+            self.text_field(" {} ".format(self.sta.ifconfig()[0]), 38, color = 0xff00ff)   # Green
         
         # Tell the user whether the NTP sync is good or not
         if self.ntp_sync:
-            self.text_alignYX("NTP Sync OK",                         60, color = 0xff00ff)   # Green
+            self.text_field("NTP Sync OK",                         60, color = 0xff00ff)   # Green
         else:
-            self.text_alignYX("No NTP Sync",                          60, color = 0x0088ff)   # Amber
+            self.text_field("No NTP Sync",                          60, color = 0x0088ff)   # Amber
+
+        now_str  = self.strings.hms("now", " {:02d}:{:02d}:{:02d} ", self.now_tm[3], self.now_tm[4], self.now_tm[5])
+        hand_str = self.strings.hms("hands", " {:d}:{:02d}:{:02d} ", self.current_h, self.current_m, self.current_s)
 
-        now_str  = " {:02.0f}:{:02.0f}:{:02.0f} ".format(self.now_tm[3], self.now_tm[4], self.now_tm[5])
-        hand_str = " {:.0f}:{:02.0f}:{:02.0f} ".format(self.current_h, self.current_m, self.current_s)
+        label = self.labels.get(self.clock_mode)
+        if label is None:
+            label = self.labels[self.clock_mode] = " {}:".format(self.clock_mode)
 
-        self.text_alignYX("Time:",                  82,  90, 'Right')
-        self.text_alignYX(now_str,                  82, 180, 'Centre')
-        self.text_alignYX(" "+self.clock_mode+":", 104,  90, 'Right')
-        self.text_alignYX(hand_str,                104, 180, 'Centre')
+        self.text_field("Time:",                  82,  90, 'Right')
+        self.text_field(now_str,                  82, self.time_x, 'Left')
+        self.text_field(label,                   104,  90, 'Right')
+        self.text_field(hand_str,                104, self.time_x, 'Left')
 
-        self.text_alignYX(self.mode,    126, align = 'Right', color = 0x0088ff)   # UI mode
-        self.text_alignYX("<Setting",   126, align = 'Left',  color = 0xff8800)   # Button label
+        self.text_field(self.mode,    126, align = 'Right', color = 0x0088ff)   # UI mode
+        self.text_field("<Setting",   126, align = 'Left',  color = 0xff8800)   # Button label
 
     def drawscreen_setting(self):
-        self.text_alignYX("<Back",     8, align = 'Left',  color = 0xff8800)
+        self.text_field("<Back",     8, align = 'Left',  color = 0xff8800)
+        if self.boot_ms is not None:
+            self.text_field("Boot {}ms".format(self.boot_ms), 8, align = 'Right', color = 0x7f7f7f)
 
-        hand_str = " {:.0f}:{:02.0f}:{:02.0f} ".format(self.current_h, self.current_m, self.current_s)
-        self.text_alignYX("Press STOP if the", 38)
-        self.text_alignYX("hands need to",     60)
-        self.text_alignYX("be adjusted",       82)
-        self.text_alignYX(hand_str,  104)
+        hand_str = self.strings.hms("hands", " {:d}:{:02d}:{:02d} ", self.current_h, self.current_m, self.current_s)
+        self.text_field("Press STOP if the", 38)
+        self.text_field("hands need to",     60)
+        self.text_field("be adjusted",       82)
+        self.text_field(hand_str,  104)
 
-        self.text_alignYX("<STOP",   126, align = 'Left',  color = 0xff8800)
-        self.text_alignYX(self.mode, 126, align = 'Right', color = 0x0088ff)
+        self.text_field("<STOP",   126, align = 'Left',  color = 0xff8800)
+        self.text_field(self.mode, 126, align = 'Right', color = 0x0088ff)
 
     def drawscreen_stop(self):
-        self.text_alignYX("<Other",    8, align = 'Left',  color = 0xff8800)
+        self.text_field("<Other",    8, align = 'Left',  color = 0xff8800)
 
-        hand_str = " {:.0f}:{:02.0f}:{:02.0f} ".format(self.current_h, self.current_m, self.current_s)
-        self.text_alignYX("Hands STOPPED", 38, color = 0x0088ff)
-        self.text_alignYX("You can adjust them",   60)
-        self.text_alignYX("to show "+hand_str, 82)
-        self.text_alignYX("or press Other", 104, color = 0x00ffff)
+        hand_str = self.strings.hms("hands", " {:d}:{:02d}:{:02d} ", self.current_h, self.current_m, self.current_s)
+        self.text_field("Hands STOPPED", 38, color = 0x0088ff)
+        self.text_field("You can adjust them",   60)
+        self.text_field("to show "+hand_str, 82)
+        self.text_field("or press Other", 104, color = 0x00ffff)
 
-        self.text_alignYX("<Back",    126, align = 'Left',  color = 0xff8800)
-        self.text_alignYX(self.mode,  126, align = 'Right', color = 0x0088ff)
+        self.text_field("<Back",    126, align = 'Left',  color = 0xff8800)
+        self.text_field(self.mode,  126, align = 'Right', color = 0x0088ff)
 
     def drawscreen_adjust(self):
 
@@ -276,18 +407,18 @@ class DGUI:
 
         if self.setmode == 0:
             middle_colour = 0xff00ff # Make the supposedly correct hand position green
-            self.text_alignYX("Leave hands as-is", 38,                  color = 0xff00ff)
-            self.text_alignYX("<Abort  ",           8, align = 'Left',  color = 0xff00ff)
+            self.text_field("Leave hands as-is", 38,                  color = 0xff00ff)
+            self.text_field("<Abort  ",           8, align = 'Left',  color = 0xff00ff)
         else:
-            self.text_alignYX("Set hands to...",   38,                  color = 0x00ffff)
-            self.text_alignYX("<Restart",           8, align = 'Left',  color = 0x00ffff)
+            self.text_field("Set hands to...",   38,                  color = 0x00ffff)
+            self.text_field("<Restart",           8, align = 'Left',  color = 0x00ffff)
 
-        self.text_alignYX(self.mode,  126, align = 'Right', color = 0x0088ff)
-        self.text_alignYX("<Change",  126, align = 'Left',  color = 0xff8800)
+        self.text_field(self.mode,  126, align = 'Right', color = 0x0088ff)
+        self.text_field("<Change",  126, align = 'Left',  color = 0xff8800)
 
-        self.text_alignYX("    {}    ".format(self.time_seq_pr(self.setmode - 1)),  60, color = 0x7f7f7f)
-        self.text_alignYX("--> {} <--".format(self.time_seq_pr(self.setmode    )),  82, color = middle_colour)
-        self.text_alignYX("    {}    ".format(self.time_seq_pr(self.setmode + 1)), 104, color = 0x7f7f7f)
+        self.text_field("    {}    ".format(self.time_seq_pr(self.setmode - 1)),  60, color = 0x7f7f7f)
+        self.text_field("--> {} <--".format(self.time_seq_pr(self.setmode    )),  82, color = middle_colour)
+        self.text_field("    {}    ".format(self.time_seq_pr(self.setmode + 1)), 104, color = 0x7f7f7f)
 
 
 
@@ -8,8 +8,12 @@
 import utime
 import machine
 import sys
+import instrument
 DS3231_I2C_ADDR = 104
 
+_SECT_READ  = instrument.section("ds3231 read")
+_SECT_WRITE = instrument.section("ds3231 write")
+
 class DS3231:
     """ Interface to a DS3231 connected via the I2C bus
     Includes support for reading and writing the RTC, Alarm1, and Alarm2, and configuring the alarm interrupt
@@ -19,9 +23,19 @@ class DS3231:
 
     May throw a "DS3231 not found" runtime error if no DS3231 is present when created.
 
+    The bus may be a machine.I2C, or an i2cbus.I2CBus if it is shared with other threads.
+
     """
     def __init__(self, i2c):
         self.ds3231 = i2c
+
+        # Preallocated register buffers so that routine reads and writes don't allocate memory
+        self._buf_rtc    = bytearray(7)
+        self._buf_alarm1 = bytearray(4)
+        self._buf_alarm2 = bytearray(3)
+        self._buf_byte   = bytearray(1)
+        self._buf_temp   = bytearray(2)
+
         if DS3231_I2C_ADDR not in self.ds3231.scan():
             raise RuntimeError("DS3231 not found on I2C bus at %d" % DS3231_I2C_ADDR)
 
@@ -30,6 +44,28 @@ class DS3231:
         '''Returns representation of the object'''
         return("{}({!r})".format(self.__class__.__name__, self.ds3231))
 
+    # -------------------------------------------------------------------------------------
+    def _read(self, register, buffer):
+        """ Read consecutive DS3231 registers
+
+        Args:
+            register (int)      : The first register to read
+            buffer   (bytearray): Filled with the register contents - its length sets how many are read
+        """
+        with _SECT_READ:
+            self.ds3231.readfrom_mem_into(DS3231_I2C_ADDR, register, buffer)
+
+    # -------------------------------------------------------------------------------------
+    def _write(self, register, buffer):
+        """ Write consecutive DS3231 registers
+
+        Args:
+            register (int)      : The first register to write
+            buffer   (bytearray): The values to write
+        """
+        with _SECT_WRITE:
+            self.ds3231.writeto_mem(DS3231_I2C_ADDR, register, buffer)
+
     # -------------------------------------------------------------------------------------
     @staticmethod
     def bcd2dec(bcd):
@@ -55,11 +91,11 @@ class DS3231:
             int: The BCD-equivalent of the original value        
         """
         try:
-            tens, units = divmod(int(dec), 10)
+            dec = int(dec)
         except Exception as e:
             sys.print_exception(e)
             print("While converting decimal = {}".format(dec))
-        return (tens << 4) + units
+        return ((dec // 10) << 4) + dec % 10 # Avoids the tuple divmod would allocate
 
     # -------------------------------------------------------------------------------------
     @staticmethod
@@ -222,25 +258,26 @@ class DS3231:
 
     # -------------------------------------------------------------------------------------
     @staticmethod
-    def tm_to_dsal1(tm):
+    def tm_to_dsal1(tm, ds_format = None):
         """ Convert tm format tuple into DS3231 Alarm1 register format (HH:MM:SS and day/month or date)
         Args:
-            tm (tuple): The alarm time in TM format - can specify day of week or date, not both. Will default to date if both are set.
+            tm        (tuple)    : The alarm time in TM format - can specify day of week or date, not both. Will default to date if both are set.
+            ds_format (bytearray): Optional 4-byte buffer to fill in rather than allocating a new one
         Returns:
             bytearray in DS alarm1 format
         """        
+        if ds_format is None:
+            ds_format = bytearray(4)
+
+        ds_format[0] = DS3231.dec2bcd(tm[5])                           # Seconds
+        ds_format[1] = DS3231.dec2bcd(tm[4])                           # Minutes
+        ds_format[2] = DS3231.dec2bcd(tm[3])                           # Hours
         if tm[2] == 0:
             # Day of week mode since date is outside the valid range (1-31)
-            ds_format = bytearray((DS3231.dec2bcd(tm[5]),               # Seconds
-                                   DS3231.dec2bcd(tm[4]),               # Minutes
-                                   DS3231.dec2bcd(tm[3]),               # Hours
-                                   DS3231.dec2bcd(tm[6]) + 0x40))       # Day of week and doy-of-week mode
+            ds_format[3] = DS3231.dec2bcd(tm[6]) + 0x40                # Day of week and doy-of-week mode
         else:
             # Date mode since date is not zero
-            ds_format = bytearray((DS3231.dec2bcd(tm[5]),               # Seconds
-                                   DS3231.dec2bcd(tm[4]),               # Minutes
-                                   DS3231.dec2bcd(tm[3]),               # Hours
-                                   DS3231.dec2bcd(tm[2])))              # Date
+            ds_format[3] = DS3231.dec2bcd(tm[2])                       # Date
         return ds_format
 
     # -------------------------------------------------------------------------------------
@@ -330,28 +367,100 @@ class DS3231:
 
     # -------------------------------------------------------------------------------------
     def read_ds3231_rtc(self):
-        """ Read the RTC as a DS3231 formatted bytearray for addresses 0-6 inclusive
+        """ Read the RTC as a DS3231 formatted bytearray for addresses 0-6 inclusive.
+        The buffer is reused by the next read.
         """    
-        buffer = bytearray(7)
-        self.ds3231.readfrom_mem_into(DS3231_I2C_ADDR, 0, buffer)
+        buffer = self._buf_rtc
+        self._read(0, buffer)
         return buffer
 
     # -------------------------------------------------------------------------------------
     def read_ds3231_alarm1(self):
-        """ Read Alarm1 as a DS3231 formatted bytearray for addresses 7-10 inclusive, including all Alarm Mask bits but NOT the Alarm Interupt Enable bit
+        """ Read Alarm1 as a DS3231 formatted bytearray for addresses 7-10 inclusive, including all Alarm Mask bits but NOT the Alarm Interupt Enable bit.
+        The buffer is reused by the next read.
         """    
-        buffer = bytearray(4)
-        self.ds3231.readfrom_mem_into(DS3231_I2C_ADDR, 7, buffer)
+        buffer = self._buf_alarm1
+        self._read(7, buffer)
         return buffer
 
     # -------------------------------------------------------------------------------------
     def read_ds3231_alarm2(self):
-        """ Read Alarm2 as formatted bytearray for addresses 11-13 inclusive, including all Alarm Mask bits but NOT the Alarm Interupt Enable bit
+        """ Read Alarm2 as formatted bytearray for addresses 11-13 inclusive, including all Alarm Mask bits but NOT the Alarm Interupt Enable bit.
+        The buffer is reused by the next read.
         """    
-        buffer = bytearray(3)
-        self.ds3231.readfrom_mem_into(DS3231_I2C_ADDR, 11, buffer)
+        buffer = self._buf_alarm2
+        self._read(11, buffer)
         return buffer
 
+    # -------------------------------------------------------------------------------------
+    def read_seconds(self):
+        """ Read just the RTC seconds register - much cheaper than reading and converting the whole time
+
+        Returns:
+            int: Seconds in the range 0-59
+        """
+        buffer = self._buf_byte
+        self._read(0, buffer)
+        return DS3231.bcd2dec(buffer[0] & 0x7f)
+
+    # -------------------------------------------------------------------------------------
+    @property
+    def control(self):
+        """ Read the DS3231 control register
+
+        Returns:
+            int: EOSC, BBSQW, CONV, RS2, RS1, INTCN, A2IE, A1IE from bit 7 to bit 0
+        """
+        buffer = self._buf_byte
+        self._read(0x0e, buffer)
+        return buffer[0]
+
+    # -------------------------------------------------------------------------------------
+    @control.setter
+    def control(self, value):
+        """ Set the DS3231 control register
+
+        Args:
+            value (int): EOSC, BBSQW, CONV, RS2, RS1, INTCN, A2IE, A1IE from bit 7 to bit 0
+        """
+        buffer = self._buf_byte
+        buffer[0] = value
+        self._write(0x0e, buffer)
+
+    # -------------------------------------------------------------------------------------
+    @property
+    def status(self):
+        """ Read the DS3231 status register
+
+        Returns:
+            int: OSF, 0, 0, 0, EN32kHz, BSY, A2F, A1F from bit 7 to bit 0 - OSF is set if the oscillator has
+                 stopped (e.g. the battery went flat with the power off), and stays set until cleared
+        """
+        buffer = self._buf_byte
+        self._read(0x0f, buffer)
+        return buffer[0]
+
+    # -------------------------------------------------------------------------------------
+    @status.setter
+    def status(self, value):
+        """ Set the DS3231 status register
+
+        Args:
+            value (int): OSF, 0, 0, 0, EN32kHz, BSY, A2F, A1F from bit 7 to bit 0
+        """
+        buffer = self._buf_byte
+        buffer[0] = value
+        self._write(0x0f, buffer)
+
+    # -------------------------------------------------------------------------------------
+    def sqw_1hz(self):
+        """ Configure the INT/SQW pin as a 1Hz squarewave. The falling edge happens as the seconds register changes.
+
+        Notes:
+            This disables the alarm interrupt output since the pin can only do one or the other.
+        """
+        self.control = self.control & 0xe0 # Clear RS2, RS1 (1Hz) and INTCN (squarewave), and both alarm interrupt enables
+
     # -------------------------------------------------------------------------------------
     @property
     def rtc_tod_tm(self):
@@ -404,7 +513,7 @@ class DS3231:
         Args:
             time_to_set (tuple): Time to set as a tm tuple
         """
-        self.ds3231.writeto_mem(DS3231_I2C_ADDR, 0, DS3231.tm_to_dsrtc(time_to_set))
+        self._write(0, DS3231.tm_to_dsrtc(time_to_set))
 
     # -------------------------------------------------------------------------------------
     @property
@@ -458,7 +567,7 @@ class DS3231:
             The alarm interrupt enable will not be altered.        
         """
         #print("AL1 set to    : {}".format(time_to_set))
-        self.ds3231.writeto_mem(DS3231_I2C_ADDR, 7, DS3231.tm_to_dsal1(time_to_set))
+        self._write(7, DS3231.tm_to_dsal1(time_to_set, self._buf_alarm1))
     # -------------------------------------------------------------------------------------
     @property
     def alarm2(self):
@@ -510,7 +619,7 @@ class DS3231:
             The alarm interrupt will be set to "precise match" - i.e. Day/Date, HH:MM:SS must match exactly.
             The alarm interrupt enable will not be altered.        
         """
-        self.ds3231.writeto_mem(DS3231_I2C_ADDR, 11, DS3231.tm_to_dsal2(time_to_set))
+        self._write(11, DS3231.tm_to_dsal2(time_to_set))
 
     # -------------------------------------------------------------------------------------
     @property
@@ -521,8 +630,8 @@ class DS3231:
             integer: Current calibration factor in the range -128 to +127
             
         """
-        buffer = bytearray(1)
-        self.ds3231.readfrom_mem_into(DS3231_I2C_ADDR, 0x10, buffer)
+        buffer = self._buf_byte
+        self._read(0x10, buffer)
 
         # Handle conversion from unsigned byte to integer
         if buffer[0] <= 127:
@@ -544,9 +653,9 @@ class DS3231:
             The alarm interrupt will be set to "precise match" - i.e. Day/Date, HH:MM:SS must match exactly.
             The alarm interrupt enable will not be altered.        
         """
-        buffer = bytearray(1)
+        buffer = self._buf_byte
         buffer[0] = cal_to_set # Automatically handles negative numbers as two's complement
-        self.ds3231.writeto_mem(DS3231_I2C_ADDR, 0x10, buffer)
+        self._write(0x10, buffer)
 
     # -------------------------------------------------------------------------------------
     @property
@@ -557,8 +666,8 @@ class DS3231:
             number: Current temperature in Celsius, with quarter-degree resolution
             
         """
-        buffer = bytearray(2)
-        self.ds3231.readfrom_mem_into(DS3231_I2C_ADDR, 0x11, buffer)
+        buffer = self._buf_temp
+        self._read(0x11, buffer)
 
         temp = (buffer[0] & 0x7f) + ((buffer[1] >> 6) / 4.0)
         if buffer[0] & 0x80:
@@ -0,0 +1,334 @@
+""" 24C32 EEPROM on the DS3231 module, and a wear-levelled journal of the hand position kept in it
+
+The 24C32 holds 4096 bytes in 32-byte pages. A write of up to a page costs one internal write cycle (up to 10ms,
+during which the chip ignores the bus) and one cycle of wear on that page, however many bytes it changes - so
+writes are batched into whole pages where possible. Each cell is good for about a million write cycles.
+
+The hand journal stores fixed 16-byte records, two to a page, in a ring. Each record has a sequence number, and
+record N always goes in slot N % slots, so every slot is written in turn and the newest record is found at boot
+by a binary search for where the sequence numbers stop following on from slot 0 - a handful of 16-byte reads
+rather than the whole chip. Records are checksummed, so one torn by a power cut is ignored in favour of the one
+before it. Unlike Alarm 1 the EEPROM keeps its contents if the DS3231 battery goes flat.
+
+The hands move every second, and a record a second would wear each page out in a few years, so the position
+after every step goes to DS3231 Alarm 1 (battery-backed RAM, no wear limit) and the journal is only written when
+the polarity or white phase changes, when a save is forced (hands adjusted, power failing, shutting down), or at
+most every JOURNAL_EVERY seconds otherwise. Those periodic records are held in RAM until every record of their
+page is ready, and the page is written at once - a forced save or a state change writes whatever is held
+straight away. At one periodic record a minute each page is written once every PAGE // RECORD_SIZE laps of the
+ring, and lasts centuries. The journal's hands are only used if the DS3231 lost Alarm 1 along with its time (its
+oscillator stopped), so a held record lost in a power cut costs at most a page's worth of periodic records.
+
+Usage:
+    chip  = eeprom.EEPROM(i2c)
+    hands = eeprom.HandJournal(chip)
+    last  = hands.recover()          # (hands, polarity, white phase, time) or None
+    ds.alarm1 = clock.hands          # Every step
+    hands.save(clock.hands, clock.pc.polarity, clock.pc.whitephase, tod.utc)         # Written if one is due
+    hands.save(clock.hands, clock.pc.polarity, clock.pc.whitephase, tod.utc, True)   # Written now
+"""
+
+import ustruct
+from utime import sleep_ms, ticks_ms, ticks_diff
+
+import instrument
+
+EEPROM_I2C_ADDR = 0x57  # The DS3231 module's 24C32, with A0-A2 pulled high
+SIZE            = 4096
+PAGE            = 32
+WRITE_MS        = 10    # Worst case internal write cycle
+ENDURANCE       = 1000000
+JOURNAL_EVERY   = 60    # Most seconds between records whilst only the hands are moving
+
+RECORD          = "<BBHIIBxH" # Magic, polarity, hands, sequence, time, white phase, checksum
+RECORD_SIZE     = 16
+MAGIC           = 0x5a
+
+OSF             = 0x80  # DS3231 status register: the oscillator stopped, so Alarm 1 can't be trusted
+
+_SECT_READ  = instrument.section("eeprom read")
+_SECT_WRITE = instrument.section("eeprom write")
+
+def fletcher16(data, count):
+    """ Fletcher-16 checksum - enough to spot a torn or blank record without pulling in a CRC
+
+    Args:
+        data  (bytearray): What to check
+        count (int)      : How many bytes of it to check
+
+    Returns:
+        int: 16-bit checksum
+    """
+    a = 0
+    b = 0
+    for i in range(count):
+        a = (a + data[i]) % 255
+        b = (b + a) % 255
+    return (b << 8) | a
+
+def recovered_hands(ds, last):
+    """ Where the hands were left - Alarm 1, unless the DS3231 lost it when its oscillator stopped, in which case
+    the journal's hands are copied back into Alarm 1
+
+    Args:
+        ds   (DS3231): The RTC
+        last (tuple) : What HandJournal.recover() returned
+
+    Returns:
+        int: Hand position as seconds from 12:00:00
+    """
+    status = ds.status
+    if status & OSF:
+        if last is not None:
+            print("DS3231 oscillator stopped - hands from the journal")
+            ds.alarm1 = last[0]
+        ds.status = status & ~OSF
+    return ds.alarm1
+
+class EEPROM:
+    __slots__ = ('i2c', 'addr', 'size', 'page', 'write_ms', '_wide', '_written_at', 'page_writes', 'bytes_written')
+
+    def __init__(self, i2c, addr = EEPROM_I2C_ADDR, size = SIZE, page = PAGE, write_ms = WRITE_MS):
+        """ Initialise the EEPROM
+
+        Args:
+            i2c      (I2C): The bus it is on
+            addr     (int): Its I2C address
+            size     (int): Capacity in bytes
+            page     (int): Page size in bytes - a write must not cross a page boundary
+            write_ms (int): How long the chip is busy after each write
+        """
+        self.i2c           = i2c
+        self.addr          = addr
+        self.size          = size
+        self.page          = page
+        self.write_ms      = write_ms
+        self._wide         = None       # Keyword giving a two byte memory address - it differs between ports
+        self._written_at   = None       # ticks_ms of the last write, until its write cycle must be over
+        self.page_writes   = 0
+        self.bytes_written = 0
+
+        if addr not in i2c.scan():
+            raise RuntimeError("EEPROM not found on I2C bus at %d" % addr)
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r}, {!r}, {!r}, {!r})".format(self.__class__.__name__, self.i2c, self.addr, self.size, self.page)
+
+    def _ready(self):
+        """ Wait for the last write cycle to finish - usually it already has
+        """
+        if self._written_at is not None:
+            left = self.write_ms - ticks_diff(ticks_ms(), self._written_at)
+            if left > 0:
+                sleep_ms(left)
+            self._written_at = None
+
+    def _mem(self, method, memaddr, buffer):
+        """ Call an I2C memory read or write with a two byte memory address
+
+        Args:
+            method   (function) : i2c.readfrom_mem_into or i2c.writeto_mem
+            memaddr  (int)      : The EEPROM address
+            buffer   (bytearray): What to read into or write
+        """
+        if self._wide is None:
+            try:
+                method(self.addr, memaddr, buffer, addrsize = 16) # Mainline MicroPython
+                self._wide = "addrsize"
+                return
+            except TypeError:
+                self._wide = "adrlen"
+        if self._wide == "addrsize":
+            method(self.addr, memaddr, buffer, addrsize = 16)
+        else:
+            method(self.addr, memaddr, buffer, adrlen = 2)   # Loboris port
+
+    def read(self, memaddr, buffer):
+        """ Read consecutive bytes
+
+        Args:
+            memaddr (int)      : The first address to read
+            buffer  (bytearray): Filled with the contents - its length sets how many are read
+        """
+        self._ready()
+        with _SECT_READ:
+            self._mem(self.i2c.readfrom_mem_into, memaddr, buffer)
+
+    def write(self, memaddr, data):
+        """ Write consecutive bytes, as one page write for each page they fall in
+
+        Args:
+            memaddr (int)            : The first address to write
+            data    (bytes/bytearray): What to write
+        """
+        view = memoryview(data)
+        done = 0
+        while done < len(data):
+            count = min(self.page - (memaddr + done) % self.page, len(data) - done)
+            self._ready()
+            with _SECT_WRITE:
+                self._mem(self.i2c.writeto_mem, memaddr + done, view[done:done + count])
+            self._written_at    = ticks_ms()
+            self.page_writes   += 1
+            self.bytes_written += count
+            done               += count
+
+class HandJournal:
+    __slots__ = ('chip', 'start', 'slots', 'every', 'seq', 'saves', 'since', '_buf', '_page', '_held', '_last',
+                 '_saved_at')
+
+    def __init__(self, chip, start = 0, length = SIZE, every = JOURNAL_EVERY):
+        """ Initialise the journal - call recover() before saving anything
+
+        Args:
+            chip   (EEPROM): Where to keep it
+            start  (int)   : First byte of the area to use - a multiple of the page size
+            length (int)   : Size of the area to use - a multiple of the page size
+            every  (int)   : Most seconds between records whilst only the hands are moving
+        """
+        self.chip      = chip
+        self.start     = start
+        self.slots     = length // RECORD_SIZE
+        self.every     = every
+        self.seq       = -1         # Sequence number of the newest record
+        self.saves     = 0
+        self.since     = None       # Sequence number at recover(), for the wear rate
+        self._buf      = bytearray(RECORD_SIZE)
+        self._page     = bytearray(PAGE)   # Records of the current page, as they will be written
+        self._held     = 0          # Records in _page not written yet
+        self._last     = None       # (hands, polarity, white phase) last saved - unchanged state isn't rewritten
+        self._saved_at = None       # Time of the newest record
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r}, {!r}, {!r}, {!r})".format(self.__class__.__name__, self.chip, self.start,
+                                                   self.slots * RECORD_SIZE, self.every)
+
+    def _read(self, slot):
+        """ Read and check the record in a slot
+
+        Args:
+            slot (int): The slot
+
+        Returns:
+            tuple: (sequence, hands, polarity, white phase, time) or None if the slot doesn't hold a good record
+        """
+        self.chip.read(self.start + slot * RECORD_SIZE, self._buf)
+        (magic, polarity, hands, seq, when, white, check) = ustruct.unpack(RECORD, self._buf)
+        if magic != MAGIC or check != fletcher16(self._buf, RECORD_SIZE - 2) or \
+           seq % self.slots != slot:
+            return None
+        return (seq, hands, polarity, white, when)
+
+    def _scan(self):
+        """ Read every slot - used when the ring isn't in the shape the binary search expects
+
+        Returns:
+            tuple: The newest good record as returned by _read(), or None if there isn't one
+        """
+        newest = None
+        for slot in range(self.slots):
+            record = self._read(slot)
+            if record is not None and (newest is None or record[0] > newest[0]):
+                newest = record
+        return newest
+
+    def recover(self):
+        """ Find the newest good record
+
+        Returns:
+            tuple: (hands, polarity, white phase, time) or None if there isn't a good record
+        """
+        first = self._read(0)
+        if first is None:
+            newest = self._scan()                   # New chip, or slot 0 was being written at the power cut
+        else:
+            # Slots 0..k hold sequence numbers first..first+k - find the largest such k
+            (low, high) = (0, self.slots - 1)
+            newest      = first
+            while low < high:
+                middle = (low + high + 1) // 2
+                record = self._read(middle)
+                if record is not None and record[0] == first[0] + middle:
+                    (low, newest) = (middle, record)
+                else:
+                    high = middle - 1
+            following = self._read((low + 1) % self.slots)
+            if following is not None and following[0] > newest[0]:
+                newest = self._scan()               # Not a clean ring - don't trust the search
+
+        if newest is None:
+            self.seq   = -1
+            self.since = -1
+            return None
+        self.seq   = newest[0]
+        self.since = self.seq
+        self._last     = (newest[1], newest[2], newest[3])
+        self._saved_at = newest[4]
+        self._held     = 0
+        return (newest[1], newest[2], newest[3], newest[4])
+
+    def save(self, hands, polarity, white, when, force = False):
+        """ Save the hand state if it has changed and a record is due - see JOURNAL_EVERY
+
+        Args:
+            hands    (int) : Hand position as seconds from 12:00:00
+            polarity (int) : Polarity of the next pulse, from PulseClock.polarity
+            white    (int) : The second hand sensor's white phase, from PulseClock.whitephase
+            when     (int) : The time, e.g. TimeOfDay.utc
+            force    (bool): Write it now if only the hands have changed
+        """
+        last = self._last
+        if last is not None and last[1] == polarity and last[2] == white:
+            if last[0] == hands:
+                return
+            if not force and self._saved_at is not None and 0 <= when - self._saved_at < self.every:
+                return
+        urgent    = force or last is None or last[1] != polarity or last[2] != white
+        self.seq += 1
+        ustruct.pack_into(RECORD, self._buf, 0, MAGIC, polarity, hands, self.seq, when, white, 0)
+        ustruct.pack_into("<H", self._buf, RECORD_SIZE - 2, fletcher16(self._buf, RECORD_SIZE - 2))
+        offset = (self.seq * RECORD_SIZE) % PAGE
+        self._page[offset:offset + RECORD_SIZE] = self._buf
+        self._held    += 1
+        self.saves    += 1
+        self._last     = (hands, polarity, white)
+        self._saved_at = when
+        if urgent or offset + RECORD_SIZE == PAGE:
+            self.flush()
+
+    def flush(self):
+        """ Write the records held back for their page to fill, as one page write
+        """
+        if self._held == 0:
+            return
+        end   = (self.seq * RECORD_SIZE) % PAGE + RECORD_SIZE
+        first = end - self._held * RECORD_SIZE
+        self.chip.write(self.start + ((self.seq + 1 - self._held) % self.slots) * RECORD_SIZE,
+                        memoryview(self._page)[first:end])
+        self._held = 0
+
+    def stats(self, days = None):
+        """ Wear so far and the expected life - e.g. to return from a web endpoint
+
+        Args:
+            days (float): How long the saves since recover() took, for the life estimate - or None for no estimate
+
+        Returns:
+            dict: Records written, page writes per page so far and the years until the endurance is reached
+        """
+        # Each page holds PAGE // RECORD_SIZE slots, so it is written at most that many times per lap of the ring -
+        # fewer when periodic records were batched, so this overestimates the wear
+        pages    = self.slots * RECORD_SIZE // PAGE
+        per_page = (self.seq + 1) // pages
+        years    = None
+        if days and self.since is not None and self.seq > self.since:
+            years = (ENDURANCE - per_page) * days * pages / (self.seq - self.since) / 365
+        return { "records":        self.seq + 1,
+                 "saves":          self.saves,
+                 "page_writes":    per_page,
+                 "worn_percent":   per_page * 100 / ENDURANCE,
+                 "life_years":     years }
@@ -0,0 +1,322 @@
+""" Shared I2C bus - one lock, per-device statistics and recovery of a stuck bus
+
+The DS3231, its EEPROM and anything else on I2C bus 0 may be used from the main loop (or main_async's tasks)
+and the web server threads at once. Every transfer goes through an I2CBus, which holds a lock for the length of the
+transfer (or of a whole Batch of transfers run back-to-back), so transfers from different threads can't
+interleave. An I2CBus has the same transfer methods as machine.I2C, so drivers take either.
+
+A transfer which fails (NACK, timeout or SDA held low by a device part way through a byte) is retried once after
+recovering the bus: SCL is clocked until the stuck device lets go of SDA, a STOP is sent, and the I2C peripheral
+is re-created. If the retry fails too, and the bus itself was at fault (SDA held low, or a timeout) rather than
+one device not answering, the bus drops to 100kHz - so a higher clock rate can be tried safely.
+
+Usage:
+    bus = i2cbus.I2CBus(0, scl = 22, sda = 21, freq = 400000)
+    ds  = ds3231.DS3231(bus)
+    bus.report()
+"""
+
+from machine import I2C, Pin
+from utime import sleep_us, ticks_us, ticks_diff
+
+try:
+    import _thread
+except ImportError:
+    _thread = None
+
+SAFE_FREQ = 100000
+
+ETIMEDOUT = (110, 116)  # Timeout errno - MicroPython's own, and lwIP's on the ESP32 ports
+
+# Transfer kinds
+READ_MEM  = 0
+WRITE_MEM = 1
+READ      = 2
+WRITE     = 3
+
+# Per-device statistics - indexes into the list kept for each address
+TRANSFERS = 0
+BYTES     = 1
+ERRORS    = 2
+TOTAL_US  = 3
+MAX_US    = 4
+
+class I2CBus:
+    __slots__ = ('ident', 'scl', 'sda', 'freq', 'i2c', 'lock', 'devices', 'recoveries', 'slowed', 'stuck', '_rate')
+
+    def __init__(self, ident = 0, scl = 22, sda = 21, freq = 100000):
+        """ Initialise the bus
+
+        Args:
+            ident (int): I2C peripheral number
+            scl   (int): SCL pin
+            sda   (int): SDA pin
+            freq  (int): Clock rate in Hz
+        """
+        self.ident      = ident
+        self.scl        = scl
+        self.sda        = sda
+        self.freq       = freq
+        self._rate      = None  # The clock rate keyword this port takes - found by _create()
+        self.i2c        = self._create()
+        self.lock       = _thread.allocate_lock() if _thread is not None else None
+        self.devices    = {}    # Address -> [transfers, bytes, errors, total us, max us]
+        self.recoveries = 0
+        self.slowed     = False
+        self.stuck      = False # The last recovery found SDA held low
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r}, {!r}, {!r}, {!r})".format(self.__class__.__name__, self.ident, self.scl, self.sda, self.freq)
+
+    def _create(self):
+        """ Create the peripheral at the current clock rate
+
+        Returns:
+            I2C: The peripheral
+        """
+        if self._rate is None:
+            try:
+                i2c        = I2C(self.ident, scl = self.scl, sda = self.sda, freq = self.freq)  # Mainline MicroPython
+                self._rate = "freq"
+                return i2c
+            except TypeError:
+                self._rate = "speed"
+        if self._rate == "freq":
+            return I2C(self.ident, scl = self.scl, sda = self.sda, freq = self.freq)
+        return I2C(self.ident, scl = self.scl, sda = self.sda, speed = self.freq)                # Loboris port
+
+    def __enter__(self):
+        """ Hold the lock - used by Batch. The lock isn't re-entrant, so don't call the transfer methods inside.
+        """
+        if self.lock is not None:
+            self.lock.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.lock is not None:
+            self.lock.release()
+        return False
+
+    def _once(self, kind, addr, memaddr, buf, addrsize, adrlen):
+        """ Make one transfer on the peripheral
+
+        Args:
+            kind     (int)      : READ_MEM, WRITE_MEM, READ or WRITE
+            addr     (int)      : Device address
+            memaddr  (int)      : Register or memory address, for READ_MEM and WRITE_MEM
+            buf      (bytearray): Read into or written
+            addrsize (int)      : Memory address size in bits (mainline MicroPython)
+            adrlen   (int)      : Memory address size in bytes (Loboris port)
+        """
+        if kind == READ:
+            self.i2c.readfrom_into(addr, buf)
+        elif kind == WRITE:
+            self.i2c.writeto(addr, buf)
+        else:
+            method = self.i2c.readfrom_mem_into if kind == READ_MEM else self.i2c.writeto_mem
+            if addrsize != 8:
+                method(addr, memaddr, buf, addrsize = addrsize)
+            elif adrlen != 1:
+                method(addr, memaddr, buf, adrlen = adrlen)
+            else:
+                method(addr, memaddr, buf)
+
+    def _transfer(self, kind, addr, memaddr, buf, addrsize = 8, adrlen = 1):
+        """ Make one transfer, recovering the bus and retrying once if it fails - the lock must be held
+
+        Args:
+            As _once()
+        """
+        stats = self.devices.get(addr)
+        if stats is None:
+            stats = self.devices[addr] = [0, 0, 0, 0, 0]
+        start = ticks_us()
+        try:
+            self._once(kind, addr, memaddr, buf, addrsize, adrlen)
+        except OSError:
+            stats[ERRORS] += 1
+            self.recover()
+            try:
+                self._once(kind, addr, memaddr, buf, addrsize, adrlen)
+            except OSError as e:
+                stats[ERRORS] += 1
+                # A device which doesn't answer (e.g. isn't fitted) NACKs at any rate - only slow down for the bus
+                if self.freq > SAFE_FREQ and (self.stuck or (e.args and e.args[0] in ETIMEDOUT)):
+                    print("I2C errors at {}Hz - dropping to {}Hz".format(self.freq, SAFE_FREQ))
+                    self.freq   = SAFE_FREQ
+                    self.slowed = True
+                    self.recover()
+                raise
+        elapsed = ticks_diff(ticks_us(), start)
+
+        stats[TRANSFERS] += 1
+        stats[BYTES]     += len(buf)
+        stats[TOTAL_US]  += elapsed
+        if elapsed > stats[MAX_US]:
+            stats[MAX_US] = elapsed
+
+    def _locked(self, kind, addr, memaddr, buf, addrsize, adrlen):
+        """ Make one transfer holding the lock
+
+        Args:
+            As _once()
+        """
+        if self.lock is not None:
+            self.lock.acquire()
+        try:
+            self._transfer(kind, addr, memaddr, buf, addrsize, adrlen)
+        finally:
+            if self.lock is not None:
+                self.lock.release()
+
+    def readfrom_mem_into(self, addr, memaddr, buf, addrsize = 8, adrlen = 1):
+        """ As machine.I2C.readfrom_mem_into()
+        """
+        self._locked(READ_MEM, addr, memaddr, buf, addrsize, adrlen)
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize = 8, adrlen = 1):
+        """ As machine.I2C.writeto_mem()
+        """
+        self._locked(WRITE_MEM, addr, memaddr, buf, addrsize, adrlen)
+
+    def readfrom_into(self, addr, buf):
+        """ As machine.I2C.readfrom_into()
+        """
+        self._locked(READ, addr, 0, buf, 8, 1)
+
+    def writeto(self, addr, buf):
+        """ As machine.I2C.writeto()
+        """
+        self._locked(WRITE, addr, 0, buf, 8, 1)
+
+    def scan(self):
+        """ As machine.I2C.scan()
+        """
+        with self:
+            return self.i2c.scan()
+
+    def recover(self):
+        """ Free a bus left stuck by a device holding SDA low, and re-create the peripheral - the lock must be held
+
+        Returns:
+            bool: True if SDA was being held low
+        """
+        self.recoveries += 1
+        try:
+            self.i2c.deinit()
+        except AttributeError:
+            pass # Not supported by this port
+        try:
+            open_drain = Pin.OPEN_DRAIN
+        except AttributeError:
+            open_drain = Pin.OUT_OD # Loboris port
+
+        scl = Pin(self.scl, open_drain)
+        sda = Pin(self.sda, Pin.IN, Pin.PULL_UP)
+        scl.value(1)
+        self.stuck = sda.value() == 0
+        for _ in range(9):              # A device part way through a byte lets go of SDA within 9 clocks
+            if sda.value() == 1:
+                break
+            scl.value(0)
+            sleep_us(5)
+            scl.value(1)
+            sleep_us(5)
+
+        sda = Pin(self.sda, open_drain) # STOP - SDA rising while SCL is high
+        sda.value(0)
+        sleep_us(5)
+        scl.value(1)
+        sleep_us(5)
+        sda.value(1)
+        sleep_us(5)
+
+        self.i2c = self._create()
+        return self.stuck
+
+    def deinit(self):
+        """ Relinquish the bus
+        """
+        with self:
+            self.i2c.deinit()
+
+    def stats(self):
+        """ Per-device transfer statistics - e.g. to return from a web endpoint
+
+        Returns:
+            dict: Bus settings and recoveries, and for each device address the transfers, bytes, errors, and mean
+                  and maximum latency in microseconds
+        """
+        devices = {}
+        for (addr, stats) in self.devices.items():
+            devices[addr] = { "transfers": stats[TRANSFERS],
+                              "bytes":     stats[BYTES],
+                              "errors":    stats[ERRORS],
+                              "mean_us":   stats[TOTAL_US] // stats[TRANSFERS] if stats[TRANSFERS] else 0,
+                              "max_us":    stats[MAX_US] }
+        return { "freq": self.freq, "recoveries": self.recoveries, "slowed": self.slowed, "devices": devices }
+
+    def report(self):
+        """ Print the statistics at the REPL
+        """
+        print("I2C bus {} at {}Hz, {} recoveries".format(self.ident, self.freq, self.recoveries))
+        print("{:>7s} {:>9s} {:>9s} {:>6s} {:>8s} {:>8s}".format("Device", "Transfers", "Bytes", "Errors", "Mean us",
+                                                               "Max us"))
+        for (addr, stats) in sorted(self.devices.items()):
+            print("{:7s} {:9d} {:9d} {:6d} {:8d} {:8d}".format(hex(addr), stats[TRANSFERS], stats[BYTES],
+                  stats[ERRORS], stats[TOTAL_US] // stats[TRANSFERS] if stats[TRANSFERS] else 0, stats[MAX_US]))
+
+    def reset(self):
+        """ Clear the statistics
+        """
+        for stats in self.devices.values():
+            for i in range(len(stats)):
+                stats[i] = 0
+        self.recoveries = 0
+
+class Batch:
+    __slots__ = ('bus', 'queue')
+
+    def __init__(self, bus):
+        """ A queue of transfers to run back-to-back, holding the bus once for all of them
+
+        Args:
+            bus (I2CBus): The bus to run them on
+        """
+        self.bus   = bus
+        self.queue = []
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r})".format(self.__class__.__name__, self.bus)
+
+    def read(self, addr, memaddr, buf, addrsize = 8, adrlen = 1):
+        """ Queue a register or memory read - buf is filled in when the batch is run
+        """
+        self.queue.append((READ_MEM, addr, memaddr, buf, addrsize, adrlen))
+        return self
+
+    def write(self, addr, memaddr, buf, addrsize = 8, adrlen = 1):
+        """ Queue a register or memory write
+        """
+        self.queue.append((WRITE_MEM, addr, memaddr, buf, addrsize, adrlen))
+        return self
+
+    def run(self):
+        """ Run the queued transfers in order, and empty the queue - an error stops the batch and is raised
+
+        Returns:
+            int: Number of transfers made
+        """
+        count = 0
+        with self.bus:
+            try:
+                for (kind, addr, memaddr, buf, addrsize, adrlen) in self.queue:
+                    self.bus._transfer(kind, addr, memaddr, buf, addrsize, adrlen)
+                    count += 1
+            finally:
+                self.queue = []
+        return count
@@ -0,0 +1,188 @@
+""" Lightweight timing instrumentation
+
+Named sections are timed with ticks_us. Every timing is written to a fixed-size ring buffer, and a count, total
+and maximum are kept for each section. Nothing is recorded - and almost nothing is spent - unless enabled.
+
+Usage:
+    _SECT_STEP = instrument.section("step")     # Once, at import time
+
+    def step(self):
+        with _SECT_STEP:
+            ...
+
+    instrument.enable()                         # From the REPL
+    instrument.report()
+"""
+
+from array import array
+try:
+    from utime import ticks_us, ticks_diff
+except ImportError:
+    # The same fallback as the modules which import this one - time on ports without utime, else host CPython
+    try:
+        from time import ticks_us, ticks_diff
+    except ImportError:
+        from time import perf_counter_ns
+
+        def ticks_us():
+            return (perf_counter_ns() // 1000) & 0x3fffffff
+
+        def ticks_diff(new, old):
+            return ((new - old + 0x20000000) & 0x3fffffff) - 0x20000000
+
+RING_SIZE = 64 # Number of individual timings kept
+
+enabled   = False
+
+_sections = []                          # Section objects, indexed by id
+_by_name  = {}                          # Section objects, indexed by name
+_ring_id  = bytearray(RING_SIZE)        # Section id of each recent timing
+_ring_at  = array('l', [0] * RING_SIZE) # Start time of each recent timing
+_ring_us  = array('l', [0] * RING_SIZE) # Duration of each recent timing
+_ring_pos = 0                           # Next ring slot to write
+_ring_len = 0                           # Number of valid ring entries
+
+class Section:
+    def __init__(self, name, ident):
+        """ A named, timed section of code - use section() rather than creating these directly
+
+        Args:
+            name  (string): The section name used in reports
+            ident (int)   : Index of the section in the ring buffer
+        """
+        self.name  = name
+        self.ident = ident
+        self.start = 0
+        self.count = 0
+        self.total = 0
+        self.max   = 0
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r})".format(self.__class__.__name__, self.name)
+
+    def __enter__(self):
+        if enabled:
+            self.start = ticks_us()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if enabled:
+            self.record(self.start, ticks_diff(ticks_us(), self.start))
+        return False
+
+    def record(self, start, elapsed):
+        """ Add one timing to the section statistics and the ring buffer
+
+        Args:
+            start   (int): ticks_us at the start of the section
+            elapsed (int): Duration in microseconds
+        """
+        global _ring_pos, _ring_len
+
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+        _ring_id[_ring_pos] = self.ident
+        _ring_at[_ring_pos] = start
+        _ring_us[_ring_pos] = elapsed
+        _ring_pos           = (_ring_pos + 1) % RING_SIZE
+        if _ring_len < RING_SIZE:
+            _ring_len += 1
+
+    def reset(self):
+        """ Clear the section statistics
+        """
+        self.count = 0
+        self.total = 0
+        self.max   = 0
+
+def section(name):
+    """ Get the section with the given name, creating it if needed
+
+    Args:
+        name (string): The section name
+
+    Returns:
+        Section: Use as a context manager around the code to be timed
+    """
+    if name not in _by_name:
+        if len(_sections) >= 256:
+            raise RuntimeError("Too many instrumented sections")
+        sect = Section(name, len(_sections))
+        _sections.append(sect)
+        _by_name[name] = sect
+    return _by_name[name]
+
+def timed(name):
+    """ Decorator which times every call of a function as a section. Calling through the wrapper allocates
+    an argument tuple, so use a section directly in code which must not allocate.
+
+    Args:
+        name (string): The section name
+    """
+    sect = section(name)
+
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            with sect:
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def enable(on = True):
+    """ Turn recording on or off
+
+    Args:
+        on (bool): True to record timings
+    """
+    global enabled
+    enabled = on
+
+def reset():
+    """ Clear all statistics and the ring buffer
+    """
+    global _ring_pos, _ring_len
+    for sect in _sections:
+        sect.reset()
+    _ring_pos = 0
+    _ring_len = 0
+
+def stats():
+    """ Collect the statistics - e.g. to return from a web endpoint
+
+    Returns:
+        dict: "sections" maps each name to its count, total, mean and max in microseconds, and "recent" lists
+              the most recent timings, oldest first, as [name, start, duration]
+    """
+    sections = {}
+    for sect in _sections:
+        sections[sect.name] = { "count": sect.count,
+                                "total": sect.total,
+                                "mean":  sect.total // sect.count if sect.count else 0,
+                                "max":   sect.max }
+    recent = []
+    for i in range(_ring_len):
+        pos = (_ring_pos - _ring_len + i) % RING_SIZE
+        recent.append([_sections[_ring_id[pos]].name, _ring_at[pos], _ring_us[pos]])
+
+    return { "enabled": enabled, "sections": sections, "recent": recent }
+
+def report(recent = False):
+    """ Print the statistics at the REPL
+
+    Args:
+        recent (bool): Also print the individual timings in the ring buffer
+    """
+    print("{:16s} {:>8s} {:>12s} {:>8s} {:>8s}".format("Section", "Count", "Total us", "Mean us", "Max us"))
+    for sect in _sections:
+        mean = sect.total // sect.count if sect.count else 0
+        print("{:16s} {:8d} {:12d} {:8d} {:8d}".format(sect.name, sect.count, sect.total, mean, sect.max))
+
+    if recent:
+        for i in range(_ring_len):
+            pos = (_ring_pos - _ring_len + i) % RING_SIZE
+            print("{:12d} {:16s} {:8d}".format(_ring_at[pos], _sections[_ring_id[pos]].name, _ring_us[pos]))
@@ -0,0 +1,232 @@
+""" Append-only journal of small state records on flash
+
+Rewriting a whole JSON file for every change wears the flash and can leave a torn file if the power fails
+part way through. The journal only ever appends a short checksummed record for the key which changed. At boot
+the records are replayed into a dictionary, so the latest value of any key is then a dictionary lookup. A
+record torn by a power cut fails its checksum and is ignored. When most of the journal is superseded records
+it is compacted - rewritten with just the latest value of each key, atomically.
+
+Usage:
+    state = journal.Journal("state.jnl")
+    state.set("drift", -12)
+    state.get("drift")
+    journal.benchmark()                 # Write amplification against rewriting a JSON file
+"""
+
+import ujson
+import ustruct
+import uos
+from utime import ticks_ms, ticks_diff
+
+import settings
+
+try:
+    from ubinascii import crc32
+except ImportError:
+    crc32 = None
+
+MAGIC  = 0xa5           # First byte of every record
+HEADER = "<BBH"         # Magic, key length, value length
+TAIL   = "<I"           # Checksum of the header, key and value
+
+def checksum(data):
+    """ CRC32 where the port has it, otherwise Adler-32
+
+    Args:
+        data (bytes): What to check
+
+    Returns:
+        int: 32-bit checksum
+    """
+    if crc32 is not None:
+        return crc32(data) & 0xffffffff
+    a = 1
+    b = 0
+    for byte in data:
+        a = (a + byte) % 65521
+        b = (b + a) % 65521
+    return (b << 16) | a
+
+def encode(key, value):
+    """ Make a journal record
+
+    Args:
+        key   (string): Up to 255 bytes
+        value         : Anything ujson can encode, up to 65535 bytes encoded
+
+    Returns:
+        bytes: The record
+    """
+    key_bytes   = key.encode()
+    value_bytes = ujson.dumps(value).encode()
+    body        = ustruct.pack(HEADER, MAGIC, len(key_bytes), len(value_bytes)) + key_bytes + value_bytes
+    return body + ustruct.pack(TAIL, checksum(body))
+
+class Journal:
+    __slots__ = ('filename', 'compact_at', 'values', 'size', 'live', 'records', 'written', 'logical',
+                 'compactions', 'torn')
+
+    def __init__(self, filename, compact_at = 4096):
+        """ Open a journal, replaying it to find the latest value of every key
+
+        Args:
+            filename   (string): The journal file
+            compact_at (int)   : Compact once the journal is this big and at least half of it is superseded
+        """
+        self.filename    = filename
+        self.compact_at  = compact_at
+        self.values      = {}   # Key -> latest value
+        self.size        = 0    # Bytes of valid records in the file
+        self.live        = {}   # Key -> size of its latest record
+        self.records     = 0    # Valid records in the file
+        self.written     = 0    # Bytes written to flash since opening
+        self.logical     = 0    # Bytes of record values set since opening - what actually needed saving
+        self.compactions = 0
+        self.torn        = False
+
+        self._replay()
+        if self.torn:
+            self.compact()      # Don't append after a torn record - it would hide everything written later
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r}, {!r})".format(self.__class__.__name__, self.filename, self.compact_at)
+
+    def _replay(self):
+        """ Read every valid record, stopping at the first bad one
+        """
+        try:
+            with open(self.filename, "rb") as fd:
+                data = fd.read()
+        except OSError:
+            try:
+                uos.rename(self.filename + ".tmp", self.filename) # Power cut during a compaction's rename
+                with open(self.filename, "rb") as fd:
+                    data = fd.read()
+            except OSError:
+                return # A new journal
+
+        header = ustruct.calcsize(HEADER)
+        tail   = ustruct.calcsize(TAIL)
+        pos    = 0
+        while pos + header <= len(data):
+            (magic, key_len, value_len) = ustruct.unpack_from(HEADER, data, pos)
+            end = pos + header + key_len + value_len
+            if magic != MAGIC or end + tail > len(data) or \
+               ustruct.unpack_from(TAIL, data, end)[0] != checksum(data[pos:end]):
+                break
+            key               = bytes(data[pos + header:pos + header + key_len]).decode()
+            self.values[key]  = ujson.loads(bytes(data[pos + header + key_len:end]).decode())
+            self.live[key]    = end + tail - pos
+            self.records     += 1
+            pos               = end + tail
+
+        self.size = pos
+        self.torn = pos != len(data)
+        if self.torn:
+            print("{}: ignoring {} bytes after the last good record".format(self.filename, len(data) - pos))
+
+    def get(self, key, default = None):
+        """ The latest value of a key
+
+        Args:
+            key (string): The key
+            default     : Returned if the key has never been set
+
+        Returns:
+            The value
+        """
+        return self.values.get(key, default)
+
+    def set(self, key, value):
+        """ Record a new value for a key - nothing is written if it hasn't changed
+
+        Args:
+            key (string): The key
+            value       : Anything ujson can encode
+        """
+        if key in self.values and self.values[key] == value:
+            return
+        record = encode(key, value)
+        with open(self.filename, "ab") as fd:
+            fd.write(record)
+
+        self.values[key]  = value
+        self.live[key]    = len(record)
+        self.size        += len(record)
+        self.records     += 1
+        self.written     += len(record)
+        self.logical     += len(record)
+
+        if self.size >= self.compact_at and self.size >= 2 * sum(self.live.values()):
+            self.compact()
+
+    def compact(self):
+        """ Rewrite the journal with just the latest value of every key
+        """
+        data = bytearray()
+        for key in self.values:
+            data.extend(encode(key, self.values[key]))
+        settings.write_atomic(self.filename, data, "wb")
+
+        self.size         = len(data)
+        self.records      = len(self.values)
+        self.written     += len(data)
+        self.compactions += 1
+        self.torn         = False
+
+    def stats(self):
+        """ Journal size and wear - e.g. to return from a web endpoint
+
+        Returns:
+            dict: Keys, records and bytes in the journal, bytes written, and the write amplification
+        """
+        return { "keys":          len(self.values),
+                 "records":       self.records,
+                 "size":          self.size,
+                 "written":       self.written,
+                 "compactions":   self.compactions,
+                 "amplification": self.written / self.logical if self.logical else 0 }
+
+def benchmark(updates = 500, keys = 8, filename = "bench.jnl"):
+    """ Compare the bytes written (and time taken) to save a series of small updates by appending to a
+    journal, and by rewriting a whole JSON file each time
+
+    Args:
+        updates  (int)   : Number of updates
+        keys     (int)   : Number of different keys updated in turn
+        filename (string): Scratch file - deleted afterwards
+    """
+    for name in (filename, filename + ".json"):
+        try:
+            uos.remove(name)
+        except OSError:
+            pass
+
+    # Append to a journal
+    start = ticks_ms()
+    state = Journal(filename)
+    for i in range(updates):
+        state.set("key{}".format(i % keys), i)
+    journal_ms = ticks_diff(ticks_ms(), start)
+
+    # Rewrite a JSON file
+    start    = ticks_ms()
+    values   = {}
+    written  = 0
+    for i in range(updates):
+        values["key{}".format(i % keys)] = i
+        data     = ujson.dumps(values)
+        settings.write_atomic(filename + ".json", data, "w")
+        written += len(data)
+    rewrite_ms = ticks_diff(ticks_ms(), start)
+
+    logical = state.logical
+    print("{} updates to {} keys, {} bytes of records".format(updates, keys, logical))
+    print("Journal: {:8d} bytes written ({:.1f}x) in {}ms, {} compactions".format(
+          state.written, state.written / logical, journal_ms, state.compactions))
+    print("Rewrite: {:8d} bytes written ({:.1f}x) in {}ms".format(written, written / logical, rewrite_ms))
+
+    for name in (filename, filename + ".json"):
+        uos.remove(name)
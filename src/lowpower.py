@@ -0,0 +1,185 @@
+""" Light sleep (or doze) between pulses, woken by the DS3231 squarewave
+
+Once the pulse for this second is finished the ESP32 has nothing to do until the next second edge, so rather
+than spinning around the main loop it can light sleep, keeping RAM and all state. The DS3231 INT/SQW pin (1Hz
+squarewave) falls as each second starts and rises half way through it. The ext0 wakeup is level triggered, so
+during the low half the sleeper only naps on a timer; once the pin is high it sleeps until it goes low. The
+DS3231 alarms can't be used instead as Alarm 1 holds the hand position and Alarm 2 only has minute resolution.
+
+Only mainline MicroPython ports provide machine.lightsleep() and esp32.wake_on_ext0(). The Loboris port has
+neither, so there the sleeper dozes instead: the CPU clock drops to 80MHz and the loop waits in sleep_ms()
+(which lets FreeRTOS idle the core) until the squarewave interrupt has seen the second edge, then the clock
+goes back up. That saves less than light sleep, but the interrupts keep running so nothing needs recounting.
+Without either the sleeper does nothing.
+"""
+
+import machine
+from utime import sleep_ms, ticks_ms, ticks_us, ticks_diff
+
+try:
+    import esp32
+except ImportError:
+    esp32 = None
+
+class LightSleeper:
+    __slots__ = ('tod', 'buttons', 'nap_ms', 'budget_us', 'active_ma', 'sleep_ma', 'doze_ma', 'mode', 'available',
+                 'woke_at', 'since', 'asleep_ms', 'sleeps', 'latency_count', 'latency_total', 'latency_max',
+                 'over_budget')
+
+    def __init__(self, tod, buttons = None, nap_ms = 50, budget_us = 3000, active_ma = 40, sleep_ma = 1,
+                 doze_ma = 20):
+        """ Initialise the sleeper
+
+        Args:
+            tod       (TimeOfDay)   : The time of day counter - it must be using the DS3231 squarewave
+            buttons   (ButtonEvents): Buttons whose presses may be missed while asleep, or None
+            nap_ms    (int)         : How long to nap for while waiting for the squarewave to go high
+            budget_us (int)         : Wake-to-pulse latency above which a pulse counts as late
+            active_ma (int)         : Typical current when awake with the radio off, for the savings estimate
+            sleep_ma  (int)         : Typical current in light sleep, for the savings estimate
+            doze_ma   (int)         : Typical current dozing at 80MHz, for the savings estimate
+        """
+        self.tod           = tod
+        self.buttons       = buttons
+        self.nap_ms        = nap_ms
+        self.budget_us     = budget_us
+        self.active_ma     = active_ma
+        self.sleep_ma      = sleep_ma
+        self.doze_ma       = doze_ma
+        if esp32 is not None and hasattr(machine, "lightsleep"):
+            self.mode      = "sleep"
+        elif hasattr(machine, "freq"):
+            self.mode      = "doze"    # Loboris port
+        else:
+            self.mode      = None
+        self.available     = tod.sqw is not None and self.mode is not None
+        self.woke_at       = None   # ticks_us when a squarewave edge last woke us, until the pulse it led to
+
+        self.since         = ticks_ms()
+        self.asleep_ms     = 0
+        self.sleeps        = 0
+        self.latency_count = 0
+        self.latency_total = 0
+        self.latency_max   = 0
+        self.over_budget   = 0
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r}, {!r}, {!r}, {!r})".format(self.__class__.__name__, self.tod, self.buttons, self.nap_ms,
+                                                    self.budget_us)
+
+    def poll(self, allowed):
+        """ Sleep until the next second edge, or for a short nap if it's too soon to wait for it
+
+        Args:
+            allowed (bool): Whether it's OK to sleep - e.g. hands in Run mode, nobody looking and the radio off
+
+        Returns:
+            bool: True if we slept
+        """
+        if not self.available or not allowed:
+            return False
+        if self.woke_at is not None:
+            if ticks_diff(ticks_us(), self.woke_at) < 1000000:
+                return False    # Woken by a second edge - stay awake until its pulse has been made
+            self.woke_at = None # No pulse followed that edge
+        if self.mode == "doze":
+            return self._doze()
+
+        edge  = self.tod.sqw.value() == 1   # Squarewave high - the next thing it does is the second edge
+        esp32.wake_on_ext0(pin = self.tod.sqw if edge else None, level = esp32.WAKEUP_ALL_LOW) # A low pin would wake a nap at once
+        start = ticks_ms()
+        machine.lightsleep(1100 if edge else self.nap_ms)   # The timeout is only a safety net when waiting for the edge
+        now   = ticks_ms()
+
+        self.sleeps    += 1
+        self.asleep_ms += ticks_diff(now, start)
+        if edge and self.tod.sqw.value() == 0:
+            self.woke_at = ticks_us()
+            self.tod.woke()
+        if self.buttons is not None:
+            self.buttons.refresh()
+        return True
+
+    def _doze(self):
+        """ Wait at a low CPU clock until the squarewave interrupt sees the next second edge
+
+        Returns:
+            bool: True if we dozed
+        """
+        if self.tod.pending:
+            return False                        # An edge is already waiting to be counted
+        full  = machine.freq()
+        machine.freq(80000000 if full > 1000 else 80) # Hz on some builds, MHz on others
+        start = ticks_ms()
+        while not self.tod.pending and ticks_diff(ticks_ms(), start) < 1100:
+            sleep_ms(1)
+        if self.tod.pending:
+            self.woke_at = ticks_us()
+        machine.freq(full)
+        now   = ticks_ms()
+
+        self.sleeps    += 1
+        self.asleep_ms += ticks_diff(now, start)
+        return True
+
+    def pulsed(self, started):
+        """ Record the wake-to-pulse latency - call this when a pulse has been made
+
+        Args:
+            started (int): ticks_us when the pulse started, i.e. PulseTimer.started
+        """
+        if self.woke_at is None:
+            return
+        latency      = ticks_diff(started, self.woke_at)
+        self.woke_at = None
+
+        self.latency_count += 1
+        self.latency_total += latency
+        if latency > self.latency_max:
+            self.latency_max = latency
+        if latency > self.budget_us:
+            self.over_budget += 1
+
+    def stats(self):
+        """ Time asleep, the estimated power saving and the wake-to-pulse latency - e.g. to return from a web endpoint
+
+        Returns:
+            dict: Sleep counts and times, estimated mean currents and latencies in microseconds
+        """
+        elapsed = ticks_diff(ticks_ms(), self.since)
+        awake   = elapsed - self.asleep_ms
+        low_ma  = self.doze_ma if self.mode == "doze" else self.sleep_ma
+        mean_ma = (awake * self.active_ma + self.asleep_ms * low_ma) / elapsed if elapsed else self.active_ma
+        return { "available":       self.available,
+                 "mode":            self.mode,
+                 "sleeps":          self.sleeps,
+                 "asleep_percent":  self.asleep_ms * 100 // elapsed if elapsed else 0,
+                 "mean_ma":         mean_ma,
+                 "saved_ma":        self.active_ma - mean_ma,
+                 "latency_count":   self.latency_count,
+                 "latency_mean_us": self.latency_total // self.latency_count if self.latency_count else 0,
+                 "latency_max_us":  self.latency_max,
+                 "over_budget":     self.over_budget }
+
+    def report(self):
+        """ Print the statistics at the REPL
+        """
+        stats = self.stats()
+        print("{} {} times, {}% of the time - about {:.1f}mA instead of {}mA".format(
+              "Dozed" if self.mode == "doze" else "Slept", stats["sleeps"], stats["asleep_percent"], stats["mean_ma"], self.active_ma))
+        print("Wake to pulse: {} pulses, mean {}us, max {}us, {} over {}us".format(
+              stats["latency_count"], stats["latency_mean_us"], stats["latency_max_us"], stats["over_budget"],
+              self.budget_us))
+
+    def reset(self):
+        """ Clear the statistics
+        """
+        self.since         = ticks_ms()
+        self.asleep_ms     = 0
+        self.sleeps        = 0
+        self.latency_count = 0
+        self.latency_total = 0
+        self.latency_max   = 0
+        self.over_budget   = 0
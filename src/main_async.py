@@ -0,0 +1,260 @@
+""" The clock firmware as cooperating asyncio tasks
+
+Each job main_new.main() does in turn around its loop runs as its own task, so a slow job only delays the
+others while it is actually busy rather than once per loop:
+
+    Task    Priority  Runs
+    pulse   0         On every RTC tick, and continuously while fast-stepping
+    rtc     1         Every RTC_PERIOD seconds - publishes a snapshot of the clock state on each tick
+    ui      2         Every UI_PERIOD seconds - buttons, backlight and screen
+    ntp     3         Once an hour, or every five minutes until it succeeds
+    wifi    3         Every WIFI_PERIOD seconds - the radio is only up around each NTP sync and web request
+    web     3         Starts the web server once there is a network connection
+
+asyncio has no pre-emption, so priorities are kept by convention: the pulse task runs as soon as a tick is
+published, and priority 3 tasks wait for the pulse engine to be quiet (i.e. not fast-stepping) before doing
+anything which might block for long. Tasks share state only through the snapshot tuple published by the rtc
+task and the Firmware attributes it is built from.
+
+How late each task wakes up is recorded as an instrument section ("late <task>"), so the scheduling can be
+measured with instrument.report().
+"""
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio  # Host CPython
+
+from utime import ticks_ms, ticks_us, ticks_add, ticks_diff
+import gc
+
+import clockcore
+import dgui
+import settings
+import wifi
+import ntptime
+import instrument
+import steplog
+import renderer
+import radio
+
+# Task periods in seconds
+RTC_PERIOD  = 0.01
+UI_PERIOD   = 0.05
+WIFI_PERIOD = 1
+
+class Firmware(clockcore.ClockCore):
+    def __init__(self, config_filename = "clock.json"):
+        """ Initialise the hardware and the state shared between the tasks - what moves the hands is brought up by
+        ClockCore, as it is for main_new
+
+        Args:
+            config_filename (string): The clock configuration file
+        """
+        super().__init__(config_filename)
+        config        = self.clock.pc.config
+
+        self.ui       = dgui.DGUI(self.clock.hands_tm, config.get("Dim", 60), config.get("Off", 300))
+        self.frames   = renderer.RenderScheduler(self.ui)
+        self.network  = wifi.wifi(settings.load_settings("wifi.json"), tod = self.tod)
+        self.ntp      = settings.load_settings("ntp.json")
+        self.radio    = radio.RadioScheduler(self.network, self.ntp.get("Lead", 30), self.ntp.get("Grace", 60))
+        self.next_ntp = self.tod.utc + 120  # First sync attempt after 120 seconds
+        self.ntp_sync = False
+        self.web      = None
+
+        # Pulse timings can be retuned by changing clock.json, without a restart
+        settings.watch("clock.json", self.clock.pc.retune)
+
+        # Shared state
+        self.snapshot = None                # (now_tm, hands_tm, clock_mode, ntp_sync) as of the last tick
+        self.tick     = asyncio.Event()     # Set by the rtc task on each tick, cleared by the pulse task
+        self.quiet    = asyncio.Event()     # Set whilst low priority tasks may block
+        self.tick_at  = ticks_us()          # When the last tick was published
+
+        self._late    = {}
+
+    def _woke(self, task, expected):
+        """ Record how late a task woke up
+
+        Args:
+            task     (string): The task name
+            expected (int)   : ticks_us when it should have woken
+        """
+        if instrument.enabled:
+            if task not in self._late:
+                self._late[task] = instrument.section("late " + task)
+            self._late[task].record(expected, max(0, ticks_diff(ticks_us(), expected)))
+
+    def publish(self):
+        """ Take a snapshot of the clock state for the UI and web server
+        """
+        self.snapshot = (tuple(self.tod.tm), self.clock.hands_tm, self.clock.mode, self.ntp_sync)
+        self.frames.submit(self.snapshot)
+
+    async def pulse_task(self):
+        """ Priority 0 - move the hands, and save where they are whenever they move unless the supply is sensed
+        """
+        clock  = self.clock
+        saved  = clock.hands
+        supply = self.supply
+        while True:
+            if supply is not None:
+                supply.poll()                   # So a failure is committed before the next step, even a fast one
+            if (self.ui.mode == 'Normal' or self.ui.mode == 'Set') and (supply is None or not supply.failed):
+                clock.move(self.tod.secs)       # Blocks for the length of the pulse - nothing else can run anyway
+            if steplog.log is not None:
+                steplog.log.poll()              # Written to flash after the pulse, not during it
+
+            if clock.hands != saved:
+                if self.supply is None:
+                    self.save_hands(False)      # Otherwise saved as the power fails
+                saved = clock.hands
+                self.publish()
+
+            if clock.mode == "Fast":
+                self.quiet.clear()
+                await asyncio.sleep(0)          # Let the rtc and ui tasks in between fast steps
+            else:
+                self.quiet.set()
+                if clock.mode == "Run":
+                    gc.collect()                # Most of a second before the next pulse
+                await self.tick.wait()
+                self.tick.clear()
+                self._woke("pulse", self.tick_at)
+
+    async def rtc_task(self):
+        """ Priority 1 - follow the RTC, and wake the pulse task on each tick
+        """
+        period_us = int(RTC_PERIOD * 1000000)
+        while True:
+            expected = ticks_add(ticks_us(), period_us)
+            await asyncio.sleep(RTC_PERIOD)
+            self._woke("rtc", expected)
+
+            if self.supply is not None:
+                self.supply.poll()
+
+            if self.tod.poll():
+                self.tick_at = ticks_us()
+                self.publish()
+                self.tick.set()
+                self.led_state()
+                if self.tod.tm[5] == 30:
+                    self.minutely()
+
+    async def ui_task(self):
+        """ Priority 2 - buttons, backlight and screen
+        """
+        period_us = int(UI_PERIOD * 1000000)
+        while True:
+            expected = ticks_add(ticks_us(), period_us)
+            await asyncio.sleep(UI_PERIOD)
+            self._woke("ui", expected)
+
+            if self.ui.handle_buttons():        # Adjust hands was selected, so copy from UI to the clock
+                self.clock.hands_reset(self.ui.time_to_set)
+                self.save_hands()
+                self.tick.set()
+            self.frames.busy = self.clock.mode == "Fast"
+            self.ui.power.poll()
+            self.frames.poll()
+
+    async def wifi_task(self):
+        """ Priority 3 - power the radio up when the network is needed, and keep it connected whilst it's up
+        """
+        while True:
+            await asyncio.sleep(WIFI_PERIOD)
+            await self.quiet.wait()
+            self.radio.poll(self.tod.utc, self.next_ntp)
+
+    async def ntp_task(self):
+        """ Priority 3 - periodically re-sync the DS3231 to NTP
+        """
+        while True:
+            # Wait for the sync time, and then up to a minute more for the radio to connect
+            while self.tod.utc < self.next_ntp or (not self.network.connected and self.tod.utc < self.next_ntp + 60):
+                await asyncio.sleep(WIFI_PERIOD)
+            await self.quiet.wait()
+            self.radio.activity(self.tod.utc)
+
+            print("Querying {}".format(self.ntp['NTP']))
+            (ntp_time, millis, ticks) = ntptime.ntp_query(self.ntp['NTP'])
+            if ntp_time is None:
+                self.ntp_sync = False
+                self.next_ntp = self.tod.utc + 321  # Just a bit more than five minutes
+                print("NTP sync failed at  {}".format(self.tod.tm))
+                continue
+
+            # Set the DS3231 on the next whole second, as measured from when the NTP reply arrived - if this task
+            # wakes too late for that (a pulse or a slow query held it up), try again with a fresh query rather than
+            # set the time part of a second out
+            set_at = ticks_add(ticks, 1000 - millis)
+            wait   = ticks_diff(set_at, ticks_ms())
+            if wait > 0:
+                await asyncio.sleep(wait / 1000)
+            tick_err = ticks_diff(ticks_ms(), set_at)
+            if not -100 < tick_err < 100:   # Allow a 100ms "buffer"
+                self.next_ntp = self.tod.utc + 321  # Just a bit more than five minutes
+                print("Missed the second by {}ms - trying again at {}".format(tick_err, self.next_ntp))
+                continue
+            self.ds.rtc   = ntp_time + 1
+            self.tod.sync(False)
+            self.ntp_sync = True
+            print("Set DS RTC {} ({}) @ {}".format(ntp_time + 1, self.ds.rtc_tm, ticks_ms()))
+            self.next_ntp = ntp_time + 3654     # Just a bit less than once an hour
+
+    async def web_task(self):
+        """ Priority 3 - run the web server, once there is a network to serve
+        """
+        while True:
+            await asyncio.sleep(WIFI_PERIOD)
+            if self.web is not None and self.web.IsRunning:
+                continue
+            if self.network.get_ip_addr() is None:
+                continue
+            await self.quiet.wait()
+
+            from MicroWebSrv2 import MicroWebSrv2   # Only loaded once it can be used
+            import webroutes                        # Registers the clock's routes
+            import memaudit
+            webroutes.firmware = self
+            memaudit.SAMPLE    = self.clock.pc.config.get("MemAudit", 0) # Measure every Nth request, if set
+            self.web = MicroWebSrv2()
+            self.web.SetEmbeddedConfig()
+            self.web.NotFoundURL = '/'
+            self.web.OnLogging   = self._web_log
+            self.web.StartManaged()                 # Requests are handled on the server's own thread
+
+    def _web_log(self, microWebSrv2, msg, msgType):
+        """ Web server log messages - every response is logged, so use them to keep the radio up whilst the
+        server is being used
+        """
+        if msgType == microWebSrv2.DEBUG:
+            self.radio.activity(self.tod.utc)
+        else:
+            print(msg)
+
+    async def run(self):
+        """ Start every task, highest priority first, and run until one of them fails
+        """
+        tasks = [ asyncio.create_task(self.pulse_task()),
+                  asyncio.create_task(self.rtc_task()),
+                  asyncio.create_task(self.ui_task()),
+                  asyncio.create_task(self.ntp_task()),
+                  asyncio.create_task(self.wifi_task()),
+                  asyncio.create_task(self.web_task()) ]
+        self.led.value(0)
+        await asyncio.gather(*tasks)
+
+def main():
+    fw = Firmware()
+    try:
+        asyncio.run(fw.run())
+    except KeyboardInterrupt:
+        if fw.web is not None:
+            fw.web.Stop()
+        fw.shutdown(fw.ui)
+
+if __name__ == "__main__":
+    main()
@@ -1,97 +1,151 @@
-from machine import I2C, Pin, RTC
-from utime import sleep_ms, time, mktime, ticks_ms, ticks_add, ticks_diff
-import ujson
-import display
+from utime import ticks_ms, ticks_add, ticks_diff
 import gc
 
-import ds3231
-import dgclock
-import dgui
-import settings
-import wifi
-import ntptime
-
-def align_clocks(rtc, ds):
-    if rtc.synced():
-        print("RTC synced    : DS {} <- RTC {}".format(ds.rtc_tm, rtc.now())) # DEBUG
-        ds.rtc_tm   = rtc.now() # Copy from RTC to DS if the RTC is NTP synced
-    else:
-        print("RTC non-sync  : DS {} -> RTC {}".format(ds.rtc_tm, rtc.now())) # DEBUG
-        rtc.init(ds.rtc_tm) # Otherwise copy from the DS to the RTC
+import boottime
+import clockcore
+import alloccount
+import steplog
 
-def main():
-    # LED output - turn it on whilst we're booting...
-    led = Pin(2, Pin.OUT)
-    led.value(1)
-
-    # Initialise the DS3231 battery-backed RTC
-    i2c = I2C(0, scl=22, sda=21)
-    ds  = ds3231.DS3231(i2c)
-    print("DS3231 time   : {}".format(ds.rtc_tm))
-    print("Hands position: {}".format(ds.alarm1_tm))
-
-    # Initialise the mechanical clock
-    clock = dgclock.DGClock("clock.json", ds.alarm1) # Read the config file, and initialise hands at last known position
+# Boot stages - only what is needed to move the hands is done before the loop starts, and the rest is brought
+# up one stage per second, straight after that second's pulse. Each stage imports its own modules.
+STAGE_CLOCK   = 0 # Hands moving
+STAGE_DISPLAY = 1 # Display and buttons
+STAGE_NETWORK = 2 # Settings, WiFi and NTP
+STAGE_READY   = 3 # Everything running
 
-    # Intialise the display
-    ui = dgui.DGUI(clock.hands_tm)
-
-    # Read the WiFi settings
-    wifi_settings = settings.load_settings("wifi.json")
-    network       = wifi.wifi(wifi_settings)
-
-    # Read the NTP server to use
-    ntp_settings  = settings.load_settings("ntp.json")
-    next_ntp_sync = ds.rtc + 120 # First sync attempt after 120 seconds
+def main():
+    boottime.mark("main")
+
+    # Only what moves the hands is brought up before the loop starts - the same as main_async does
+    core   = clockcore.ClockCore("clock.json")
+    clock  = core.clock
+    tod    = core.tod
+    ds     = core.ds
+    supply = core.supply
+    boottime.mark("clock")
+
+    # Everything else starts later - see STAGE_*
+    boot_stage    = STAGE_CLOCK
+    ui            = None
+    ntp_sync      = False
+    next_ntp_sync = tod.utc + 120 # First sync attempt after 120 seconds
     set_time      = 0            # Resetting the DS RTC not needed
 
+    saved_hands = clock.hands
+    idle_allocs = alloccount.AllocCounter("Idle iteration")
+    tick_allocs = alloccount.AllocCounter("Tick iteration")
+
     try:
         while True:
-            # Tell the UI what the time is
-            ui.now_tm = ds.rtc_tod_tm
-            now       = ds.rtc_tod
+            idle_allocs.begin()
+            tick_allocs.begin()
+            chores = False  # Set if this iteration did the once a minute housekeeping or an NTP query
+
+            # What time is it?
+            ticked    = tod.poll()
+            now       = tod.secs
+            old_hands = clock.hands
+
+            # If the supply is sensed, the hand state is saved as it fails - and then the hands stay where they were
+            # saved until it comes back, when they catch up as after any other stop
+            if supply is not None:
+                supply.poll()
 
             # Move the clock to show current TOD unless stopped
-            if ui.mode == 'Normal' or ui.mode == 'Set':
+            if (ui is None or ui.mode == 'Normal' or ui.mode == 'Set') and (supply is None or not supply.failed):
                 clock.move(now)
+                if clock.hands != old_hands and ui is not None:
+                    sleeper.pulsed(clock.pc.timer.started)
+
+            # Otherwise update the non-volatile copy of the hand position whenever it changes
+            if supply is None and clock.hands != saved_hands:
+                core.save_hands(False) # Alarm 1 every step, the EEPROM journal only now and again
+                saved_hands = clock.hands
+
+            # Write the step log to flash if a block is due - never in the middle of a pulse
+            if steplog.log is not None:
+                steplog.log.poll()
+
+            # Show the clock mode on the LED
+            core.led_state()
+
+            # Bring up the next boot stage straight after a pulse, so it has most of a second to do it in
+            if boot_stage < STAGE_READY and ticked:
+                boot_stage += 1
+                if boot_stage == STAGE_DISPLAY:
+                    # Intialise the display - it is drawn from snapshots of the clock state at a limited frame rate, either
+                    # from this loop or from its own thread (frames.start_thread()). Rendering stops while the backlight is off.
+                    import dgui
+                    import renderer
+                    import lowpower
+                    ui     = dgui.DGUI(clock.hands_tm, clock.pc.config.get("Dim", 60), clock.pc.config.get("Off", 300))
+                    frames = renderer.RenderScheduler(ui)
+
+                    # With nobody looking and the radio off, light sleep between pulses (if the port supports it)
+                    light_sleep = clock.pc.config.get("Sleep", False)
+                    sleeper     = lowpower.LightSleeper(tod, ui.buttons)
+                    boottime.mark("display")
+
+                elif boot_stage == STAGE_NETWORK:
+                    import settings
+                    import wifi
+                    import ntptime
+                    import radio
+
+                    # Read the WiFi settings and the NTP server to use
+                    network      = wifi.wifi(settings.load_settings("wifi.json"), tod = tod)
+                    ntp_settings = settings.load_settings("ntp.json")
+
+                    # The radio is only powered up around each NTP sync
+                    radio_sched  = radio.RadioScheduler(network, ntp_settings.get("Lead", 30), ntp_settings.get("Grace", 60))
+
+                    # Pulse timings can be retuned by changing clock.json, without a restart
+                    settings.watch("clock.json", clock.pc.retune)
+                    boottime.mark("network")
 
-            # Update the non-volatile copy of the hand position
-            ds.alarm1_tm  = clock.hands_tm
-            sleep_ms(10) # Allow time for this to complete - DS3231 write can fail otherwise
-
-            # LED states
-            if clock.mode == "Run" and ui.now_tm[3] == 22 and ui.now_tm[4] == 0:
-                # Run mode  - on at 22:00:00 until 22:01:00
-                led.value(1)
-            elif clock.mode == "Wait":
-                # Wait mode - on
-                led.value(1)
-            elif clock.mode == "Fast" and clock.hands_tm[5] % 2 == 0:
-                # Fast mode - on for even seconds
-                led.value(1)
-            else:
-                # Otherwise off
-                led.value(0)
-
-            # Tell the UI where the clock thinks the hands are
-            ui.hands_tm   = clock.hands_tm
-            ui.clock_mode = clock.mode
-
-            # Check that we have a WiFi connection, and attempt to reconnect if it's dropped
-            network.connect()
+                else:
+                    # Garbage collection is done just after each pulse, but in case that isn't often enough (e.g. whilst
+                    # fast-stepping) let the heap fill to a quarter of what's free now before an automatic collection
+                    gc.collect()
+                    try:
+                        gc.threshold(gc.mem_free() // 4)
+                    except AttributeError:
+                        pass # Not supported by this port
+                    boottime.mark("ready")
+                    ui.boot_ms = boottime.total()
+                    boottime.report()
+
+            if boot_stage < STAGE_READY:
+                continue
+
+            # Tell the UI what the time is and where the clock thinks the hands are
+            if ticked or clock.hands != old_hands:
+                frames.submit((tuple(tod.tm), clock.hands_tm, clock.mode, ntp_sync))
+            frames.busy = clock.mode == "Fast"
+
+            # Bring the radio up if the network will be needed soon, and keep it connected whilst it's up
+            online = radio_sched.poll(tod.utc, next_ntp_sync)
 
             # Handle any button presses
             if ui.handle_buttons():  # Adjust hands was selected, so copy from UI to the clock
                 clock.hands_reset(ui.time_to_set)
+                core.save_hands()
+
+            # Dim the backlight if nobody is using the clock, and update the screen if a frame is due
+            ui.power.poll()
+            frames.poll()
 
-            # Update the screen
-            ui.update_screen()
+            # Pick up any settings files changed behind our back once a minute, and note the temperature for the step log
+            if ticked and tod.tm[5] == 30:
+                core.minutely()
+                chores = True
 
-            # Periodically re-sync the clocks to NTP
-            if ds.rtc > next_ntp_sync:
+            # Periodically re-sync the clocks to NTP, giving the network a minute to connect
+            if tod.utc > next_ntp_sync and (online or tod.utc > next_ntp_sync + 60):
+                radio_sched.activity(tod.utc)
+                chores = True
                 print("Querying {}".format(ntp_settings['NTP']))
                 (ntp_time, millis, ticks) = ntptime.ntp_query(ntp_settings['NTP'])
-                old_time                = ds.rtc
                 if ntp_time is not None:
                     #ds.rtc        = ntp_time        # Copy the received time into the RTC as quickly as possible to minimise error
 
@@ -105,17 +159,16 @@ def main():
                     next_ntp_sync = ntp_time + 3654 # Just a bit less than once an hour
                     #print("Sync (disabled) RTC to NTP - {} (delta {})".format(ds.rtc_tod_tm, old_time - ntp_time))
                 else:
-                    ui.ntp_sync   = False
-                    next_ntp_sync = ds.rtc + 321 # Just a bit more than five minutes
-                    print("NTP sync failed at  {}".format(ui.now_tm))
-            else:
-                gc.collect() # Don't waste time garbage collecting if we're also setting the clock
+                    ntp_sync      = False
+                    next_ntp_sync = tod.utc + 321 # Just a bit more than five minutes
+                    print("NTP sync failed at  {}".format(tod.tm))
 
             if set_time > 0:
                 tick_err = ticks_diff(ticks_ms(), set_at_ticks)
                 if -100 < tick_err and tick_err < 100: # Allow a 100ms "buffer"
                     ds.rtc = set_time
-                    ui.ntp_sync   = True
+                    tod.sync(False)
+                    ntp_sync      = True
                     print("Set DS RTC {} ({}) @ {}".format(set_time, ds.rtc_tm, ticks_ms()))
                     set_time = 0
                 elif tick_err > 100: # Missed - try again on the next second
@@ -125,11 +178,29 @@ def main():
                 else:
                     print("Tick error {}".format(tick_err))
 
+            # Nothing in an iteration where the time didn't change should allocate any memory. An iteration which
+            # made a normal pulse allocates the UI snapshot (three tuples) - anything more shows up as extra bytes here
+            if set_time == 0:
+                if not ticked:
+                    idle_allocs.end()
+                elif clock.mode == "Run" and not chores:
+                    tick_allocs.end()
+
+            # A normal pulse has just finished, so there's most of a second before the next one - collect garbage now
+            if clock.mode == "Run" and clock.hands != old_hands:
+                gc.collect()
+                if clock.hands % 60 == 0: # Report once a minute
+                    idle_allocs.report()
+                    idle_allocs.reset()
+                    tick_allocs.report()
+                    tick_allocs.reset()
+
+            # Nothing to do until the next second edge
+            sleeper.poll(light_sleep and clock.mode == "Run" and ui.mode == "Normal" and not ui.power.visible
+                         and not radio_sched.up and set_time == 0)
+
     except KeyboardInterrupt:
-        # Try to relinquish the I2C bus
-        print("Hands left at : {}".format(ds.alarm1_tm))
-        i2c.deinit()
-        ui.tft.deinit()
+        core.shutdown(ui)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
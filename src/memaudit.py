@@ -0,0 +1,174 @@
+""" Heap usage audit for the clock's objects, clock steps and web requests
+
+Usage at the REPL:
+    import memaudit
+    memaudit.audit_step(clock)           # Bytes allocated per clock step
+    memaudit.report()
+    memaudit.check()                     # Raises RuntimeError if anything is over budget
+
+Every web route (see webroutes) is wrapped with @memaudit.per_request, and measured on every SAMPLE-th request if
+SAMPLE is set - main_async sets it from "MemAudit" in clock.json. Every measurement is checked against its budget
+as it is recorded, and the first one over budget is reported. A measured request over budget fails, so the server
+logs it as an error from its route.
+
+The classes which make up the clock's long-lived state declare __slots__. CPython then keeps no dict per
+instance, so host measurements of object_size() come out closer to the device; MicroPython ignores the
+declaration, where it only lists each class's complete state.
+"""
+
+import gc
+
+# Regression budgets in bytes - check() fails if a measured average rises above these
+BUDGETS = { "step":    128,    # One PulseClock step (the per-minute debug record string is the only expected allocation)
+            "request": 8192 }  # One web request handled by a wrapped route
+
+SAMPLE    = 0  # Measure every SAMPLE-th wrapped web request - 0 for none
+
+_results  = {} # Name -> [count, total bytes, max bytes, measurements over budget]
+_requests = 0  # Wrapped web requests seen
+
+def measure(func, *args):
+    """ Measure how much heap a call allocates. Automatic garbage collection is disabled during the call so
+    that the measurement isn't disturbed.
+
+    Args:
+        func (function): What to call
+        args           : Arguments to pass to it
+
+    Returns:
+        (int, result): Bytes allocated, and whatever func returned
+    """
+    gc.collect()
+    gc.disable()
+    try:
+        before = gc.mem_alloc()
+        result = func(*args)
+        after  = gc.mem_alloc()
+    finally:
+        gc.enable()
+    return (after - before, result)
+
+def record(name, allocated):
+    """ Add a measurement to the results
+
+    Args:
+        name      (string): What was measured
+        allocated (int)   : Bytes allocated
+
+    Returns:
+        bool: True if the measurement is over budget
+    """
+    if name not in _results:
+        _results[name] = [0, 0, 0, 0]
+    entry     = _results[name]
+    entry[0] += 1
+    entry[1] += allocated
+    if allocated > entry[2]:
+        entry[2] = allocated
+
+    budget = BUDGETS.get(name)
+    if budget is not None and allocated > budget:
+        entry[3] += 1
+        if entry[3] == 1:
+            print("Memory budget exceeded: {} {} bytes > budget {}".format(name, allocated, budget))
+        return True
+    return False
+
+def object_size(name, factory, *args):
+    """ Measure how much heap creating an object takes
+
+    Args:
+        name    (string)  : What is being measured - e.g. the class name
+        factory (function): Called with args to create the object
+
+    Returns:
+        object: The object which was created, so it can be kept or audited further
+    """
+    (allocated, obj) = measure(factory, *args)
+    record(name, allocated)
+    return obj
+
+def audit_step(clock, steps = 10):
+    """ Measure the bytes allocated by stepping the clock. The hands WILL move - through the DGClock, so it still
+    knows where they are, and the main loop waits for the time to catch up with them afterwards.
+
+    Args:
+        clock (DGClock): The clock to step
+        steps (int)    : How many steps to measure
+    """
+    for _ in range(steps):
+        record("step", measure(clock.move, clock.hands + 1)[0])
+
+def per_request(handler):
+    """ Decorator for MicroWebSrv2 route handlers which measures the bytes allocated by every SAMPLE-th request.
+    A measured request runs a collection and holds off automatic collection for every thread while it runs, and
+    counts what the other threads allocate meanwhile too - so leave SAMPLE at 0 except whilst auditing.
+
+    Args:
+        handler (function): The route handler
+
+    Raises:
+        RuntimeError: From a measured request which allocated more than the "request" budget - once its handler
+                      has returned, so the response has been sent
+    """
+    def wrapper(microWebSrv2, request, *args):
+        global _requests
+        _requests += 1
+        if not SAMPLE or _requests % SAMPLE:
+            return handler(microWebSrv2, request, *args)
+        (allocated, result) = measure(handler, microWebSrv2, request, *args)
+        if record("request", allocated):
+            raise RuntimeError("Memory budget exceeded: request {} bytes > budget {}".format(allocated,
+                                                                                            BUDGETS["request"]))
+        return result
+    return wrapper
+
+def results():
+    """ Collect the results - e.g. to return from a web endpoint
+
+    Returns:
+        dict: Name -> count, mean, max and budget (None if there isn't one), plus the current heap usage
+    """
+    summary = {}
+    for name in _results:
+        (count, total, largest, over) = _results[name]
+        summary[name] = { "count":  count,
+                          "mean":   total // count if count else 0,
+                          "max":    largest,
+                          "budget": BUDGETS.get(name),
+                          "over":   over }
+    gc.collect()
+    summary["heap"] = { "alloc": gc.mem_alloc(), "free": gc.mem_free() }
+    return summary
+
+def report():
+    """ Print the results at the REPL
+    """
+    print("{:16s} {:>6s} {:>8s} {:>8s} {:>8s}".format("Measured", "Count", "Mean", "Max", "Budget"))
+    for name in _results:
+        (count, total, largest, over) = _results[name]
+        budget = BUDGETS.get(name)
+        print("{:16s} {:6d} {:8d} {:8d} {:>8s}".format(name, count, total // count if count else 0, largest,
+                                                       "-" if budget is None else str(budget)))
+    gc.collect()
+    print("Heap: {} allocated, {} free".format(gc.mem_alloc(), gc.mem_free()))
+
+def reset():
+    """ Clear the results
+    """
+    _results.clear()
+
+def check():
+    """ Fail if any measured average is over its budget
+
+    Raises:
+        RuntimeError: Listing every measurement which is over budget
+    """
+    failures = []
+    for name in BUDGETS:
+        if name in _results and _results[name][0] > 0:
+            mean = _results[name][1] // _results[name][0]
+            if mean > BUDGETS[name]:
+                failures.append("{} {} bytes > budget {}".format(name, mean, BUDGETS[name]))
+    if failures:
+        raise RuntimeError("Memory budget exceeded: " + ", ".join(failures))
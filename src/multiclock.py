@@ -0,0 +1,182 @@
+""" Drive several slave pulse clock movements from one controller
+
+Each movement (channel) has its own H-bridge pins, sensor, hand position and saved state. Pulses for all of
+the channels are interleaved on one shared schedule so that no more than a configured number of H-bridges
+are ever driving their motors at the same time, and channels which are behind all catch up together.
+"""
+
+from utime import ticks_add, ticks_diff
+
+import dgclock
+import pulsetimer
+import settings
+
+class HandsFile:
+    def __init__(self, filename, save_every = 60):
+        """ Persist a channel's hand position in a small file on flash
+
+        Args:
+            filename   (string): File holding the hand position
+            save_every (int)   : Minimum number of seconds of hand movement between saves, to limit flash wear
+        """
+        self.filename   = filename
+        self.save_every = save_every
+        self.saved      = None
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r}, {!r})".format(self.__class__.__name__, self.filename, self.save_every)
+
+    def load(self):
+        """ Read the saved hand position
+
+        Returns:
+            int: Hand position in seconds from 12:00:00, or 0 if nothing has been saved yet
+        """
+        try:
+            with open(self.filename) as fd:
+                self.saved = int(fd.read())
+        except Exception as e:
+            print(self.filename + ": read error: " + str(e))
+            self.saved = 0
+        return self.saved
+
+    def save(self, hands, force = False):
+        """ Save the hand position if it has moved far enough since the last save
+
+        Args:
+            hands (int) : Hand position in seconds from 12:00:00
+            force (bool): Save even if the hands have only moved a little
+        """
+        if hands == self.saved:
+            return
+        if not force and self.saved is not None and (hands - self.saved) % 43200 < self.save_every:
+            return
+        try:
+            with open(self.filename, "w") as fd:
+                fd.write(str(hands))
+            self.saved = hands
+        except Exception as e:
+            print(self.filename + ": write error: " + str(e))
+
+class MultiClock:
+    def __init__(self, config_filename):
+        """ Initialise all the channels described by the config file
+
+        Args:
+            config_filename (string): Name of the file to read. The top level holds the shared pulse timings,
+                                      "Budget" (the maximum number of motors driven at once) and a list of
+                                      "Channels", each of which holds the pins and "State" file for one movement
+                                      and may override any of the shared timings.
+        """
+        config = settings.load_settings(config_filename)
+
+        self.budget   = config.get("Budget", 1)
+        self.timer    = pulsetimer.PulseTimer(config.get("Spin", 500))
+        self.channels = []
+        self.stores   = []
+
+        for channel_config in config["Channels"]:
+            clock_settings = {}
+            for key in config:
+                if key != "Channels":
+                    clock_settings[key] = config[key]
+            for key in channel_config:
+                clock_settings[key] = channel_config[key]
+            clock_settings["Channel"] = len(self.channels) # Keeps each movement's steps apart in the step log
+
+            store = HandsFile(clock_settings["State"], clock_settings.get("SaveEvery", 60))
+            self.stores.append(store)
+            self.channels.append(dgclock.DGClock(config_filename, store.load(), clock_settings))
+
+        # Preallocated per-channel schedule state
+        count          = len(self.channels)
+        self.steps     = [None] * count  # Step type chosen by plan() for each channel
+        self.active    = [-1] * self.budget  # Channel being driven in each current-budget slot
+        self.brake_at  = [0] * self.budget   # Deadline at which each slot's drive pulse ends
+        self.mode      = "Wait"
+
+        # Every channel steps once a second, one budget's worth of drive pulses after another
+        rounds = (count + self.budget - 1) // self.budget
+        if rounds * config.get("Pulse", 0) + config.get("Stop", 0) > 1000:
+            print("Budget {} is too small to step {} channels every second".format(self.budget, count))
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r} channels, budget {!r})".format(self.__class__.__name__, len(self.channels), self.budget)
+
+    def __len__(self):
+        return len(self.channels)
+
+    def move(self, wanted_time):
+        """ Move every channel one step toward the given time, interleaving the pulses so that no more than
+        the budgeted number of motors are driven at once
+
+        Args:
+            wanted_time (int): The time the clocks should be displaying, in seconds
+        """
+        # Work out which channels need to move
+        for i in range(len(self.channels)):
+            self.steps[i] = self.channels[i].plan(wanted_time)
+
+        # Drive the pulses - start a pulse whenever a budget slot is free, and free the slot when its drive ends
+        now      = self.timer.start()
+        finished = now
+        nxt      = 0
+        while True:
+            # Fill any free slots with the next channels that need to step
+            for slot in range(self.budget):
+                if self.active[slot] >= 0:
+                    continue
+                while nxt < len(self.channels) and self.steps[nxt] is None:
+                    nxt += 1
+                if nxt >= len(self.channels):
+                    break
+                pulse                = self.channels[nxt].pc.pulse_start(self.steps[nxt] == "F")
+                self.active[slot]    = nxt
+                self.brake_at[slot]  = ticks_add(now, pulse * 1000)
+                nxt                 += 1
+
+            # Find the drive pulse which ends first
+            first = -1
+            for slot in range(self.budget):
+                if self.active[slot] >= 0 and (first < 0 or ticks_diff(self.brake_at[slot], self.brake_at[first]) < 0):
+                    first = slot
+            if first < 0:
+                break # Nothing left driving or waiting
+
+            # Brake that motor and hand its slot on to the next channel
+            now     = self.brake_at[first]
+            self.timer.wait_until(now)
+            channel = self.active[first]
+            stop    = self.channels[channel].pc.pulse_brake(self.steps[channel] == "F")
+            if ticks_diff(ticks_add(now, stop * 1000), finished) > 0:
+                finished = ticks_add(now, stop * 1000)
+            self.active[first] = -1
+
+        # Let the last motors finish braking before anything is pulsed again
+        if finished != now:
+            self.timer.wait_until(finished)
+
+        # Record the new hand positions
+        self.mode = "Run"
+        for i in range(len(self.channels)):
+            channel = self.channels[i]
+            channel.stepped(self.steps[i])
+            self.stores[i].save(channel.hands, channel.mode == "Wait") # Always save once the hands stop
+            if channel.mode == "Fast":
+                self.mode = "Fast"
+            elif channel.mode == "Wait" and self.mode != "Fast":
+                self.mode = "Wait"
+
+    def hands_reset(self, channel, value):
+        """ Tell one channel that its hands have been manually moved
+
+        Args:
+            channel (int): Index of the channel
+            value   (int): The new hand position in seconds from 12:00:00
+        """
+        self.channels[channel].hands_reset(value)
+        self.stores[channel].save(self.channels[channel].hands, True)
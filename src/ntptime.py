@@ -13,10 +13,13 @@ try:
 except:
     from time import ticks_ms as ticks_ms
 
+import instrument
+
 # NTP counts seconds from Jan 1st 1900, MicroPython uses 1970
 # (date(1970, 1, 1) - date(1900, 1, 1)).days * 24*60*60
 NTP_DELTA = 2208988800
 
+@instrument.timed("ntp_query")
 def ntp_query(host = "pool.ntp.org"):
     NTP_QUERY = bytearray(48)
     NTP_QUERY[0] = 0x1B
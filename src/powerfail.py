@@ -0,0 +1,103 @@
+""" Power-fail detection - save the hand state once, as the supply dies, rather than after every step
+
+The supply is sensed either on a GPIO (e.g. from a comparator or a divider on the unregulated input, low when
+the supply fails) or on an ADC pin compared against a level. The reservoir capacitor keeps the ESP32 running
+for some milliseconds after the input goes, which is plenty for one EEPROM page write. The commit callback is
+called once per failure, always from poll(): a GPIO's pin handler only notes the falling edge, because the commit
+writes over the shared I2C bus (whose lock isn't re-entrant, so taking it in a handler which interrupted a transfer
+would deadlock) and must not see the hand state part way through a step. So poll() must be called every loop
+iteration, outside any I2C transfer and step - the reservoir has to last the longest pulse plus the page write.
+While failed is set the firmware leaves the hands where they were saved, so the saved state stays right however
+long the reservoir lasts. If the supply comes back without a reset the detector re-arms itself, and the hands
+catch up on the time they were held as they would after any other stop.
+
+Usage:
+    supply = powerfail.PowerFail(save_hands, config["PowerFail"], config["PowerLevel"])
+    supply.poll()               # Every loop iteration
+"""
+
+import machine
+from machine import Pin
+from utime import ticks_ms, ticks_diff
+
+REARM_MS = 1000 # How long the supply must be back before another failure is looked for
+
+class PowerFail:
+    __slots__ = ('commit', 'pin', 'level', 'adc', 'edge', 'failed', 'failed_at', 'good_at', 'failures', 'commit_ms')
+
+    def __init__(self, commit, pin, level = None):
+        """ Start watching the supply
+
+        Args:
+            commit (function): Called with no arguments to save the state when the supply fails
+            pin    (int)     : GPIO which goes low when the supply fails, or the ADC pin if level is given
+            level  (int)     : Raw ADC reading below which the supply has failed, or None to use the pin as a GPIO
+        """
+        self.commit    = commit
+        self.level     = level
+        self.edge      = False  # A falling edge was seen by the pin handler, and poll() hasn't acted on it yet
+        self.failed    = False
+        self.failed_at = 0      # ticks_ms of the last failure
+        self.good_at   = None   # ticks_ms the supply came back after a failure, until re-armed
+        self.failures  = 0
+        self.commit_ms = 0      # How long the last commit took
+        if level is None:
+            self.adc = None
+            self.pin = Pin(pin, Pin.IN, handler = self._interrupt, trigger = Pin.IRQ_FALLING)
+        else:
+            self.pin = Pin(pin, Pin.IN)
+            self.adc = machine.ADC(self.pin)
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r}, {!r}, {!r})".format(self.__class__.__name__, self.commit, self.pin, self.level)
+
+    def _interrupt(self, pin):
+        if pin.value() == 0:
+            self.edge = True    # Committed by poll() - see above
+
+    @property
+    def supply_ok(self):
+        """ Whether the supply is currently good
+        """
+        if self.adc is None:
+            return self.pin.value() == 1
+        return self.adc.read() >= self.level
+
+    def fail(self):
+        """ The supply has failed - commit the state, unless it has already been committed for this failure. Not
+        for pin handlers - see above
+        """
+        if self.failed:
+            return
+        self.failed    = True
+        self.failed_at = ticks_ms()
+        self.good_at   = None
+        self.failures += 1
+        self.commit()
+        self.commit_ms = ticks_diff(ticks_ms(), self.failed_at)
+
+    def poll(self):
+        """ Check the supply, and commit the state if it has failed - call this every loop iteration
+        """
+        edge      = self.edge
+        self.edge = False
+        if edge or not self.supply_ok:
+            self.fail()
+            self.good_at = None
+        elif self.failed:
+            if self.good_at is None:
+                self.good_at = ticks_ms()
+            elif ticks_diff(ticks_ms(), self.good_at) >= REARM_MS:
+                print("Supply back after a {}ms dip".format(ticks_diff(self.good_at, self.failed_at)))
+                self.failed = False
+
+    def stats(self):
+        """ Failures seen without a reset, and how long the last commit took - e.g. to return from a web endpoint
+
+        Returns:
+            dict: Whether the supply is good, failures and the commit time in milliseconds
+        """
+        return { "supply_ok": self.supply_ok, "failed": self.failed, "failures": self.failures,
+                 "commit_ms": self.commit_ms }
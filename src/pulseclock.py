@@ -1,7 +1,18 @@
-from utime import sleep_ms
+from utime import ticks_add
 from machine import Pin
 
+import pulsetimer
+import instrument
+import steplog
+
+_SECT_STEP     = instrument.section("step")
+_SECT_FASTSTEP = instrument.section("faststep")
+
 class PulseClock:
+    __slots__ = ('config', 'pin_plus', 'pin_minus', 'pin_enable', 'sensor', 'sec_pos', 'timer', 'polarity',
+                 'edgecount', 'maxcount', 'mincount', 'countzero', 'whitephase', 'whitecount', 'record',
+                 'speed', 'channel', '_trailing')
+
     def __init__(self, config, second_hand_position):
         """ Initialise the pulse clock
 
@@ -15,6 +26,7 @@ class PulseClock:
         self.pin_enable = Pin(config['Enable'], Pin.OUT)
         self.sensor     = Pin(config["Sense"],  Pin.IN,  handler = self._sensorinterrupt, trigger = Pin.IRQ_RISING | Pin.IRQ_FALLING)
         self.sec_pos    = second_hand_position % 60
+        self.timer      = pulsetimer.PulseTimer(config.get("Spin", 500)) # Pin transitions are scheduled against ticks_us deadlines
 
         # Initialise the position sensor and error counters
         self.polarity   = 1
@@ -27,6 +39,8 @@ class PulseClock:
 
         self.record     = ""
         self.speed      = "S"
+        self.channel    = config.get("Channel", 0) # Step log channel - set by MultiClock for each movement
+        self._trailing  = self.pin_plus # Pin to release at the end of a pulse started with pulse_start()
         
         self.step()         # Ensure the mechanism is fully aligned not in some midway state
         
@@ -35,6 +49,19 @@ class PulseClock:
         """
         return "{}({!r})".format(self.__class__.__name__, self.pin_plus, self.pin_minus, self.pin_enable, self.config, self.sensor)
 
+    def retune(self, config):
+        """ Take new pulse timings from changed settings - the pins can't be changed without a restart
+
+        Args:
+            config (Settings): The new clock settings
+        """
+        for key in ("Pulse", "Stop", "Recover", "FastPulse", "FastDwell", "FastPulse2", "FastStop", "Spin"):
+            if key in config:
+                self.config[key] = config[key]
+        self.timer.spin_us = self.config.get("Spin", 500)
+        print("Pulse timings now {}/{} fast {}/{}".format(self.config["Pulse"], self.config["Stop"],
+                                                          self.config["FastPulse"], self.config["FastStop"]))
+
     def _sensorinterrupt(self, pin):
         """ Sensor interrupt routine
         Count the number of edges detected
@@ -53,9 +80,10 @@ class PulseClock:
         en.value(1)                    # Ensure the motor is enabled
         ld.value(1)                    # Set up the pulse
         tr.value(0)
-        sleep_ms(self.config["Pulse"])
-        tr.value(1)
-        sleep_ms(self.config["Stop"])
+        deadline = ticks_add(self.timer.start(), self.config["Pulse"] * 1000)
+        deadline = self.timer.transition(deadline, self.config["Stop"])
+        tr.value(1)                    # Actively stop the motor
+        self.timer.wait_until(deadline)
     
         #for _ in range(self.config["PulseCount"]):
         #    tr.value(0)
@@ -80,9 +108,10 @@ class PulseClock:
         en.value(1)                    # Ensure the motor is enabled
         ld.value(1)                    # Set up the pulse
         tr.value(0)
-        sleep_ms(self.config["FastPulse"])
-        tr.value(1)
-        sleep_ms(self.config["FastStop"])
+        deadline = ticks_add(self.timer.start(), self.config["FastPulse"] * 1000)
+        deadline = self.timer.transition(deadline, self.config["FastStop"])
+        tr.value(1)                    # Actively stop the motor
+        self.timer.wait_until(deadline)
 
         #en.value(1)                          # Ensure the motor is always enabled
         #ld.value(1)                          # Set up the pulse
@@ -101,15 +130,18 @@ class PulseClock:
         """ Update the internal hand position reporting - should ONLY be called when stepping the clock
         """
         (count, self.edgecount, state) = (self.edgecount, 0, self.sensor.value()) # Copy the count and then reset it - semi-atomic!
+        old_pos = self.sec_pos
+        log     = steplog.log
 
-        # Debug: construct a record and print it once per minute
-        if state == 1: # Recording seeing white
-            self.record += "-" # Use a dash for whites since it is easier to scan in the resulting log
+        # Debug: construct a record and print it once per minute - unless every step goes to the step log instead
+        if log is None:
+            if state == 1: # Recording seeing white
+                self.record += "-" # Use a dash for whites since it is easier to scan in the resulting log
 
-        if count < 10: # Record the number of pulses we got to get to this state
-            self.record += str(count)
-        else:
-            self.record += " "+str(count)+" "
+            if count < 10: # Record the number of pulses we got to get to this state
+                self.record += str(count)
+            else:
+                self.record += " "+str(count)+" "
 
         if count > self.maxcount:
             self.maxcount = count
@@ -161,12 +193,29 @@ class PulseClock:
         # Debugging for the hand correction algorithm
         #print("Second {}: {} edges, {}, white {}/{}".format(self.sec_pos, count, state, self.whitephase, self.whitecount))
 
+        if log is not None: # Any movement of the second hand position other than the one step is a correction
+            log.sensed(self.channel, count, state, (self.sec_pos - old_pos + 29) % 60 - 30, self.sec_pos)
+
         if self.sec_pos == 59: # Print the debugging at the top of each minute
-            print("Min/max pulses {}/{}: {}".format(self.mincount, self.maxcount, self.record))
+            if log is None:
+                print("Min/max pulses {}/{}: {}".format(self.mincount, self.maxcount, self.record))
             self.mincount = 100
             self.maxcount = 0
             self.record   = ""
 
+    def _logged(self, fast):
+        """ Tell the step log (if there is one) about the pulse about to be made - call after _update()
+
+        Args:
+            fast (bool): Fast step
+        """
+        log = steplog.log
+        if log is not None:
+            if fast:
+                log.pulsed(self.channel, True,  self.sec_pos % 2 == self.polarity, self.config["FastPulse"], self.config["FastStop"])
+            else:
+                log.pulsed(self.channel, False, self.sec_pos % 2 == self.polarity, self.config["Pulse"],     self.config["Stop"])
+
     def read_secondhand(self):
         """ Report where the second hand SHOULD be
         """
@@ -175,36 +224,83 @@ class PulseClock:
     def step(self):
         """ Step the clock forward by one second
         """
-        self._update()
+        with _SECT_STEP:
+            self._update()
 
-        if self.speed == "F":
-            self.speed   = "S"
-            self.record += self.speed
+            if self.speed == "F":
+                self.speed   = "S"
+                self.record += self.speed
+            self._logged(False)
 
-        if self.sec_pos % 2 == self.polarity: # Determine the polarity of the pulse based upon the nominal current clock position
-            self._dostep(self.pin_minus, self.pin_plus, self.pin_enable)
-            #print("Positive pulse - ", end='')
-        else:
-            self._dostep(self.pin_plus, self.pin_minus, self.pin_enable)
-            #print("Negative pulse - ", end='')
+            if self.sec_pos % 2 == self.polarity: # Determine the polarity of the pulse based upon the nominal current clock position
+                self._dostep(self.pin_minus, self.pin_plus, self.pin_enable)
+                #print("Positive pulse - ", end='')
+            else:
+                self._dostep(self.pin_plus, self.pin_minus, self.pin_enable)
+                #print("Negative pulse - ", end='')
         
 
     def faststep(self):
         """ Step the clock forward by one second
         """
+        with _SECT_FASTSTEP:
+            self._update()
+
+            if self.speed == "S":
+                self.speed   = "F"
+                self.record += self.speed
+            self._logged(True)
+
+            if self.sec_pos % 2 == self.polarity: # Determine the polarity of the pulse based upon the nominal current clock position
+                self._dofaststep(self.pin_minus, self.pin_plus, self.pin_enable)
+                #print("Positive fast pulse - ", end='')
+            else:
+                self._dofaststep(self.pin_plus, self.pin_minus, self.pin_enable)
+                #print("Negative fast pulse - ", end='')
+
+    def pulse_start(self, fast):
+        """ Start stepping the clock forward by one second, but don't wait for the pulse to finish.
+        Used when several clocks share one pulse schedule - the caller must call pulse_brake() once the
+        returned pulse time has elapsed.
+
+        Args:
+            fast (bool): Use the fast stepping timings
+
+        Returns:
+            int: How long the drive pulse should last in milliseconds
+        """
         self._update()
 
-        if self.speed == "S":
-            self.speed   = "F"
+        speed = "F" if fast else "S"
+        if self.speed != speed:
+            self.speed   = speed
             self.record += self.speed
+        self._logged(fast)
 
         if self.sec_pos % 2 == self.polarity: # Determine the polarity of the pulse based upon the nominal current clock position
-            self._dofaststep(self.pin_minus, self.pin_plus, self.pin_enable)
-            #print("Positive fast pulse - ", end='')
+            (ld, self._trailing) = (self.pin_minus, self.pin_plus)
         else:
-            self._dofaststep(self.pin_plus, self.pin_minus, self.pin_enable)
-            #print("Negative fast pulse - ", end='')
-        
+            (ld, self._trailing) = (self.pin_plus, self.pin_minus)
+
+        self.pin_enable.value(1)       # Ensure the motor is enabled
+        ld.value(1)                    # Set up the pulse
+        self._trailing.value(0)
+
+        return self.config["FastPulse"] if fast else self.config["Pulse"]
+
+    def pulse_brake(self, fast):
+        """ End the drive pulse started by pulse_start() and actively stop the motor
+
+        Args:
+            fast (bool): Use the fast stepping timings
+
+        Returns:
+            int: How long the motor should be left braking in milliseconds before it is pulsed again
+        """
+        self._trailing.value(1)
+
+        return self.config["FastStop"] if fast else self.config["Stop"]
+
     def test(self):
         self.edgecount = 0
 
@@ -0,0 +1,124 @@
+""" Deadline-based timing for the pulse clock motor drive
+"""
+
+from utime import sleep_ms, ticks_us, ticks_add, ticks_diff
+
+class PulseTimer:
+    def __init__(self, spin_us = 500, bucket_us = 100, buckets = 16):
+        """ Initialise the pulse timer
+
+        Args:
+            spin_us   (int): How long before each deadline to stop sleeping and start spinning
+            bucket_us (int): Width of each error histogram bucket in microseconds
+            buckets   (int): Number of histogram buckets - the last bucket collects everything larger
+        """
+        self.spin_us   = spin_us
+        self.bucket_us = bucket_us
+        self.histogram = [0] * buckets  # Count of transitions by lateness
+        self.early     = 0              # Transitions which happened before their deadline (should never happen)
+        self.count     = 0
+        self.total_us  = 0
+        self.max_us    = 0
+        self.last_us   = 0
+        self.started   = ticks_us()     # When the most recent sequence of transitions started
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r}, {!r}, {!r})".format(self.__class__.__name__, self.spin_us, self.bucket_us, len(self.histogram))
+
+    def start(self):
+        """ Start a new sequence of transitions
+
+        Returns:
+            int: A ticks_us timestamp to use as the first deadline
+        """
+        self.started = ticks_us()
+        return self.started
+
+    def wait_until(self, deadline):
+        """ Wait until the given deadline, sleeping for as long as possible then spinning for the last few hundred microseconds
+
+        Args:
+            deadline (int): The ticks_us time to wait for
+
+        Returns:
+            int: How late (in microseconds) we actually were
+        """
+        # Sleep for the bulk of the wait, leaving a margin for sleep_ms overrunning
+        remaining = ticks_diff(deadline, ticks_us())
+        if remaining > self.spin_us:
+            sleep_ms((remaining - self.spin_us) // 1000)
+
+        # Spin for the remainder
+        while ticks_diff(deadline, ticks_us()) > 0:
+            pass
+
+        error = ticks_diff(ticks_us(), deadline)
+        self._record(error)
+        return error
+
+    def transition(self, deadline, delay_ms):
+        """ Wait for a deadline then calculate the next one
+
+        Args:
+            deadline (int): The ticks_us time to wait for
+            delay_ms (int): How long after this deadline the next one should be
+
+        Returns:
+            int: The next deadline, measured from the intended (not the actual) time of this one so errors don't accumulate
+        """
+        self.wait_until(deadline)
+        return ticks_add(deadline, delay_ms * 1000)
+
+    def _record(self, error):
+        """ Add a timing error to the statistics
+
+        Args:
+            error (int): Lateness in microseconds
+        """
+        self.last_us = error
+        if error < 0:
+            self.early += 1
+            return
+
+        self.count    += 1
+        self.total_us += error
+        if error > self.max_us:
+            self.max_us = error
+
+        bucket = error // self.bucket_us
+        if bucket >= len(self.histogram):
+            bucket = len(self.histogram) - 1
+        self.histogram[bucket] += 1
+
+    def reset(self):
+        """ Clear all of the timing statistics
+        """
+        for i in range(len(self.histogram)):
+            self.histogram[i] = 0
+        self.early    = 0
+        self.count    = 0
+        self.total_us = 0
+        self.max_us   = 0
+        self.last_us  = 0
+
+    @property
+    def mean_us(self):
+        """ Average lateness of all transitions so far
+        """
+        if self.count == 0:
+            return 0
+        return self.total_us // self.count
+
+    def report(self):
+        """ Print the timing error histogram
+        """
+        print("Pulse timing: {} transitions, mean {}us, max {}us, early {}".format(self.count, self.mean_us, self.max_us, self.early))
+        for i in range(len(self.histogram)):
+            if self.histogram[i] == 0:
+                continue
+            if i == len(self.histogram) - 1:
+                print("  >={:5d}us: {}".format(i * self.bucket_us, self.histogram[i]))
+            else:
+                print("  {:5d}-{:5d}us: {}".format(i * self.bucket_us, (i + 1) * self.bucket_us - 1, self.histogram[i]))
@@ -0,0 +1,117 @@
+""" Duty-cycled WiFi - only power the radio up when the network is needed
+
+The clock needs the network for an NTP exchange about once an hour and for occasional configuration, so the
+radio is brought up shortly before each planned sync, held up for a grace period afterwards (and for as long
+as web clients keep using it), then powered down. This saves power and heat, and stops WiFi interrupts
+disturbing pulse timing.
+"""
+
+from array import array
+
+SESSIONS = 16 # Number of radio sessions remembered
+
+class RadioScheduler:
+    __slots__ = ('network', 'lead', 'grace', 'always', 'up', 'up_since', 'hold_until', '_started', '_lengths',
+                 '_pos', '_len', 'total_up')
+
+    def __init__(self, network, lead = 30, grace = 60, always = False):
+        """ Initialise the scheduler with the radio off
+
+        Args:
+            network (wifi)  : The connection manager
+            lead    (int)   : Seconds before a planned sync to bring the radio up, to allow time to connect
+            grace   (int)   : Seconds to keep the radio up after it was last used
+            always  (bool)  : Never power the radio down - e.g. whilst being configured
+        """
+        self.network    = network
+        self.lead       = lead
+        self.grace      = grace
+        self.always     = always
+        self.up         = False
+        self.up_since   = 0
+        self.hold_until = 0
+        self.total_up   = 0                         # Seconds the radio has been up, not counting this session
+
+        # Log of recent sessions
+        self._started   = array('l', [0] * SESSIONS)
+        self._lengths   = array('l', [0] * SESSIONS)
+        self._pos       = 0
+        self._len       = 0
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r}, {!r}, {!r}, {!r})".format(self.__class__.__name__, self.network, self.lead, self.grace,
+                                                    self.always)
+
+    def activity(self, now, seconds = None):
+        """ Keep the radio up for a while longer - e.g. after an NTP exchange or a web request
+
+        Args:
+            now     (int): UTC seconds
+            seconds (int): How long for, or the grace period if None
+        """
+        self.hold_until = max(self.hold_until, now + (self.grace if seconds is None else seconds))
+
+    def poll(self, now, next_sync):
+        """ Bring the radio up or down as needed, and keep it connected whilst it is up - call this often
+
+        Args:
+            now       (int): UTC seconds
+            next_sync (int): UTC seconds of the next planned NTP sync
+
+        Returns:
+            bool: True if the network is connected
+        """
+        needed = self.always or now >= next_sync - self.lead or now < self.hold_until
+
+        if needed:
+            if not self.up:
+                self.up       = True
+                self.up_since = now
+                print("Radio up")
+            self.network.connect()
+            return self.network.connected
+
+        if self.up:
+            self.network.disconnect()
+            self.up = False
+            self._log(self.up_since, now - self.up_since)
+            print("Radio down after {}s".format(now - self.up_since))
+        return False
+
+    def _log(self, started, length):
+        """ Remember a radio session
+        """
+        self._started[self._pos] = started
+        self._lengths[self._pos] = length
+        self._pos                = (self._pos + 1) % SESSIONS
+        self._len                = min(self._len + 1, SESSIONS)
+        self.total_up           += length
+
+    def sessions(self):
+        """ Recent radio sessions, oldest first
+
+        Returns:
+            list: [start UTC seconds, duration in seconds] for each session
+        """
+        result = []
+        for i in range(self._len):
+            pos = (self._pos - self._len + i) % SESSIONS
+            result.append([self._started[pos], self._lengths[pos]])
+        return result
+
+    def stats(self, now):
+        """ Radio usage - e.g. to return from a web endpoint
+
+        Args:
+            now (int): UTC seconds
+
+        Returns:
+            dict: Whether the radio is up, total seconds up, recent sessions and the connection metrics
+        """
+        total = self.total_up + (now - self.up_since if self.up else 0)
+        return { "up":       self.up,
+                 "total_up": total,
+                 "sessions": self.sessions(),
+                 "wifi":     self.network.stats() }
@@ -0,0 +1,93 @@
+""" Frame-rate limited screen rendering, decoupled from the clock loop
+"""
+
+from utime import ticks_ms, ticks_add, ticks_diff
+import _thread
+
+NTF_FRAME = 0x4001 # Thread notification used to wake the render thread when a new snapshot is submitted
+
+class RenderScheduler:
+    __slots__ = ('ui', 'interval_ms', 'busy_interval_ms', 'busy', 'snapshot', 'rendered', 'last_ms',
+                 'frames', 'skipped', 'thread_id')
+
+    def __init__(self, ui, max_fps = 4, busy_fps = 1):
+        """ Initialise the scheduler
+
+        Args:
+            ui       (DGUI): The user interface to render
+            max_fps  (int) : The most frames per second to draw
+            busy_fps (int) : The most frames per second to draw while the pulse engine is busy
+        """
+        self.ui               = ui
+        self.interval_ms      = 1000 // max_fps
+        self.busy_interval_ms = 1000 // busy_fps
+        self.busy             = False   # Set whilst the pulse engine is busy, e.g. fast-stepping
+        self.snapshot         = None    # The most recent clock state submitted
+        self.rendered         = None    # The snapshot last drawn
+        self.last_ms          = ticks_add(ticks_ms(), -self.busy_interval_ms)
+        self.frames           = 0
+        self.skipped          = 0       # Snapshots replaced before they could be drawn
+        self.thread_id        = None
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r}, {!r}, {!r})".format(self.__class__.__name__, self.ui, 1000 // self.interval_ms, 1000 // self.busy_interval_ms)
+
+    def submit(self, snapshot):
+        """ Hand over a new clock state to render - the caller must not change it afterwards
+
+        Args:
+            snapshot (tuple): As taken by DGUI.show() - (now_tm, hands_tm, clock_mode, ntp_sync)
+        """
+        if self.snapshot is not self.rendered:
+            self.skipped += 1
+        self.snapshot = snapshot
+        if self.thread_id is not None:
+            _thread.notify(self.thread_id, NTF_FRAME)
+
+    def poll(self):
+        """ Draw a frame if there's something new to draw and the frame rate allows it - call this from the
+        clock loop when rendering cooperatively
+
+        Returns:
+            bool: True if a frame was drawn
+        """
+        if not self.ui.power.visible:
+            return False # The backlight is off, so nobody would see it
+
+        snapshot = self.snapshot
+        if snapshot is self.rendered and not self.ui.redraw:
+            return False
+
+        interval = self.busy_interval_ms if self.busy else self.interval_ms
+        now      = ticks_ms()
+        if ticks_diff(now, self.last_ms) < interval:
+            return False
+
+        self.last_ms  = now
+        self.rendered = snapshot
+        if snapshot is not None:
+            self.ui.show(snapshot)
+        self.ui.update_screen()
+        self.frames  += 1
+        return True
+
+    def start_thread(self):
+        """ Render on a separate thread rather than from poll() in the clock loop
+        """
+        self.thread_id = _thread.start_new_thread("UI", self._thread, ())
+
+    def _thread(self):
+        """ Render thread main loop
+        """
+        _thread.allowsuspend(True)
+        while True:
+            ntf = _thread.wait(self.interval_ms)
+            if ntf == _thread.EXIT:
+                self.thread_id = None
+                return
+            if ntf == _thread.SUSPEND:
+                while _thread.wait() != _thread.RESUME:
+                    pass
+            self.poll()
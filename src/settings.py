@@ -1,4 +1,344 @@
+""" Settings files
+
+JSON settings files with a schema (see SCHEMAS) are validated, given defaults for anything optional which is
+missing, and compiled into a compact binary cache next to the source (e.g. clock.json.bin). The cache is only
+rebuilt when the source file's size or modification time changes, so at boot the settings are usually read
+without parsing any JSON at all. Trailing commas, which the files have always had, are accepted.
+
+Usage:
+    config = settings.load_settings("clock.json")       # Plain dict (or list), as always
+    ntp    = settings.get("ntp.json")                   # Settings object with typed accessors
+    ntp.get_int("Lead")
+
+    settings.watch("clock.json", clock.pc.retune)       # Called with the new Settings when the file changes
+    settings.check()                                    # Now and again - notices files changed behind our back
+"""
+
 import ujson
+import ustruct
+import uos
+
+try:
+    from ubinascii import crc32
+except ImportError:
+    crc32 = None
+
+REQUIRED = "required" # Schema default for settings which must be present
+
+# Schemas - each setting is (type, default). A list holds the schema for every entry in the list.
+SCHEMAS = { "clock.json": { "Plus":       (int,  REQUIRED),
+                            "Minus":      (int,  REQUIRED),
+                            "Enable":     (int,  REQUIRED),
+                            "Sense":      (int,  REQUIRED),
+                            "Pulse":      (int,  REQUIRED),
+                            "Stop":       (int,  REQUIRED),
+                            "Recover":    (int,  0),
+                            "FastPulse":  (int,  REQUIRED),
+                            "FastDwell":  (int,  0),
+                            "FastPulse2": (int,  0),
+                            "FastStop":   (int,  REQUIRED),
+                            "Spin":       (int,  500),
+                            "SQW":        (int,  None),
+                            "Profile":    (bool, False),
+                            "Dim":        (int,  60),
+                            "Off":        (int,  300),
+                            "Sleep":      (bool, False),
+                            "StepLog":    (bool, False),
+                            "PowerFail":  (int,  None),
+                            "PowerLevel": (int,  None) },
+            "ntp.json":   { "NTP":        (str,  REQUIRED),
+                            "Lead":       (int,  30),
+                            "Grace":      (int,  60) },
+            "wifi.json":  [ { "SSID":     (str,  REQUIRED),
+                              "Password": (str,  REQUIRED),
+                              "Hostname": (str,  REQUIRED) } ] }
+
+CACHE_MAGIC = b"SET1"
+
+_loaded   = {} # Filename -> (stamp, values) of every file loaded with a schema
+_watchers = {} # Filename -> list of functions to call when it changes
+
+class SettingsError(ValueError):
+    pass
+
+class Settings:
+    __slots__ = ('filename', 'values')
+
+    def __init__(self, filename, values):
+        """ Validated settings with typed accessors - use get() rather than creating these directly
+
+        Args:
+            filename (string): Where the settings came from
+            values   (dict)  : The settings
+        """
+        self.filename = filename
+        self.values   = values
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r})".format(self.__class__.__name__, self.filename)
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def __contains__(self, key):
+        return key in self.values
+
+    def get(self, key, default = None):
+        return self.values.get(key, default)
+
+    def _typed(self, key, kind, default):
+        value = self.values.get(key, default)
+        if value is not None and not isinstance(value, kind):
+            raise SettingsError("{}: {} should be {}, not {!r}".format(self.filename, key, kind.__name__, value))
+        return value
+
+    def get_int(self, key, default = None):
+        return self._typed(key, int, default)
+
+    def get_bool(self, key, default = None):
+        return self._typed(key, bool, default)
+
+    def get_str(self, key, default = None):
+        return self._typed(key, str, default)
+
+    def get_list(self, key, default = None):
+        return self._typed(key, list, default)
+
+def strip_trailing_commas(text):
+    """ Remove commas directly before a closing bracket or brace, outside strings
+
+    Args:
+        text (string): JSON, perhaps with trailing commas
+
+    Returns:
+        string: Standard JSON
+    """
+    out       = []
+    comma     = -1      # Position in out of a comma which may turn out to be trailing
+    in_string = False
+    escaped   = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+            comma     = -1
+        elif char == ",":
+            comma = len(out)
+        elif char == "}" or char == "]":
+            if comma >= 0:
+                out[comma] = ""
+            comma = -1
+        elif char not in " \t\r\n":
+            comma = -1
+        out.append(char)
+    return "".join(out)
+
+def validate(values, schema, where):
+    """ Check settings against a schema, filling in defaults for optional settings which are missing
+
+    Args:
+        values: The parsed settings
+        schema: The schema - see SCHEMAS
+        where (string): Where the settings came from, for error messages
+
+    Returns:
+        The settings, with defaults added
+
+    Raises:
+        SettingsError: If anything required is missing or of the wrong type
+    """
+    if isinstance(schema, list):
+        if not isinstance(values, list):
+            raise SettingsError("{}: should be a list".format(where))
+        for index in range(len(values)):
+            values[index] = validate(values[index], schema[0], "{}[{}]".format(where, index))
+        return values
+
+    if not isinstance(values, dict):
+        raise SettingsError("{}: should be an object".format(where))
+    for key in schema:
+        (kind, default) = schema[key]
+        if key not in values:
+            if default == REQUIRED:
+                raise SettingsError("{}: {} is missing".format(where, key))
+            values[key] = default
+        elif values[key] is not None and not isinstance(values[key], kind):
+            raise SettingsError("{}: {} should be {}, not {!r}".format(where, key, kind.__name__, values[key]))
+    return values
+
+# ---- Binary cache ----------------------------------------------------------------------------------------
+
+def _encode(value, out):
+    """ Append a value to the binary cache
+    """
+    if value is None:
+        out.extend(b"N")
+    elif value is True:
+        out.extend(b"T")
+    elif value is False:
+        out.extend(b"F")
+    elif isinstance(value, int):
+        out.extend(b"i")
+        out.extend(ustruct.pack("<i", value))
+    elif isinstance(value, float):
+        out.extend(b"f")
+        out.extend(ustruct.pack("<d", value))
+    elif isinstance(value, str):
+        data = value.encode()
+        out.extend(b"s")
+        out.extend(ustruct.pack("<H", len(data)))
+        out.extend(data)
+    elif isinstance(value, list):
+        out.extend(b"l")
+        out.extend(ustruct.pack("<H", len(value)))
+        for item in value:
+            _encode(item, out)
+    elif isinstance(value, dict):
+        out.extend(b"d")
+        out.extend(ustruct.pack("<H", len(value)))
+        for key in value:
+            _encode(key, out)
+            _encode(value[key], out)
+    else:
+        raise SettingsError("Can't cache {!r}".format(value))
+
+def _decode(data, pos):
+    """ Read a value from the binary cache
+
+    Returns:
+        (value, int): The value and the position after it
+    """
+    tag  = data[pos]
+    pos += 1
+    if tag == 0x4e: # N
+        return (None, pos)
+    if tag == 0x54: # T
+        return (True, pos)
+    if tag == 0x46: # F
+        return (False, pos)
+    if tag == 0x69: # i
+        return (ustruct.unpack_from("<i", data, pos)[0], pos + 4)
+    if tag == 0x66: # f
+        return (ustruct.unpack_from("<d", data, pos)[0], pos + 8)
+
+    count = ustruct.unpack_from("<H", data, pos)[0]
+    pos  += 2
+    if tag == 0x73: # s
+        return (bytes(data[pos:pos + count]).decode(), pos + count)
+    if tag == 0x6c: # l
+        result = []
+        for _ in range(count):
+            (item, pos) = _decode(data, pos)
+            result.append(item)
+        return (result, pos)
+    if tag == 0x64: # d
+        result = {}
+        for _ in range(count):
+            (key, pos)         = _decode(data, pos)
+            (result[key], pos) = _decode(data, pos)
+        return (result, pos)
+    raise SettingsError("Corrupt settings cache")
+
+def _stamp(settings_file, encoded = None):
+    """ Identify a version of a source file cheaply - by size and modification time, or by checksum on
+    filesystems which don't keep modification times
+
+    Returns:
+        (int, int): Size, and modification time or checksum
+    """
+    stat = uos.stat(settings_file)
+    if stat[8] != 0 or crc32 is None:
+        return (stat[6], stat[8] & 0xffffffff)
+    if encoded is None:
+        with open(settings_file, "rb") as fd:
+            encoded = fd.read()
+    return (stat[6], crc32(encoded) & 0xffffffff)
+
+def _read_cache(settings_file, stamp):
+    """ Read the binary cache, if it was built from this version of the source
+
+    Returns:
+        The settings, or None if the cache is missing or stale
+    """
+    try:
+        with open(settings_file + ".bin", "rb") as fd:
+            data = fd.read()
+    except OSError:
+        return None
+    if len(data) < 12 or data[0:4] != CACHE_MAGIC or ustruct.unpack_from("<II", data, 4) != stamp:
+        return None
+    return _decode(data, 12)[0]
+
+def _write_cache(settings_file, stamp, values):
+    """ Write the binary cache
+    """
+    out = bytearray(CACHE_MAGIC)
+    out.extend(ustruct.pack("<II", stamp[0], stamp[1]))
+    _encode(values, out)
+    write_atomic(settings_file + ".bin", out, "wb")
+
+# ---- Files -----------------------------------------------------------------------------------------------
+
+def write_atomic(filename, data, mode):
+    """ Write a file so that a power cut leaves either the old or the new version, never half of one. On
+    filesystems which can't rename over an existing file, a power cut at just the wrong moment leaves only
+    the new version, as filename.tmp.
+
+    Args:
+        filename (string): File to write
+        data            : What to write to it
+        mode     (string): "w" for text, "wb" for bytes
+    """
+    tmp = filename + ".tmp"
+    with open(tmp, mode) as fd:
+        fd.write(data)
+    try:
+        uos.rename(tmp, filename)
+    except OSError:
+        uos.remove(filename) # Some filesystems won't rename over an existing file
+        uos.rename(tmp, filename)
+
+def _parse(settings_file, schema):
+    """ Read, parse and validate a source file, and rebuild its binary cache
+
+    Returns:
+        ((int, int), settings): The source file stamp and the settings
+    """
+    with open(settings_file) as fd:
+        encoded = fd.read()
+    values = validate(ujson.loads(strip_trailing_commas(encoded)), schema, settings_file)
+    stamp  = _stamp(settings_file, encoded.encode())
+    try:
+        _write_cache(settings_file, stamp, values)
+    except Exception as e:
+        print(settings_file + ": cache write error: " + str(e))
+    return (stamp, values)
+
+def _load(settings_file):
+    """ Load a settings file, from the binary cache if it's up to date
+
+    Returns:
+        ((int, int), settings): The source file stamp and the settings
+    """
+    schema = SCHEMAS.get(settings_file)
+    if schema is None:
+        with open(settings_file) as fd:
+            return (None, ujson.loads(strip_trailing_commas(fd.read())))
+
+    stamp  = _stamp(settings_file)
+    values = _read_cache(settings_file, stamp)
+    if values is None:
+        (stamp, values) = _parse(settings_file, schema)
+    _loaded[settings_file] = (stamp, values)
+    return (stamp, values)
 
 def load_settings(settings_file):
     """ Load a JSON encoded settings file
@@ -7,13 +347,101 @@ def load_settings(settings_file):
         settings_file (string): Filename to load
 
     Returns:
-        ujson-object: The loaded settings
-    """    
+        ujson-object: The loaded settings, or None if they couldn't be read. If a file with a schema is broken,
+                      the settings it last held are used.
+    """
+    if settings_file in _loaded:
+        return _loaded[settings_file][1]
     try:
-        fd = open(settings_file)
-        encoded = fd.read()
-        fd.close()
-        settings = ujson.loads(encoded)
-        return settings
+        return _load(settings_file)[1]
     except Exception as e:
-        print(settings_file + ": read error: " + str(e))
\ No newline at end of file
+        print(settings_file + ": read error: " + str(e))
+        if settings_file in SCHEMAS:
+            try:
+                with open(settings_file + ".bin", "rb") as fd:
+                    data = fd.read()
+                print(settings_file + ": using the last good settings")
+                return _decode(data, 12)[0]
+            except Exception:
+                pass
+
+def get(settings_file):
+    """ Load a settings file with a schema, with typed accessors
+
+    Args:
+        settings_file (string): Filename to load
+
+    Returns:
+        Settings: The settings
+
+    Raises:
+        SettingsError: If the file has no schema, or is broken and has never been good
+    """
+    if settings_file not in SCHEMAS or isinstance(SCHEMAS[settings_file], list):
+        raise SettingsError("{}: no schema for typed access".format(settings_file))
+    values = load_settings(settings_file)
+    if values is None:
+        raise SettingsError("{}: can't be read".format(settings_file))
+    return Settings(settings_file, values)
+
+def save_settings(settings_file, settings):
+    """ Save settings as a JSON encoded file - atomically, and telling anything watching the file
+
+    Args:
+        settings_file (string)      : Filename to save to
+        settings      (ujson-object): The settings to save
+    """
+    try:
+        schema = SCHEMAS.get(settings_file)
+        if schema is not None:
+            settings = validate(settings, schema, settings_file)
+        write_atomic(settings_file, ujson.dumps(settings), "w")
+        if schema is not None:
+            _changed(settings_file, _parse(settings_file, schema))
+    except Exception as e:
+        print(settings_file + ": write error: " + str(e))
+
+# ---- Change notification ---------------------------------------------------------------------------------
+
+def watch(settings_file, callback):
+    """ Call a function whenever a settings file changes
+
+    Args:
+        settings_file (string)  : The file to watch
+        callback      (function): Called with the new Settings (or list, for a list of settings)
+    """
+    if settings_file not in _watchers:
+        _watchers[settings_file] = []
+    _watchers[settings_file].append(callback)
+
+def _changed(settings_file, loaded):
+    """ Record a new version of a file and tell anything watching it
+    """
+    _loaded[settings_file] = loaded
+    values = loaded[1]
+    if isinstance(values, dict):
+        values = Settings(settings_file, values)
+    for callback in _watchers.get(settings_file, ()):
+        callback(values)
+
+def check():
+    """ Reload any settings files which have changed since they were loaded - e.g. uploaded over the network
+
+    Returns:
+        list: Names of the files which were reloaded
+    """
+    reloaded = []
+    for settings_file in list(_loaded):
+        try:
+            stamp = _stamp(settings_file)
+        except Exception:
+            continue    # Missing, e.g. part way through being replaced - look again next time
+        if stamp == _loaded[settings_file][0]:
+            continue
+        try:
+            _changed(settings_file, _parse(settings_file, SCHEMAS[settings_file]))
+            reloaded.append(settings_file)
+        except Exception as e:
+            print(settings_file + ": reload error: " + str(e))
+            _loaded[settings_file] = (stamp, _loaded[settings_file][1]) # Keep the last good settings, and don't retry until it changes again
+    return reloaded
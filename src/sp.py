@@ -27,10 +27,6 @@ print(''.join('{:02x} '.format(x) for x in ds.read_ds3231_rtc()))
 
 help('modules')
 
-import _thread
-import dgclockthread
-_thread.start_new_thread("Clock", dgclockthread.thread, ('clock.json', 0))
-
 import settings
 import pulseclock
 clock_settings = settings.load_settings("clock.json")
@@ -0,0 +1,372 @@
+""" Binary step log - one fixed-size record for every step of the clock
+
+Each step is packed into a RECORD_SIZE-byte record in a preallocated RAM ring, with no string formatting and no
+allocation. Every BLOCK records are appended to a file in flash as one write, by poll() from the main loop once
+the pulse is over, and once the file reaches
+MAX_BYTES it becomes the .old file and a new one is started, so the log never takes more than twice that.
+The log can be streamed over HTTP as the raw records or as CSV, generated a buffer at a time - see StepStream.
+tools/pulselog.py analyses it on a PC.
+
+Record (RECORD, little-endian):
+    time        u32  UTC of the pulse, from the TimeOfDay the log is given (0 until it has one)
+    hands       u16  Hand position after the step, seconds from 12:00:00
+    sec_pos     u8   Where the second hand should be after the step
+    edges       u8   Sensor edges seen during the step
+    flags       u8   FLAG_SENSOR | FLAG_FAST | FLAG_POLARITY | FLAG_CORRECTION, and the channel in the top four bits
+    correction  i8   Seconds the second hand position was corrected by, beyond the step itself
+    pulse_ms    u16  Drive pulse length
+    temp        i16  DS3231 temperature in quarter degrees
+    stop_ms     u16  Stop (brake) length
+
+A step's outcome (the sensor edges) is only known when the next step starts, so PulseClock tells the log about
+each pulse as it is made (pulsed()) and writes its record as the next step starts (sensed()). Each movement
+driven by a MultiClock is a separate channel with its own pulse waiting for its outcome, so the channel number
+is passed to every call and recorded in the flags.
+
+Usage:
+    steplog.start("steps.bin")  # Once - PulseClock and DGClock then record every step
+    steplog.log.poll()          # From the main loop after each pulse
+    steplog.log.tod  = tod      # Once the TimeOfDay is running - records are dated by its utc
+    steplog.log.temp = 88       # Now and again, from DS3231.temp * 4
+    steplog.log.flush()         # E.g. before a reset
+
+Only the main loop writes the files. Other threads (the web server) call sync(), which asks poll() to flush and
+waits for it.
+"""
+
+import uos
+import ustruct
+from utime import sleep_ms
+
+RECORD          = "<IHBBBbHhH"
+RECORD_SIZE     = 16
+CSV_HEADER      = b"time,channel,hands,sec_pos,edges,sensor,fast,polarity,correction,pulse_ms,temp,stop_ms\n"
+
+FLAG_SENSOR     = 0x01
+FLAG_FAST       = 0x02
+FLAG_POLARITY   = 0x04
+FLAG_CORRECTION = 0x08
+CHANNEL_SHIFT   = 4     # Channel number in the top four bits of flags
+CHANNELS        = 16
+
+RING            = 128   # Records kept in RAM
+BLOCK           = 64    # Records written to flash at once
+MAX_BYTES       = 65536 # Size at which the file is rotated
+SYNC_MS         = 2000  # Longest sync() waits for the main loop to flush
+
+log = None # The StepLog in use - set by start()
+
+class StepChannel:
+    __slots__ = ('pulsed', 'when', 'flags', 'pulse_ms', 'stop_ms', 'hands')
+
+    def __init__(self, channel):
+        """ The pulse of one channel waiting for its outcome - StepLog creates these as channels are first used
+
+        Args:
+            channel (int): The channel number, 0 to CHANNELS - 1
+        """
+        self.pulsed   = False      # A pulse has been made and its record is waiting for sensed()
+        self.when     = 0
+        self.flags    = channel << CHANNEL_SHIFT
+        self.pulse_ms = 0
+        self.stop_ms  = 0
+        self.hands    = 0          # Set by DGClock after each step
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r})".format(self.__class__.__name__, self.flags >> CHANNEL_SHIFT)
+
+class StepLog:
+    __slots__ = ('filename', 'size', 'block', 'max_bytes', 'ring', 'head', 'flushed', 'lost', 'temp', 'tod',
+                 'channels', 'wanted')
+
+    def __init__(self, filename, size = RING, block = BLOCK, max_bytes = MAX_BYTES):
+        """ Initialise the log - use start() rather than creating these directly
+
+        Args:
+            filename  (string): The file in flash
+            size      (int)   : Records kept in RAM - at least twice block
+            block     (int)   : Records written to flash at once
+            max_bytes (int)   : Size at which the file is rotated
+        """
+        self.filename  = filename
+        self.size      = size
+        self.block     = block
+        self.max_bytes = max_bytes
+        self.ring      = bytearray(size * RECORD_SIZE)
+        self.head      = 0          # Records ever added
+        self.flushed   = 0          # Records ever written to flash
+        self.lost      = 0          # Records overwritten before they could be written to flash
+        self.temp      = 0          # Set now and again by the main loop
+        self.tod       = None       # TimeOfDay dating the records - utime.time() isn't set, so it restarts at boot
+        self.channels  = [None] * CHANNELS
+        self.wanted    = False      # Another thread has asked for a flush
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r}, {!r}, {!r}, {!r})".format(self.__class__.__name__, self.filename, self.size, self.block,
+                                                    self.max_bytes)
+
+    def channel(self, channel):
+        """ The pending state of a channel, created when it is first used
+
+        Args:
+            channel (int): The channel number, 0 to CHANNELS - 1
+
+        Returns:
+            StepChannel: The channel's state
+        """
+        state = self.channels[channel]
+        if state is None:
+            state                  = StepChannel(channel)
+            self.channels[channel] = state
+        return state
+
+    def stepped(self, channel, hands):
+        """ The hands have been updated after a step - called by DGClock
+
+        Args:
+            channel (int): The channel number
+            hands   (int): Hand position, seconds from 12:00:00
+        """
+        self.channel(channel).hands = hands
+
+    def pulsed(self, channel, fast, polarity, pulse_ms, stop_ms):
+        """ A pulse has just been made - called by PulseClock
+
+        Args:
+            channel  (int) : The channel number
+            fast     (bool): Fast step
+            polarity (int) : Direction of the pulse, 0 or 1
+            pulse_ms (int) : Drive pulse length
+            stop_ms  (int) : Stop length
+        """
+        state          = self.channel(channel)
+        state.pulsed   = True
+        state.when     = self.tod.utc if self.tod is not None else 0
+        state.flags    = (channel << CHANNEL_SHIFT) | (FLAG_FAST if fast else 0) | (FLAG_POLARITY if polarity else 0)
+        state.pulse_ms = pulse_ms
+        state.stop_ms  = stop_ms
+
+    def sensed(self, channel, edges, white, correction, sec_pos):
+        """ The outcome of the channel's last pulse is known - called by PulseClock as its next step starts
+
+        Args:
+            channel    (int) : The channel number
+            edges      (int) : Sensor edges seen
+            white      (int) : Sensor state, 1 for white
+            correction (int) : Seconds the second hand position was corrected by, beyond the step itself
+            sec_pos    (int) : Where the second hand should now be
+        """
+        state = self.channel(channel)
+        if not state.pulsed:
+            return
+        state.pulsed = False
+
+        if self.head - self.flushed >= self.size:
+            self.flushed += 1       # The oldest unwritten record is about to be overwritten
+            self.lost    += 1
+        flags = state.flags | (FLAG_SENSOR if white else 0) | (FLAG_CORRECTION if correction else 0)
+        ustruct.pack_into(RECORD, self.ring, (self.head % self.size) * RECORD_SIZE, state.when, state.hands, sec_pos,
+                          min(edges, 255), flags, max(-128, min(127, correction)), state.pulse_ms, self.temp,
+                          state.stop_ms)
+        self.head += 1
+
+    def poll(self):
+        """ Write to flash if a block is waiting or another thread asked for a flush - call from the main loop
+        after the pulse, so the write never delays one
+        """
+        if self.wanted or self.head - self.flushed >= self.block:
+            self.wanted = False
+            self.flush()
+
+    def sync(self, timeout_ms = SYNC_MS):
+        """ Ask the main loop to flush, and wait until it has - for other threads, which mustn't write the files
+
+        Args:
+            timeout_ms (int): How long to wait
+
+        Returns:
+            bool: True if everything logged before the call is now in flash
+        """
+        target      = self.head
+        self.wanted = True
+        while self.flushed < target and timeout_ms > 0:
+            sleep_ms(10)
+            timeout_ms -= 10
+        return self.flushed >= target
+
+    def flush(self):
+        """ Write everything in RAM which isn't in flash yet - only from the main loop, or once it has stopped
+        """
+        if self.head == self.flushed:
+            return
+        ring  = memoryview(self.ring)
+        start = (self.flushed % self.size) * RECORD_SIZE
+        end   = (self.head % self.size) * RECORD_SIZE
+        try:
+            with open(self.filename, "ab") as fd:
+                if end > start:
+                    fd.write(ring[start:end])
+                else:
+                    fd.write(ring[start:])  # Wrapped
+                    fd.write(ring[:end])
+                size = fd.tell()
+        except OSError as e:
+            print("Step log not written: {}".format(e))
+            return
+        self.flushed = self.head
+
+        if size >= self.max_bytes:
+            try:
+                uos.remove(self.filename + ".old")
+            except OSError:
+                pass
+            uos.rename(self.filename, self.filename + ".old")
+
+    def files(self):
+        """ The log files, oldest first
+
+        Returns:
+            list: [filename, size] for each file which exists
+        """
+        result = []
+        for name in (self.filename + ".old", self.filename):
+            try:
+                result.append([name, uos.stat(name)[6]])
+            except OSError:
+                pass
+        return result
+
+    def stats(self):
+        """ Records logged and lost, and the files - e.g. to return from a web endpoint
+
+        Returns:
+            dict: Record counts and the file sizes
+        """
+        return { "records": self.head, "unflushed": self.head - self.flushed, "lost": self.lost,
+                 "files": self.files() }
+
+class StepStream:
+    __slots__ = ('files', 'fd', 'left', 'csv', 'record', 'pending', 'pending_pos')
+
+    def __init__(self, steplog, csv = False):
+        """ Everything logged so far, as a stream for MicroWebSrv2's Response.ReturnStream()
+
+        Args:
+            steplog (StepLog): The log
+            csv     (bool)   : CSV rather than the raw records
+        """
+        steplog.sync()                  # So the files hold everything, and only their current size is sent
+        self.files       = steplog.files()
+        self.fd          = None
+        self.left        = 0            # Bytes still to be read from the open file
+        self.csv         = csv
+        self.record      = bytearray(RECORD_SIZE)
+        self.pending     = CSV_HEADER if csv else b""
+        self.pending_pos = 0
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r}, {!r})".format(self.__class__.__name__, self.files, self.csv)
+
+    def _next_file(self):
+        """ Open the next file, if there is one
+
+        Returns:
+            bool: True if a file was opened
+        """
+        if self.fd is not None:
+            self.fd.close()
+            self.fd = None
+        while self.files:
+            (name, size) = self.files.pop(0)
+            size        -= size % RECORD_SIZE
+            if size > 0:
+                self.fd   = open(name, "rb")
+                self.left = size
+                return True
+        return False
+
+    def _raw(self, buf):
+        """ Read raw records
+
+        Args:
+            buf (memoryview): Where to put them
+
+        Returns:
+            int: Bytes read - only less than len(buf) at the end
+        """
+        got = 0
+        while got < len(buf):
+            if self.left == 0 and not self._next_file():
+                break
+            count = self.fd.readinto(buf[got:got + min(self.left, len(buf) - got)])
+            if not count:
+                self.left = 0
+                continue
+            got       += count
+            self.left -= count
+        return got
+
+    def _csv_line(self):
+        """ Format the next record as a CSV line
+
+        Returns:
+            bytes: The line, or None at the end
+        """
+        if self._raw(memoryview(self.record)) < RECORD_SIZE:
+            return None
+        (when, hands, sec_pos, edges, flags, correction, pulse_ms, temp, stop_ms) = ustruct.unpack(RECORD, self.record)
+        return "{},{},{},{},{},{},{},{},{},{},{},{}\n".format(when, flags >> CHANNEL_SHIFT, hands, sec_pos, edges,
+                                                             flags & FLAG_SENSOR, (flags & FLAG_FAST) >> 1,
+                                                             (flags & FLAG_POLARITY) >> 2, correction, pulse_ms,
+                                                             temp / 4, stop_ms).encode()
+
+    def readinto(self, buf):
+        """ Fill a buffer with the next part of the stream
+
+        Args:
+            buf (bytearray/memoryview): Where to put it
+
+        Returns:
+            int: Bytes read - only less than len(buf) at the end
+        """
+        buf = memoryview(buf)
+        if not self.csv:
+            return self._raw(buf)
+
+        got = 0
+        while got < len(buf):
+            if self.pending_pos == len(self.pending):
+                line = self._csv_line()
+                if line is None:
+                    break
+                (self.pending, self.pending_pos) = (line, 0)
+            count                = min(len(buf) - got, len(self.pending) - self.pending_pos)
+            buf[got:got + count] = self.pending[self.pending_pos:self.pending_pos + count]
+            got                 += count
+            self.pending_pos    += count
+        return got
+
+    def close(self):
+        if self.fd is not None:
+            self.fd.close()
+            self.fd = None
+        self.files = []
+
+def start(filename = "steps.bin", size = RING, block = BLOCK, max_bytes = MAX_BYTES):
+    """ Start logging every step
+
+    Args:
+        As StepLog
+
+    Returns:
+        StepLog: The log, also available as steplog.log
+    """
+    global log
+    log = StepLog(filename, size, block, max_bytes)
+    return log
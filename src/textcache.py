@@ -0,0 +1,199 @@
+""" Caches for the TFT text path - glyph widths, string widths and formatted strings
+"""
+
+class LRUCache:
+    __slots__ = ('size', 'values', 'used', 'clock', 'hits', 'misses')
+
+    def __init__(self, size = 32):
+        """ A small bounded cache which evicts the least recently used entry when full
+
+        Args:
+            size (int): Maximum number of entries
+        """
+        self.size   = size
+        self.values = {}
+        self.used   = {}  # Key -> when it was last used
+        self.clock  = 0
+        self.hits   = 0
+        self.misses = 0
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r})".format(self.__class__.__name__, self.size)
+
+    def __len__(self):
+        return len(self.values)
+
+    def get(self, key):
+        """ Look up a cached value
+
+        Args:
+            key: What to look up
+
+        Returns:
+            The cached value, or None if it isn't cached
+        """
+        if key not in self.values:
+            self.misses += 1
+            return None
+        self.hits      += 1
+        self.clock     += 1
+        self.used[key]  = self.clock
+        return self.values[key]
+
+    def put(self, key, value):
+        """ Add a value to the cache, evicting the least recently used entry if it is full
+
+        Args:
+            key  : What to cache it as
+            value: The value
+        """
+        if key not in self.values and len(self.values) >= self.size:
+            oldest = None
+            for k in self.used:
+                if oldest is None or self.used[k] < self.used[oldest]:
+                    oldest = k
+            del self.values[oldest]
+            del self.used[oldest]
+
+        self.clock       += 1
+        self.values[key]  = value
+        self.used[key]    = self.clock
+
+    def clear(self):
+        """ Empty the cache
+        """
+        self.values.clear()
+        self.used.clear()
+
+class TextMetrics:
+    __slots__ = ('tft', 'font', 'cache_size', 'glyphs', 'heights', 'widths', 'driver_calls')
+
+    def __init__(self, tft, font, cache_size = 32):
+        """ Measure text for a display, calling the display driver as little as possible
+
+        Args:
+            tft        (TFT): The display
+            font       (int): The font currently selected on the display
+            cache_size (int): How many string widths to remember for each font
+        """
+        self.tft          = tft
+        self.font         = font
+        self.cache_size   = cache_size
+        self.glyphs       = {}  # Font -> bytearray of printable ASCII glyph widths, 0 if not yet measured
+        self.heights      = {}  # Font -> font height
+        self.widths       = {}  # Font -> LRUCache of string -> width
+        self.driver_calls = 0   # Number of times the display driver has been asked to measure something
+        self._select(font)
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r}, {!r})".format(self.__class__.__name__, self.font, self.cache_size)
+
+    def _select(self, font):
+        if font not in self.glyphs:
+            self.glyphs[font]  = bytearray(95)  # Characters 32 (space) to 126 (tilde)
+            self.heights[font] = 0
+            self.widths[font]  = LRUCache(self.cache_size)
+        self.font = font
+
+    def set_font(self, font):
+        """ Select a font on the display, and measure text in it from now on
+
+        Args:
+            font (int): The font, e.g. tft.FONT_Comic
+        """
+        self.tft.font(font)
+        self._select(font)
+
+    def glyph_width(self, char):
+        """ Width of a single character in the current font
+
+        Args:
+            char (string): One character
+
+        Returns:
+            int: Width in pixels
+        """
+        code = ord(char) - 32
+        if code < 0 or code >= 95:
+            self.driver_calls += 1
+            return self.tft.textWidth(char)
+
+        glyphs = self.glyphs[self.font]
+        if glyphs[code] == 0:
+            self.driver_calls += 1
+            glyphs[code] = self.tft.textWidth(char)
+        return glyphs[code]
+
+    def text_width(self, text):
+        """ Width of a string in the current font - the sum of its glyph widths
+
+        Args:
+            text (string): The string to measure
+
+        Returns:
+            int: Width in pixels
+        """
+        cache = self.widths[self.font]
+        width = cache.get(text)
+        if width is None:
+            width = 0
+            for char in text:
+                width += self.glyph_width(char)
+            cache.put(text, width)
+        return width
+
+    def font_height(self):
+        """ Height of the current font
+
+        Returns:
+            int: Height in pixels
+        """
+        if self.heights[self.font] == 0:
+            self.driver_calls         += 1
+            self.heights[self.font]    = self.tft.fontSize()[1]
+        return self.heights[self.font]
+
+class FormatCache:
+    __slots__ = ('size', 'fields')
+
+    def __init__(self, size = 8):
+        """ Remember recently formatted strings for each field on the screen
+
+        Args:
+            size (int): How many strings to remember for each field
+        """
+        self.size   = size
+        self.fields = {}  # Field -> LRUCache of value -> string
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r})".format(self.__class__.__name__, self.size)
+
+    def hms(self, field, fmt, hours, minutes, seconds):
+        """ Format a time, reusing the string from last time if the field has shown the same time recently
+
+        Args:
+            field   (string): Which field the string is for
+            fmt     (string): Format string taking hours, minutes and seconds
+            hours   (int)   : Hours
+            minutes (int)   : Minutes
+            seconds (int)   : Seconds
+
+        Returns:
+            string: The formatted time
+        """
+        if field not in self.fields:
+            self.fields[field] = LRUCache(self.size)
+        cache = self.fields[field]
+
+        key  = (hours * 60 + minutes) * 60 + seconds # A small int, so looking it up doesn't allocate
+        text = cache.get(key)
+        if text is None:
+            text = fmt.format(hours, minutes, seconds)
+            cache.put(key, text)
+        return text
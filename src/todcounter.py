@@ -0,0 +1,130 @@
+""" Incremental local time-of-day counter driven by the DS3231 second edge
+"""
+
+import utime
+from machine import Pin
+
+from ds3231 import DS3231
+
+class TimeOfDay:
+    def __init__(self, ds, verify_every = 60, sqw_pin = None):
+        """ Initialise the counter from a full read of the DS3231
+
+        Args:
+            ds           (DS3231): The battery-backed RTC
+            verify_every (int)   : How often (in seconds) to check the counter against a full DS3231 read
+            sqw_pin      (int)   : GPIO connected to the DS3231 INT/SQW pin, or None to poll the seconds register instead
+        """
+        self.ds           = ds
+        self.verify_every = verify_every
+        self.tm           = [0, 0, 0, 0, 0, 0, 0, 0] # UK local time as a tm structure - updated in place
+        self.utc          = 0                        # Seconds since 1970 in UTC
+        self.tod          = 0                        # Seconds since 1970 in UK local time
+        self.secs         = 0                        # Seconds since local midnight - always a small int, so cheap to use
+        self.next_verify  = 0
+        self.slips        = 0                        # Number of times a full read disagreed with the counter
+        self._pending     = 0                        # Second edges seen by the interrupt but not yet counted
+        self._woken       = 0                        # Second edges counted from the DS3231 after a light sleep
+
+        if sqw_pin is None:
+            self.sqw = None
+        else:
+            ds.sqw_1hz()
+            self.sqw = Pin(sqw_pin, Pin.IN, Pin.PULL_UP, handler = self._sqwinterrupt, trigger = Pin.IRQ_FALLING)
+
+        self.sync()
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r}, {!r}, {!r})".format(self.__class__.__name__, self.ds, self.verify_every, self.sqw)
+
+    def _sqwinterrupt(self, pin):
+        """ DS3231 squarewave interrupt routine
+        Count the second edges
+        """
+        self._pending += 1
+
+    def sync(self, check = True):
+        """ Reload the counter from a full read of the DS3231, including the DST calculation
+
+        Args:
+            check (bool): Count and report any disagreement - set False after deliberately setting the DS3231
+        """
+        self._pending = 0
+        self._woken   = 0
+        now           = self.ds.rtc_tm
+        utc           = DS3231.timegm(now)
+
+        if check and self.utc != 0 and utc != self.utc:
+            self.slips += 1
+            print("Time of day counter slipped by {}s".format(utc - self.utc))
+
+        self.utc = utc
+        self.tod = utc
+        if DS3231.is_dst_from_UTCtm(now):
+            self.tod += 3600 # Add one hour
+
+        local = utime.gmtime(self.tod) # The only library function which works!
+        for i in range(8):
+            self.tm[i] = local[i]
+        self.secs = self.tm[3] * 3600 + self.tm[4] * 60 + self.tm[5]
+
+        self.next_verify = self.utc + self.verify_every
+
+    @property
+    def pending(self):
+        """ Second edges seen by the squarewave interrupt which poll() hasn't counted yet
+        """
+        return self._pending
+
+    def woke(self):
+        """ Recount the second edges from the DS3231 after a light sleep, during which the squarewave interrupt
+        may not have run. The interrupt may still run late for an edge counted here, so poll() takes whichever of
+        the two counts is larger rather than adding them.
+        """
+        self._woken = (self.ds.read_seconds() - self.tm[5]) % 60
+
+    def _edges(self):
+        """ Work out how many second edges have happened since the counter was last advanced
+
+        Returns:
+            int: Number of seconds to advance by
+        """
+        if self.sqw is not None:
+            (count, self._pending) = (self._pending, 0) # Copy the count and then reset it - semi-atomic!
+            if self._woken:
+                (count, self._woken) = (max(count, self._woken), 0)
+            return count
+
+        return (self.ds.read_seconds() - self.tm[5]) % 60
+
+    def poll(self):
+        """ Advance the counter if a second edge has happened - call this from the main loop
+
+        Returns:
+            bool: True if the time has changed
+        """
+        count = self._edges()
+        if count == 0:
+            return False
+
+        if count > 1: # Missed an edge - don't guess, read the whole thing (the counter is behind, not wrong)
+            self.sync(False)
+            return True
+
+        self.utc  += 1
+        self.tod  += 1
+        self.secs += 1
+        self.tm[5] += 1
+        if self.tm[5] == 60:
+            self.tm[5]  = 0
+            self.tm[4] += 1
+            if self.tm[4] == 60: # Hour, date and DST changes all happen on the hour - recalculate everything
+                self.sync()
+                return True
+
+        if self.utc >= self.next_verify:
+            self.sync()
+
+        return True
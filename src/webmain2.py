@@ -10,6 +10,8 @@ import MicroWebSrv2.httpResponse
 from time          import sleep
 from _thread       import allocate_lock
 
+import webroutes    # The clock's own routes, which work here too
+
 # ============================================================================
 # ============================================================================
 # ============================================================================
@@ -0,0 +1,81 @@
+""" The clock's web routes
+
+MicroWebSrv2 collects @WebRoute handlers as their module is imported, so this is imported before the server is
+started - by main_async.web_task, and by the webmain2 demo. The handlers run on the server's own thread and
+read the firmware's live state through the modules which hold it, and through firmware, set by main_async.
+
+    /status     The last published snapshot of the clock
+    /profile    Section timings (instrument)
+    /memory     Heap audit results (memaudit)
+    /boot       Boot timeline (boottime)
+    /steps      The step log as raw records, and /steps.csv as CSV (steplog)
+
+Every route is wrapped with @memaudit.per_request, so the bytes each request allocates can be sampled.
+"""
+
+from MicroWebSrv2 import WebRoute, GET
+
+import boottime
+import instrument
+import memaudit
+import steplog
+
+firmware = None # The running main_async.Firmware, if there is one
+
+# ============================================================================
+# ============================================================================
+# ============================================================================
+
+@WebRoute(GET, '/status', name='Status')
+@memaudit.per_request
+def RequestStatus(microWebSrv2, request) :
+    if firmware is None or firmware.snapshot is None :
+        request.Response.ReturnNotFound()
+        return
+    (now_tm, hands_tm, clock_mode, ntp_sync) = firmware.snapshot   # Published as a whole, so consistent
+    status = { "time": now_tm, "hands": hands_tm, "mode": clock_mode, "ntp_sync": ntp_sync }
+    if firmware.supply is not None :
+        status["supply"] = firmware.supply.stats()
+    request.Response.ReturnOkJSON(status)
+
+# ------------------------------------------------------------------------
+
+@WebRoute(GET, '/profile', name='Profile')
+@memaudit.per_request
+def RequestProfile(microWebSrv2, request) :
+    request.Response.ReturnOkJSON(instrument.stats())
+
+# ------------------------------------------------------------------------
+
+@WebRoute(GET, '/memory', name='Memory')
+@memaudit.per_request
+def RequestMemory(microWebSrv2, request) :
+    request.Response.ReturnOkJSON(memaudit.results())
+
+# ------------------------------------------------------------------------
+
+@WebRoute(GET, '/boot', name='Boot')
+@memaudit.per_request
+def RequestBoot(microWebSrv2, request) :
+    request.Response.ReturnOkJSON(boottime.timeline())
+
+# ------------------------------------------------------------------------
+
+@WebRoute(GET, '/steps', name='Steps')
+@memaudit.per_request
+def RequestSteps(microWebSrv2, request) :
+    if steplog.log is None :
+        request.Response.ReturnNotFound()
+        return
+    request.Response.ReturnStream(200, steplog.StepStream(steplog.log))
+
+# ------------------------------------------------------------------------
+
+@WebRoute(GET, '/steps.csv', name='StepsCSV')
+@memaudit.per_request
+def RequestStepsCSV(microWebSrv2, request) :
+    if steplog.log is None :
+        request.Response.ReturnNotFound()
+        return
+    request.Response.ContentType = 'text/csv'
+    request.Response.ReturnStream(200, steplog.StepStream(steplog.log, csv=True))
@@ -0,0 +1,112 @@
+""" Retained-mode text widgets for the TFT display
+
+Each field remembers what it last drew and where, so redrawing a field with the same text does nothing, and a
+field whose text only changes at the end (e.g. the seconds of a time) only erases and redraws the changed part.
+"""
+
+class TextField:
+    __slots__ = ('tft', 'metrics', 'vpos', 'hpos', 'align', 'text', 'color', 'x', 'y', 'w', 'h')
+
+    def __init__(self, tft, metrics, vpos, hpos = False, align = 'Centre'):
+        """ Initialise the field - nothing is drawn until draw() is called
+
+        Args:
+            tft     (TFT)        : The display
+            metrics (TextMetrics): Measures text in the display's current font
+            vpos    (int)        : The vertical position of the middle of the text
+            hpos    (int)        : The horizontal position on the screen (defaults to edges/middle)
+            align   (string)     : Left, Centre or Right
+        """
+        self.tft     = tft
+        self.metrics = metrics
+        self.vpos    = vpos
+        self.align   = align
+
+        if hpos is not False:
+            self.hpos = hpos
+        elif align == 'Left':
+            self.hpos = 0
+        elif align == 'Right':
+            self.hpos = 240
+        else: # Assume centre/center
+            self.hpos = 120
+
+        self.invalidate()
+
+    def __repr__(self):
+        """ Returns representation of the object
+        """
+        return "{}({!r}, {!r}, {!r})".format(self.__class__.__name__, self.vpos, self.hpos, self.align)
+
+    def invalidate(self):
+        """ Forget what was drawn - e.g. because the screen has been cleared
+        """
+        self.text  = None
+        self.color = None
+        self.x     = 0
+        self.y     = 0
+        self.w     = 0
+        self.h     = 0
+
+    def _erase(self, x, w):
+        """ Fill part of the field's last bounding box with the background colour
+
+        Args:
+            x (int): Left edge of the area to erase
+            w (int): Width of the area to erase
+        """
+        if w > 0 and self.h > 0:
+            bg = self.tft.get_bg()
+            self.tft.rect(x, self.y, w, self.h, bg, bg)
+
+    def draw(self, text, color = False):
+        """ Show some text in the field, touching only the pixels that need to change
+
+        Args:
+            text  (string): The text to display
+            color (int)   : Colour code (0xffffff = black, 0x00ffff = red etc)
+
+        Returns:
+            bool: True if anything was drawn
+        """
+        tft = self.tft
+        if not color:
+            color = tft.get_fg()
+
+        if text == self.text and color == self.color:
+            return False
+
+        width = self.metrics.text_width(text)
+        if self.align == 'Left':
+            x = self.hpos
+        elif self.align == 'Right':
+            x = self.hpos - width
+        else: # Assume centre/center
+            x = self.hpos - width // 2
+        height = self.metrics.font_height()
+        y      = self.vpos - height // 2
+
+        start  = 0
+        offset = 0
+        if self.text is None:
+            pass                                                         # Nothing to erase
+        elif x != self.x or y != self.y or color != self.color:
+            self._erase(self.x, self.w)                                  # Moved or recoloured - erase all of it
+        else:
+            # Only redraw from the first changed character
+            limit = min(len(text), len(self.text))
+            while start < limit and text[start] == self.text[start]:
+                start += 1
+            if start > 0:
+                offset = self.metrics.text_width(text[:start])
+            self._erase(x + offset, max(self.w, width) - offset)
+
+        tft.text(x + offset, y, text[start:], color)
+
+        self.text  = text
+        self.color = color
+        self.x     = x
+        self.y     = y
+        self.w     = width
+        self.h     = height
+        return True
@@ -1,45 +1,293 @@
 import network
-from utime import sleep_ms, ticks_ms, ticks_add
+from ubinascii import hexlify, unhexlify
+from utime import sleep_ms, ticks_ms, ticks_add, ticks_diff
+
+import instrument
+import settings
+
+try:
+    import _thread
+except ImportError:
+    _thread = None
+
+_SECT_CONNECT = instrument.section("wifi connect")
+
+ATTEMPT_MS  = 10000   # How long to wait for one connection attempt to succeed
+BACKOFF_MS  = 15000   # Wait after the first failed round of attempts - doubles after each further failure
+BACKOFF_MAX = 600000  # Longest wait between rounds of attempts
+LEASE_S     = 3600    # How long a cached IP address is re-used for without asking the DHCP server again
+
+FAST   = -1 # Candidate meaning the cached access point, reconnected to directly
+SCAN   = -2 # Candidate meaning start a scan on its own thread, as it blocks for seconds
+RANKED = -3 # Candidate meaning the scan has finished - try the configured networks strongest first
 
 class wifi:
-    def __init__(self, config):
-        self.config       = config
-        self.connection   = -1
-        self.sta          = network.WLAN(network.STA_IF)
-        self.connected    = False
-        self.last_attempt = ticks_ms()
+    __slots__ = ('config', 'cache_file', 'cache', 'connection', 'sta', 'connected', 'candidates', 'seen',
+                 'attempt_at', 'started_at', 'retry_at', 'backoff_ms', 'static', 'connects', 'fast_connects',
+                 'failures', 'last_ms', 'total_ms', 'max_ms', 'scanning', 'bssid_kw', 'tod')
+
+    def __init__(self, config, cache_file = "wifi_cache.json", tod = None):
+        """ Keep a station connection up, reconnecting as quickly as possible when it drops
+
+        Args:
+            config     (list)     : Credentials to try - each a dict of SSID, Password and Hostname
+            cache_file (string)   : Where the last good access point and IP lease are remembered
+            tod        (TimeOfDay): Dates the IP lease - without it a cached lease is never re-used, as the ESP32's
+                                    own clock starts again from zero at every boot
+        """
+        self.config        = config
+        self.cache_file    = cache_file
+        self.cache         = None
+        self.connection    = -1            # Index in config of the credentials being tried or used
+        self.sta           = network.WLAN(network.STA_IF)
+        self.connected     = False
+        self.candidates    = []            # Still to try in this round - config indexes, FAST or SCAN
+        self.seen          = {}            # SSID -> (BSSID, channel, RSSI) of the strongest access point in the last scan
+        self.attempt_at    = None          # When the current attempt started
+        self.started_at    = None          # When the first attempt since losing the connection started
+        self.retry_at      = None          # When to start the next round of attempts
+        self.backoff_ms    = BACKOFF_MS
+        self.static        = False         # The cached IP lease is configured instead of DHCP
+        self.scanning      = False         # A scan is running on its own thread
+        self.bssid_kw      = True          # sta.connect() takes bssid= - until it turns out it doesn't
+        self.tod           = tod
+
+        # Time-to-connect metrics
+        self.connects      = 0
+        self.fast_connects = 0
+        self.failures      = 0
+        self.last_ms       = 0
+        self.total_ms      = 0
+        self.max_ms        = 0
 
+        try:
+            cache = settings.load_settings(cache_file)
+            if cache is not None and self._credentials(cache["SSID"]) is not None:
+                self.cache = cache
+        except Exception:
+            pass  # No usable cache - start with a scan
 
     def __repr__(self):
         '''Returns representation of the object'''
         return("{}({!r})".format(self.__class__.__name__, self.config))
 
+    def _credentials(self, ssid):
+        """ Find the configured credentials for a network
+
+        Returns:
+            int: Index in config, or None if it isn't configured
+        """
+        for index in range(len(self.config)):
+            if self.config[index]['SSID'] == ssid:
+                return index
+        return None
+
     def connect(self):
-        """ Ensure we have a network connection. If not connection, try each set of credentials in turn
-            up to ten times before trying the next connection.
+        """ Ensure we have a network connection. Call this often - it never blocks for long, so it can be called
+        between pulses.
+
+        When the connection drops, reconnect directly to the access point last used (skipping DHCP if the
+        lease is recent), then scan and try the configured networks strongest first, then wait before trying
+        again, doubling the wait after each failed round. The scan runs on its own thread.
         """ 
+        if self.scanning:
+            return                                      # Nothing to try until the scan finishes
 
-        # Give the WiFi five seconds to actually do something
         now = ticks_ms()
-        if now < ticks_add(self.last_attempt, 15000):
-            return
-        self.last_attempt = now
 
         if self.sta.isconnected():  # If we have an active connection, our work is done.
             if not self.connected:
-                print("Connected to connection {}".format(self.connection))
-                self.connected = True
+                self._connected(now)
             return
 
-        # We're not connected - so try the next connection
-        self.connected = False
-        self.connection += 1
-        self.connection %= len(self.config)
-        print("Trying WiFi connection #{}".format(self.connection))
+        if self.connected:
+            print("Lost connection {}".format(self.connection))
+            self.connected  = False
+            self.candidates = []
+            self.retry_at   = None
+            self.backoff_ms = BACKOFF_MS
+
+        if self.attempt_at is not None:
+            if ticks_diff(now, self.attempt_at) < ATTEMPT_MS:
+                return                                  # Give the current attempt time to succeed
+            self.attempt_at  = None
+            self.failures   += 1
+            self._dynamic()
+
+        if not self.candidates:
+            if self.retry_at is not None and ticks_diff(now, self.retry_at) < 0:
+                return                                  # Backing off
+            if self.started_at is not None and self.retry_at is None:
+                # Every candidate in this round failed - wait before the next round
+                self.retry_at   = ticks_add(now, self.backoff_ms)
+                print("No WiFi connection - retrying in {}s".format(self.backoff_ms // 1000))
+                self.backoff_ms = min(self.backoff_ms * 2, BACKOFF_MAX)
+                return
+            self.retry_at   = None
+            self.candidates = [FAST, SCAN] if self.cache is not None else [SCAN]
+            if self.started_at is None:
+                self.started_at = now
+
+        with _SECT_CONNECT:
+            candidate = self.candidates.pop(0)
+            if candidate == SCAN:
+                self.seen = {}
+                if _thread is not None:
+                    self.sta.active(True)
+                    self.scanning   = True
+                    self.candidates = [RANKED]
+                    _thread.start_new_thread("Scan", self._scan, ())
+                    return
+                candidate = RANKED                      # No threads - go by the cached access point alone
+            if candidate == RANKED:
+                self.candidates = self._ranked()
+                if not self.candidates:
+                    return
+                candidate = self.candidates.pop(0)
+            self._attempt(candidate)
+            self.attempt_at = ticks_ms()
+
+    def _scan(self):
+        """ Find the strongest access point for each network - runs on its own thread
+        """
+        seen = {}
+        try:
+            for (ssid, bssid, channel, rssi, authmode, hidden) in self.sta.scan():
+                ssid = ssid.decode()
+                if ssid not in seen or rssi > seen[ssid][2]:
+                    seen[ssid] = (bssid, channel, rssi)
+        except Exception as e:
+            print("WiFi scan failed: {}".format(e))
+        self.seen     = seen
+        self.scanning = False
+
+    def _ranked(self):
+        """ Put the configured networks in order of signal strength in the last scan - networks which weren't
+        seen (e.g. hidden ones) come last
+
+        Returns:
+            list: Indexes in config
+        """
+        ranked = []
+        for index in range(len(self.config)):
+            ssid = self.config[index]['SSID']
+            rssi = self.seen[ssid][2] if ssid in self.seen else -1000
+            ranked.append((rssi, index))
+        ranked.sort(reverse = True)
+        return [index for (rssi, index) in ranked]
+
+    def _attempt(self, candidate):
+        """ Start connecting
+
+        Args:
+            candidate (int): Index in config, or FAST to reconnect to the cached access point
+        """
+        bssid = None
+        if candidate == FAST:
+            self.connection = self._credentials(self.cache['SSID'])
+            bssid           = unhexlify(self.cache['BSSID']) if self.cache.get('BSSID') else None
+            leased          = self.cache.get('Leased')
+            fresh_lease     = (self.cache.get('IP') and leased is not None and self.tod is not None
+                               and 0 <= self.tod.utc - leased < LEASE_S)
+        else:
+            self.connection = candidate
+            ssid            = self.config[candidate]['SSID']
+            bssid           = self.seen[ssid][0] if ssid in self.seen else None
+            fresh_lease     = False
+            if bssid is None and self.cache is not None and self.cache['SSID'] == ssid and self.cache.get('BSSID'):
+                bssid       = unhexlify(self.cache['BSSID'])  # Not scanned - use where it was last time
+
+        config = self.config[self.connection]
+        print("Trying WiFi connection #{}{}".format(self.connection, " (fast)" if candidate == FAST else ""))
         self.sta.active(True)
         sleep_ms(20)
-        self.sta.config(dhcp_hostname = self.config[self.connection]['Hostname'])
-        self.sta.connect(self.config[self.connection]['SSID'], self.config[self.connection]['Password'])
+        self.sta.config(dhcp_hostname = config['Hostname'])
+        if fresh_lease:
+            try:
+                self.sta.ifconfig(tuple(self.cache['IP']))
+                self.static = True
+            except Exception:
+                pass # Fall back to DHCP
+        if bssid is not None and self.bssid_kw:
+            try:
+                self.sta.connect(config['SSID'], config['Password'], bssid = bssid)
+                return
+            except TypeError:
+                self.bssid_kw = False   # Not supported by this port (e.g. Loboris) - connect by SSID alone
+        self.sta.connect(config['SSID'], config['Password'])
+
+    def _dynamic(self):
+        """ Go back to DHCP if the cached IP lease was used for a failed attempt
+        """
+        if self.static:
+            self.static = False
+            try:
+                self.sta.ifconfig('dhcp')
+            except Exception:
+                pass
+
+    def _connected(self, now):
+        """ Record the connection metrics, and cache how to get back to this access point quickly
+        """
+        took               = ticks_diff(now, self.started_at) if self.started_at is not None else 0
+        fast               = self.candidates[:1] == [SCAN] # Nothing has been tried since the fast attempt
+        self.connected     = True
+        self.connects     += 1
+        self.fast_connects += 1 if fast else 0
+        self.last_ms       = took
+        self.total_ms     += took
+        self.max_ms        = max(self.max_ms, took)
+        self.attempt_at    = None
+        self.started_at    = None
+        self.retry_at      = None
+        self.candidates    = []
+        self.backoff_ms    = BACKOFF_MS
+        print("Connected to connection {} in {}ms".format(self.connection, took))
+
+        ssid  = self.config[self.connection]['SSID']
+        cache = { "SSID": ssid, "BSSID": None, "Channel": None, "IP": list(self.sta.ifconfig()),
+                  "Leased": self.tod.utc if self.tod is not None else None }
+        if ssid in self.seen:
+            cache["BSSID"]   = hexlify(self.seen[ssid][0]).decode()
+            cache["Channel"] = self.seen[ssid][1]
+        elif self.cache is not None and self.cache['SSID'] == ssid:
+            cache["BSSID"]   = self.cache.get('BSSID')
+            cache["Channel"] = self.cache.get('Channel')
+        if self.static and self.cache is not None:
+            cache["Leased"]  = self.cache.get('Leased')     # Re-using a lease doesn't renew it
+        try:
+            cache["Channel"] = self.sta.config('channel')
+        except Exception:
+            pass
+        self.cache = cache
+        settings.save_settings(self.cache_file, cache)
+
+    def disconnect(self):
+        """ Turn the radio off, and forget any connection attempt in progress
+        """
+        self.sta.disconnect()
+        self.sta.active(False)
+        self._dynamic()
+        self.connected  = False
+        self.candidates = []
+        self.attempt_at = None
+        self.started_at = None
+        self.retry_at   = None
+        self.backoff_ms = BACKOFF_MS
+
+    def stats(self):
+        """ Connection metrics - e.g. to return from a web endpoint
+
+        Returns:
+            dict: Connection counts and times to connect in milliseconds
+        """
+        return { "connected":     self.connected,
+                 "connects":      self.connects,
+                 "fast_connects": self.fast_connects,
+                 "failures":      self.failures,
+                 "last_ms":       self.last_ms,
+                 "mean_ms":       self.total_ms // self.connects if self.connects else 0,
+                 "max_ms":        self.max_ms }
 
     def get_ip_addr(self):
         """ Get the current IP address
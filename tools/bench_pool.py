@@ -0,0 +1,109 @@
+""" Benchmark of XAsyncSocketsPool readiness backends with many idle connections - run on a PC, not the ESP32
+
+A number of idle keep-alive connections (socket pairs, each XAsyncTCPClient waiting in AsyncRecvLine() for a
+next request which never comes) are held by the pool alongside one busy connection which echoes lines back.
+For each backend this reports how long it takes to register the connections, to switch write notification on
+and off for all of them (as every response does), and how many echo round trips the busy connection manages
+per second while the idle ones are watched too.
+
+select() cannot watch descriptors numbered FD_SETSIZE (1024) or more, so with many connections its figures
+are only given if the descriptors happen to fit.
+
+Usage:
+    python tools/bench_pool.py [--connections 1000] [--trips 2000] [--backend selectors]
+"""
+
+import argparse
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "MicroWebSrv2", "MicroWebSrv2", "libs"))
+
+from XAsyncSockets import XAsyncSocketsPool, XAsyncTCPClient, XBufferSlot
+
+FD_SETSIZE = 1024
+
+def client(pool, sock):
+    """ An XAsyncTCPClient on one end of a socket pair
+    """
+    return XAsyncTCPClient(pool, sock, ("0.0.0.0", 0), ("0.0.0.0", 0), XBufferSlot(size = 256), XBufferSlot(size = 256))
+
+def echo(cli, line, arg):
+    cli.AsyncSendData(line.encode() + b"\n")
+    cli.AsyncRecvLine(onLineRecv = echo)
+
+def run(name, connections, trips):
+    """ Benchmark one backend
+
+    Returns:
+        list: Registration and notification microseconds per connection, and round trips per second - or None
+    """
+    try:
+        pool = XAsyncSocketsPool(backend = name)
+    except Exception as e:
+        print("{:10} {}".format(name, e))
+        return None
+
+    pairs = [socket.socketpair() for i in range(connections + 1)]
+    if pool.Backend == "select" and max(max(near.fileno(), far.fileno()) for (near, far) in pairs) >= FD_SETSIZE:
+        print("{:10} skipped - descriptors beyond FD_SETSIZE".format(name))
+        for pair in pairs:
+            pair[0].close()
+            pair[1].close()
+        return None
+
+    # The busy connection is added last, so it is the one the backend finds after all the idle ones
+    start   = time.perf_counter()
+    clients = [client(pool, near) for (near, far) in pairs]
+    for cli in clients[:-1]:
+        cli.AsyncRecvLine(onLineRecv = echo)
+    register = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for cli in clients[:-1]:
+        pool.NotifyNextReadyForWriting(cli, True)
+        pool.NotifyNextReadyForWriting(cli, False)
+    notify = time.perf_counter() - start
+
+    busy = pairs[-1][1]
+    busy.settimeout(5)
+    clients[-1].AsyncRecvLine(onLineRecv = echo)
+    pool.AsyncWaitEvents(threadsCount = 1)
+    start = time.perf_counter()
+    try:
+        for i in range(trips):
+            busy.sendall(b"GET / HTTP/1.1\n")
+            reply = b""
+            while not reply.endswith(b"\n"):
+                reply += busy.recv(256)
+    except socket.timeout:
+        print("{:10} stalled after {} round trips".format(pool.Backend, i))
+        trips = i
+    elapsed = time.perf_counter() - start
+    pool.StopWaitEvents()
+
+    for cli in clients:
+        cli.Close()
+    for (near, far) in pairs:
+        far.close()
+
+    result = [register * 1e6 / connections, notify * 1e6 / connections / 2, trips / elapsed]
+    print("{:10} {:12.1f} {:12.1f} {:12.0f}".format(pool.Backend, *result))
+    return result
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "XAsyncSocketsPool backends with many idle connections")
+    parser.add_argument("--connections", type = int, default = 1000, help = "Idle connections")
+    parser.add_argument("--trips",       type = int, default = 2000, help = "Round trips on the busy connection")
+    parser.add_argument("--backend",     action = "append", help = "Backend to run, repeatable (default all)")
+    args   = parser.parse_args(argv)
+
+    print("{} idle connections, {} round trips".format(args.connections, args.trips))
+    print("{:10} {:>12} {:>12} {:>12}".format("backend", "register us", "notify us", "trips/s"))
+    for name in args.backend or [entry[0] for entry in XAsyncSocketsPool.BACKENDS]:
+        run(name, args.connections, args.trips)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+""" Benchmark of HTTP request parsing through XAsyncTCPClient - run on a PC, not the ESP32
+
+Pipelined requests (request line, headers and a small body) are written down one end of a socket pair, and the
+other end is read by an XAsyncTCPClient with AsyncRecvLine() for each line and AsyncRecvData() for each body,
+just as MicroWebSrv2's HttpRequest does. Reports requests and bytes parsed per second, and the socket reads,
+select() calls and OnReadyForReading() calls needed per request.
+
+Usage:
+    python tools/bench_recvline.py [--requests 2000] [--headers 12]
+"""
+
+import argparse
+import os
+import select
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "MicroWebSrv2", "MicroWebSrv2", "libs"))
+
+from XAsyncSockets import XAsyncSocketsPool, XAsyncTCPClient, XBufferSlot
+
+class CountingSocket:
+    """ A socket which counts the reads made on it
+    """
+    def __init__(self, sock):
+        self.sock  = sock
+        self.reads = 0
+
+    def recv(self, size):
+        self.reads += 1
+        return self.sock.recv(size)
+
+    def recv_into(self, buf, size = 0):
+        self.reads += 1
+        return self.sock.recv_into(buf, size)
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+class Parser:
+    """ Reads requests the way HttpRequest does, counting them
+    """
+    def __init__(self, client):
+        self.client   = client
+        self.requests = 0
+        self.length   = 0
+        self.client.AsyncRecvLine(onLineRecv = self._line)
+
+    def _line(self, client, line, arg):
+        if line:
+            if line.startswith("Content-Length:"):
+                self.length = int(line[15:])
+            client.AsyncRecvLine(onLineRecv = self._line)
+        elif self.length:
+            client.AsyncRecvData(size = self.length, onDataRecv = self._body)
+        else:
+            self._done(client)
+
+    def _body(self, client, data, arg):
+        self._done(client)
+
+    def _done(self, client):
+        self.requests += 1
+        self.length    = 0
+        client.AsyncRecvLine(onLineRecv = self._line)
+
+def request(headers):
+    """ One request with the given number of headers and a small form body
+    """
+    body  = b"firstname=Pulse&lastname=Clock"
+    lines = [b"POST /test-post HTTP/1.1", b"Host: 192.168.1.10"]
+    for i in range(headers - 3):
+        lines.append(b"X-Header-%d: some typical header value text %d" % (i, i))
+    lines.append(b"Content-Type: application/x-www-form-urlencoded")
+    lines.append(b"Content-Length: %d" % len(body))
+    return b"\r\n".join(lines) + b"\r\n\r\n" + body
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "XAsyncTCPClient request parsing throughput")
+    parser.add_argument("--requests", type = int, default = 2000)
+    parser.add_argument("--headers",  type = int, default = 12)
+    args   = parser.parse_args(argv)
+
+    payload         = request(args.headers) * args.requests
+    (near, far)     = socket.socketpair()
+    counted         = CountingSocket(near)
+    pool            = XAsyncSocketsPool()
+    client          = XAsyncTCPClient(pool, counted, ("0.0.0.0", 0), ("0.0.0.0", 0),
+                                      XBufferSlot(size = 4096), XBufferSlot(size = 4096))
+    reader          = Parser(client)
+    writer          = threading.Thread(target = far.sendall, args = (payload,))
+
+    selects = 0
+    events  = 0
+    start   = time.perf_counter()
+    writer.start()
+    while reader.requests < args.requests:
+        (ready, _, _) = select.select([near], [], [], 1.0)
+        selects += 1
+        if not ready:
+            print("Stalled after {} requests".format(reader.requests))
+            break
+        client.OnReadyForReading()
+        events += 1
+    elapsed = time.perf_counter() - start
+    writer.join()
+    far.close()
+    client.Close()
+
+    print("{} requests of {} bytes in {:.3f}s".format(reader.requests, len(payload) // args.requests, elapsed))
+    print("{:10.0f} requests/s {:10.2f} MB/s".format(reader.requests / elapsed, len(payload) / elapsed / 1e6))
+    print("{:10.2f} reads, {:.2f} selects, {:.2f} OnReadyForReading calls per request".format(
+          counted.reads / reader.requests, selects / reader.requests, events / reader.requests))
+
+if __name__ == "__main__":
+    main()
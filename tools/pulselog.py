@@ -0,0 +1,325 @@
+""" Offline analysis of pulse clock logs - run on a PC, not the ESP32
+
+Reads either or both of:
+    * Serial console logs, using the "Min/max pulses 2/4: 3-3333..." line PulseClock._update prints each minute.
+      The record after the colon has one entry per step - a "-" if the sensor saw white, then the number of
+      sensor edges (a single digit, or a larger number with a space either side). A line may start with a
+      timestamp ("2024-01-31 12:34:56" or "12:34:56") if the terminal program added one.
+    * Binary step logs (*.bin), STEP_SIZE bytes per step in STEP_FORMAT - see below.
+
+Each step is classified from its sensor edge count:
+    miss   - no edges, the hand didn't move
+    glide  - more than GLIDE_EDGES edges, the hand slid on by several seconds
+    bounce - more edges than a clean step gives (--clean) but not a glide, the hand oscillated as it stopped
+
+and the per-minute miss, glide and bounce rates are correlated with the pulse and stop times, the DS3231
+temperature and the time of day. Pulse and stop times come from the binary log, or for a console log from the
+clock.json given with it ("console.log,clock.json"), so logs from several clocks with different settings can be
+compared. NumPy is used if it is installed, otherwise everything is done in plain Python (much more slowly).
+
+Usage:
+    python tools/pulselog.py console.log,clock.json steps.bin --csv minutes.csv
+"""
+
+import argparse
+import json
+import re
+import struct
+import sys
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Binary step log record: time (UTC seconds, or 0 for a step made before the clock knew the time), hands (seconds from 12:00:00), second hand position, sensor edges,
+# flags, second hand correction, pulse ms, DS3231 temperature in quarter degrees, stop ms
+STEP_FORMAT  = "<IHBBBbHhH"
+STEP_SIZE    = struct.calcsize(STEP_FORMAT)
+
+FLAG_SENSOR     = 0x01 # Sensor saw white after the step
+FLAG_FAST       = 0x02 # Fast step
+FLAG_POLARITY   = 0x04 # Polarity of the pulse
+FLAG_CORRECTION = 0x08 # The white phase corrected the second hand position
+CHANNEL_SHIFT   = 4    # Movement (MultiClock channel) number in the top four bits of flags
+
+GLIDE_EDGES  = 9        # More edges than this and PulseClock assumes the hand moved several seconds
+CLEAN_EDGES  = 2        # Default for --clean
+
+COLUMNS      = ("minute", "time", "edges", "white", "fast", "pulse", "stop", "temp")
+RATES        = ("miss", "glide", "bounce")
+PARAMETERS   = ("pulse", "stop", "temp", "hour")
+
+_RE_MINUTE   = re.compile(r"^(?:\[?(?:(\d{4})-(\d\d)-(\d\d)[ T])?(\d\d):(\d\d):(\d\d)\S*\]?\s+)?.*?Min/max pulses \d+/\d+: (.*)$")
+_RE_STEP     = re.compile(r"(-?)(?: (\d+) |(\d))")
+
+class Steps:
+    """ Per-step columns, gathered in compact arrays ready for NumPy
+    """
+    def __init__(self):
+        self.columns = {}
+        for name in COLUMNS:
+            self.columns[name] = array('l')
+        self.minutes = 0 # Next minute number for console lines without a timestamp
+        self.day     = 0 # Days added to console timestamps without a date - counted as the time wraps
+        self.last    = 0 # Last console timestamp without a date
+
+    def __len__(self):
+        return len(self.columns["edges"])
+
+    def add(self, minute, time, edges, white, fast, pulse, stop, temp):
+        """ Add one step - unknown values are -1 (or for temp, -32768)
+        """
+        for (name, value) in zip(COLUMNS, (minute, time, edges, white, fast, pulse, stop, temp)):
+            self.columns[name].append(value)
+
+    def read_console(self, filename, config = None):
+        """ Add the steps from a serial console log
+
+        Args:
+            filename (string): The log
+            config   (dict)  : The clock.json the clock was running, for the pulse and stop times - or None
+        """
+        pulse = config.get("Pulse", -1) if config else -1
+        stop  = config.get("Stop",  -1) if config else -1
+        with open(filename, errors = "replace") as fd:
+            for line in fd:
+                if "Min/max pulses" not in line:
+                    continue
+                match = _RE_MINUTE.match(line.rstrip("\r\n"))
+                if match is None:
+                    continue
+                (year, month, day, hour, minute, second, record) = match.groups()
+                if hour is None:
+                    when         = -1
+                    key          = self.minutes
+                    self.minutes += 1
+                else:
+                    when = int(hour) * 3600 + int(minute) * 60 + int(second)
+                    if year is not None:
+                        when += _days(int(year), int(month), int(day)) * 86400
+                    else:
+                        if when < self.last - 3600:
+                            self.day += 1
+                        self.last  = when
+                        when      += self.day * 86400
+                    key  = when // 60
+                for (white, spaced, digit) in _RE_STEP.findall(record):
+                    self.add(key, when, int(spaced or digit), 1 if white else 0, 0, pulse, stop, -32768)
+
+    def read_binary(self, filename, channel = None):
+        """ Add the steps from a binary step log
+
+        Args:
+            filename (string): The log
+            channel  (int)   : Only the steps of this movement, from a log written by a MultiClock - or None for all
+        """
+        with open(filename, "rb") as fd:
+            data = fd.read()
+        data = data[:len(data) - len(data) % STEP_SIZE]
+        if numpy is not None:
+            dtype = numpy.dtype([("time", "<u4"), ("hands", "<u2"), ("sec_pos", "u1"), ("edges", "u1"),
+                                 ("flags", "u1"), ("correction", "i1"), ("pulse", "<u2"), ("temp", "<i2"),
+                                 ("stop", "<u2")])
+            steps = numpy.frombuffer(data, dtype)
+            steps = steps[steps["time"] != 0]
+            if channel is not None:
+                steps = steps[steps["flags"] >> CHANNEL_SHIFT == channel]
+            for (name, values) in (("minute", steps["time"] // 60), ("time", steps["time"]),
+                                   ("edges", steps["edges"]), ("white", steps["flags"] & FLAG_SENSOR),
+                                   ("fast", (steps["flags"] & FLAG_FAST) >> 1), ("pulse", steps["pulse"]),
+                                   ("stop", steps["stop"]), ("temp", steps["temp"])):
+                self.columns[name].frombytes(values.astype("i%d" % self.columns[name].itemsize).tobytes())
+        else:
+            for (when, hands, sec_pos, edges, flags, correction, pulse, temp, stop) in struct.iter_unpack(STEP_FORMAT,
+                                                                                                          data):
+                if when == 0 or (channel is not None and flags >> CHANNEL_SHIFT != channel):
+                    continue
+                self.add(when // 60, when, edges, flags & FLAG_SENSOR, (flags & FLAG_FAST) >> 1, pulse, stop, temp)
+
+def _days(year, month, day):
+    """ Days from 1970-01-01 to a date
+    """
+    month -= 3
+    if month < 0:
+        month += 12
+        year  -= 1
+    return 365 * year + year // 4 - year // 100 + year // 400 + (153 * month + 2) // 5 + day - 719469
+
+def per_minute(steps, clean):
+    """ Work out the per-minute rates and mean parameters
+
+    Args:
+        steps (Steps): The steps
+        clean (int)  : Most edges a clean step gives
+
+    Returns:
+        dict: Column name -> one value per minute, in minute order. NumPy arrays if NumPy is installed, else lists.
+    """
+    if numpy is not None:
+        cols             = {}
+        for name in COLUMNS:
+            cols[name]   = numpy.frombuffer(steps.columns[name], dtype = "i%d" % steps.columns[name].itemsize)
+        (keys, index)    = numpy.unique(cols["minute"], return_inverse = True)
+        count            = numpy.bincount(index)
+        edges            = cols["edges"]
+        result           = { "minute": keys, "steps": count }
+        result["miss"]   = numpy.bincount(index, edges == 0) / count
+        result["glide"]  = numpy.bincount(index, edges > GLIDE_EDGES) / count
+        result["bounce"] = numpy.bincount(index, (edges > clean) & (edges <= GLIDE_EDGES)) / count
+        result["fast"]   = numpy.bincount(index, cols["fast"]) / count
+        for (name, unknown) in (("pulse", -1), ("stop", -1), ("temp", -32768), ("time", -1)):
+            known        = cols[name] != unknown
+            known_count  = numpy.bincount(index, known, len(keys))
+            total        = numpy.bincount(index, numpy.where(known, cols[name], 0), len(keys))
+            with numpy.errstate(invalid = "ignore", divide = "ignore"):
+                result[name] = numpy.where(known_count > 0, total / numpy.maximum(known_count, 1), numpy.nan)
+        result["temp"]   = result["temp"] / 4
+        result["hour"]   = (result["time"] % 86400) / 3600
+        return result
+
+    sums = {}
+    cols = steps.columns
+    for i in range(len(steps)):
+        minute = cols["minute"][i]
+        if minute not in sums:
+            sums[minute] = [0, 0, 0, 0, 0, [0, 0], [0, 0], [0, 0], [0, 0]]
+        entry   = sums[minute]
+        edges   = cols["edges"][i]
+        entry[0] += 1
+        entry[1] += edges == 0
+        entry[2] += edges > GLIDE_EDGES
+        entry[3] += clean < edges <= GLIDE_EDGES
+        entry[4] += cols["fast"][i]
+        for (slot, name, unknown) in ((5, "pulse", -1), (6, "stop", -1), (7, "temp", -32768), (8, "time", -1)):
+            if cols[name][i] != unknown:
+                entry[slot][0] += cols[name][i]
+                entry[slot][1] += 1
+
+    result = dict((name, []) for name in ("minute", "steps", "miss", "glide", "bounce", "fast", "pulse", "stop",
+                                          "temp", "time", "hour"))
+    nan    = float("nan")
+    for minute in sorted(sums):
+        entry = sums[minute]
+        result["minute"].append(minute)
+        result["steps"].append(entry[0])
+        for (slot, name) in ((1, "miss"), (2, "glide"), (3, "bounce"), (4, "fast")):
+            result[name].append(entry[slot] / entry[0])
+        for (slot, name) in ((5, "pulse"), (6, "stop"), (7, "temp"), (8, "time")):
+            result[name].append(entry[slot][0] / entry[slot][1] if entry[slot][1] else nan)
+        result["temp"][-1] /= 4
+        result["hour"].append((result["time"][-1] % 86400) / 3600)
+    return result
+
+def correlate(x, y):
+    """ Pearson correlation of two columns, ignoring minutes where either is unknown
+
+    Returns:
+        float: The correlation, or None if either column is constant or there are too few known values
+    """
+    if numpy is not None:
+        x     = numpy.asarray(x, dtype = float)
+        y     = numpy.asarray(y, dtype = float)
+        known = ~(numpy.isnan(x) | numpy.isnan(y))
+        (x, y) = (x[known], y[known])
+        if len(x) < 3 or x.std() == 0 or y.std() == 0:
+            return None
+        return float(numpy.corrcoef(x, y)[0, 1])
+
+    pairs = [(a, b) for (a, b) in zip(x, y) if a == a and b == b]
+    if len(pairs) < 3:
+        return None
+    mean_x = sum(a for (a, b) in pairs) / len(pairs)
+    mean_y = sum(b for (a, b) in pairs) / len(pairs)
+    sxy    = sum((a - mean_x) * (b - mean_y) for (a, b) in pairs)
+    sxx    = sum((a - mean_x) ** 2 for (a, b) in pairs)
+    syy    = sum((b - mean_y) ** 2 for (a, b) in pairs)
+    if sxx == 0 or syy == 0:
+        return None
+    return sxy / (sxx * syy) ** 0.5
+
+def report(minutes, out = sys.stdout):
+    """ Print the overall rates, the correlations and the rates by hour of day
+
+    Args:
+        minutes (dict): From per_minute()
+        out     (file): Where to print
+    """
+    steps = sum(int(n) for n in minutes["steps"])
+    if steps == 0:
+        print("No steps found", file = out)
+        return
+    print("{} steps in {} minutes".format(steps, len(minutes["steps"])), file = out)
+    for name in RATES:
+        total = sum(float(rate) * int(n) for (rate, n) in zip(minutes[name], minutes["steps"]))
+        print("{:8s} {:9d} steps {:8.4f}%".format(name, int(round(total)), total * 100 / steps), file = out)
+
+    print("\nCorrelation of the per-minute rates with:", file = out)
+    print("{:8s}".format("") + "".join("{:>9s}".format(name) for name in PARAMETERS), file = out)
+    for name in RATES:
+        line = "{:8s}".format(name)
+        for parameter in PARAMETERS:
+            r     = correlate(minutes[name], minutes[parameter])
+            line += "{:>9s}".format("-" if r is None else "{:+.3f}".format(r))
+        print(line, file = out)
+
+    hours = {}
+    for (hour, n, miss, glide, bounce) in zip(minutes["hour"], minutes["steps"], minutes["miss"], minutes["glide"],
+                                              minutes["bounce"]):
+        if hour == hour:
+            entry = hours.setdefault(int(hour), [0, 0, 0, 0])
+            entry[0] += int(n)
+            entry[1] += float(miss) * int(n)
+            entry[2] += float(glide) * int(n)
+            entry[3] += float(bounce) * int(n)
+    if hours:
+        print("\n{:>4s} {:>9s} {:>8s} {:>8s} {:>8s}".format("Hour", "Steps", "Miss %", "Glide %", "Bounce %"),
+              file = out)
+        for hour in sorted(hours):
+            (n, miss, glide, bounce) = hours[hour]
+            print("{:4d} {:9d} {:8.4f} {:8.4f} {:8.4f}".format(hour, n, miss * 100 / n, glide * 100 / n,
+                                                                bounce * 100 / n), file = out)
+
+def write_csv(minutes, filename):
+    """ Write one row per minute
+
+    Args:
+        minutes  (dict)  : From per_minute()
+        filename (string): The CSV file
+    """
+    names = ("minute", "steps") + RATES + ("fast",) + PARAMETERS
+    with open(filename, "w") as fd:
+        fd.write(",".join(names) + "\n")
+        for row in zip(*(minutes[name] for name in names)):
+            fd.write(",".join("" if value != value else str(value) for value in row) + "\n")
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Miss, glide and bounce rates from pulse clock logs")
+    parser.add_argument("logs", nargs = "+", metavar = "LOG[,CONFIG]",
+                        help = "console log (optionally with the clock.json it ran) or binary step log (*.bin)")
+    parser.add_argument("--clean", type = int, default = CLEAN_EDGES,
+                        help = "most sensor edges a clean step gives (default {})".format(CLEAN_EDGES))
+    parser.add_argument("--channel", type = int,
+                        help = "only the steps of this movement, from a binary log written by a MultiClock")
+    parser.add_argument("--csv", help = "write the per-minute figures to this file")
+    args  = parser.parse_args(argv)
+
+    steps = Steps()
+    for log in args.logs:
+        (filename, _, config) = log.partition(",")
+        if filename.endswith(".bin"):
+            steps.read_binary(filename, args.channel)
+        else:
+            if config:
+                with open(config) as fd:
+                    config = json.loads(re.sub(r",(\s*[}\]])", r"\1", fd.read())) # The files have trailing commas
+            steps.read_console(filename, config or None)
+
+    minutes = per_minute(steps, args.clean)
+    report(minutes)
+    if args.csv:
+        write_csv(minutes, args.csv)
+
+if __name__ == "__main__":
+    main()
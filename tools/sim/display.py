@@ -0,0 +1,80 @@
+""" The simulator's display module - a TFT which draws nothing, but counts what it was asked to draw
+
+Text is measured as CHAR_WIDTH pixels a character in every font, so layouts come out the same every run.
+"""
+
+CHAR_WIDTH  = 8
+FONT_HEIGHT = 16
+
+class TFT:
+    ST7789        = 7
+    PORTRAIT      = 0
+    LANDSCAPE     = 1
+    FONT_Default  = 0
+    FONT_DejaVu18 = 1
+    FONT_DejaVu24 = 2
+    FONT_Ubuntu   = 3
+    FONT_Comic    = 4
+    FONT_Minya    = 5
+    FONT_Tooney   = 6
+    FONT_Small    = 7
+
+    def __init__(self):
+        self.fg       = 0xffffff
+        self.bg       = 0x000000
+        self.current  = self.FONT_Default
+        self.texts    = 0           # Calls to text()
+        self.rects    = 0           # Calls to rect()
+        self.clears   = 0           # Calls to clear()
+        self.measures = 0           # Calls to textWidth() and fontSize()
+        self.last     = None        # The last text drawn
+
+    def __repr__(self):
+        return "TFT()"
+
+    def init(self, *args, **kwargs):
+        pass
+
+    def deinit(self):
+        pass
+
+    def setwin(self, x1, y1, x2, y2):
+        pass
+
+    def set_fg(self, color):
+        self.fg = color
+
+    def set_bg(self, color):
+        self.bg = color
+
+    def get_fg(self):
+        return self.fg
+
+    def get_bg(self):
+        return self.bg
+
+    def font(self, font, *args, **kwargs):
+        self.current = font
+
+    def fontSize(self):
+        self.measures += 1
+        return (CHAR_WIDTH, FONT_HEIGHT)
+
+    def textWidth(self, text):
+        self.measures += 1
+        return len(text) * CHAR_WIDTH
+
+    def text(self, x, y, text, color = None, *args, **kwargs):
+        self.texts += 1
+        self.last   = text
+
+    def rect(self, x, y, w, h, color = None, fillcolor = None):
+        self.rects += 1
+
+    def clear(self, color = None):
+        self.clears += 1
+
+    def drawn(self):
+        """ Everything drawn so far, as one number - it only changes when something is drawn
+        """
+        return self.texts + self.rects + self.clears
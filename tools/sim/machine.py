@@ -0,0 +1,175 @@
+""" The simulator's machine module - pins and I2C devices which exist only in Python
+
+Pins are kept by number, so the firmware and a simulated device (e.g. movement.Movement) share the same Pin
+whoever creates it first. Devices watch outputs with watch() and drive inputs with set(), which calls the
+firmware's handler on a matching edge. I2C transfers go to the device objects registered with attach(); an
+address with nothing attached fails as a real bus does, with OSError(19).
+"""
+
+import utime
+
+_pins    = {}       # Pin number -> Pin
+_devices = {}       # I2C address -> device with read(memaddr, nbytes) and write(memaddr, data)
+_pwms    = {}       # Pin number -> PWM
+_freq    = [240000000]
+
+class Pin:
+    IN          = 1
+    OUT         = 3
+    OPEN_DRAIN  = 7
+    PULL_UP     = 1
+    PULL_DOWN   = 2
+    IRQ_RISING  = 1
+    IRQ_FALLING = 2
+    IRQ_ANYEDGE = 3
+
+    def __new__(cls, ident, *args, **kwargs):
+        if ident not in _pins:
+            pin          = object.__new__(cls)
+            pin.ident    = ident
+            pin.level    = 1 if args and args[0] == Pin.IN else 0 # Idle inputs (buttons, SQW) are pulled up
+            pin.handler  = None
+            pin.trigger  = 0
+            pin.watchers = []
+            _pins[ident] = pin
+        return _pins[ident]
+
+    def __init__(self, ident, mode = -1, pull = -1, value = None, handler = None, trigger = 0):
+        if value is not None:
+            self.value(value)
+        if handler is not None:
+            self.irq(handler, trigger)
+
+    def __repr__(self):
+        return "Pin({})".format(self.ident)
+
+    def init(self, mode = -1, pull = -1, value = None, handler = None, trigger = 0):
+        self.__init__(self.ident, mode, pull, value, handler, trigger)
+
+    def irq(self, handler = None, trigger = IRQ_ANYEDGE):
+        self.handler = handler
+        self.trigger = trigger
+
+    def value(self, level = None):
+        if level is None:
+            return self.level
+        level = 1 if level else 0
+        if level != self.level:
+            self.level = level
+            for func in self.watchers:
+                func(self)
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    # Simulator side
+
+    def watch(self, func):
+        """ Call func(pin) whenever the firmware changes the pin
+        """
+        self.watchers.append(func)
+
+    def set(self, level):
+        """ Drive an input, calling the firmware's handler if the edge is one it asked for
+        """
+        level = 1 if level else 0
+        if level == self.level:
+            return
+        self.level = level
+        if self.handler is not None and self.trigger & (Pin.IRQ_RISING if level else Pin.IRQ_FALLING):
+            self.handler(self)
+
+def pin(ident):
+    """ The pin with the given number, creating it if the firmware hasn't yet
+    """
+    return Pin(ident)
+
+class PWM:
+    def __init__(self, pin, freq = 5000, duty = 50):
+        self.pin     = pin
+        self.freq    = freq
+        self.level   = duty
+        self.changes = 0            # Duty changes, for checking nothing flickers
+        _pwms[pin]   = self
+
+    def __repr__(self):
+        return "PWM({}, duty={})".format(self.pin, self.level)
+
+    def duty(self, duty = None):
+        if duty is None:
+            return self.level
+        if duty != self.level:
+            self.changes += 1
+        self.level = duty
+
+    def deinit(self):
+        pass
+
+def pwm(pin):
+    """ The PWM the firmware created on a pin, or None
+    """
+    return _pwms.get(pin)
+
+class I2C:
+    def __init__(self, ident = 0, scl = None, sda = None, freq = 400000, speed = None):
+        self.ident = ident
+        self.freq  = freq if speed is None else speed
+
+    def __repr__(self):
+        return "I2C({}, freq={})".format(self.ident, self.freq)
+
+    def _device(self, addr):
+        if addr not in _devices:
+            raise OSError(19)
+        return _devices[addr]
+
+    def scan(self):
+        return sorted(_devices)
+
+    def readfrom_mem_into(self, addr, memaddr, buf, addrsize = 8, adrlen = 1):
+        buf[:] = self._device(addr).read(memaddr, len(buf))
+
+    def readfrom_mem(self, addr, memaddr, nbytes, addrsize = 8, adrlen = 1):
+        return bytes(self._device(addr).read(memaddr, nbytes))
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize = 8, adrlen = 1):
+        self._device(addr).write(memaddr, bytes(buf))
+
+    def readfrom_into(self, addr, buf):
+        buf[:] = self._device(addr).read(None, len(buf))
+
+    def writeto(self, addr, buf, stop = True):
+        self._device(addr).write(None, bytes(buf))
+        return len(buf)
+
+    def deinit(self):
+        pass
+
+def attach(addr, device):
+    """ Put a simulated device on the I2C bus
+    """
+    _devices[addr] = device
+
+class RTC:
+    def init(self, tm):
+        pass
+
+    def datetime(self, tm = None):
+        return utime.gmtime()
+
+def freq(hz = None):
+    if hz is None:
+        return _freq[0]
+    _freq[0] = hz
+
+def idle():
+    utime.sleep_ms(1)
+
+def lightsleep(ms = None):
+    utime.sleep_ms(ms or 0)
+
+def reset():
+    raise SystemExit("machine.reset()")
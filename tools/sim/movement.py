@@ -0,0 +1,77 @@
+""" A simulated slave clock movement on the simulator's pins
+
+The movement is a Lavet stepping motor: it only steps on a drive pulse of the opposite polarity to the last one
+which stepped it, and only if the pulse lasts at least MIN_PULSE_MS. Each step gives EDGES sensor edges (one
+fewer if need be), and the sensor sees white one second before each multiple of four seconds - PulseClock reads it
+as a step starts and compares it with where that step will leave the hand.
+
+Every movement counts the H-bridges driving at once, so a schedule which exceeds its budget can be caught.
+"""
+
+import utime
+from machine import Pin
+
+MIN_PULSE_MS = 25
+EDGES        = 2
+
+driving      = 0    # H-bridges driving a motor right now
+max_driving  = 0    # The most there have ever been at once
+
+class Movement:
+    def __init__(self, plus, minus, enable, sense, hands):
+        """ Attach a movement to the pins of one channel
+
+        Args:
+            plus, minus, enable, sense (int): Pin numbers, as in clock.json
+            hands                     (int): Where the hands really are, seconds from 12:00:00
+        """
+        self.plus     = Pin(plus)
+        self.minus    = Pin(minus)
+        self.enable   = Pin(enable)
+        self.sense    = Pin(sense)
+        self.hands    = hands % 43200
+        self.last     = -1 if hands % 2 else 1  # Polarity of the pulse which moved the hand here (as PulseClock drives it)
+        self.drive    = 0                       # Polarity of the pulse being driven now, or 0
+        self.start_us = 0
+        self.steps    = 0
+        self.short    = 0                       # Pulses too short to step
+        self.same     = 0                       # Pulses of the same polarity as the last step
+        for pin in (self.plus, self.minus, self.enable):
+            pin.watch(self._changed)
+        self.sense.level = self.white
+
+    def __repr__(self):
+        return "Movement({}, {})".format(self.plus, self.hands)
+
+    @property
+    def white(self):
+        return 1 if (self.hands + 1) % 4 == 0 else 0
+
+    def _changed(self, pin):
+        global driving, max_driving
+
+        drive = (self.plus.level - self.minus.level) if self.enable.level else 0
+        if drive == self.drive:
+            return
+        if self.drive != 0:
+            driving -= 1
+            self._ended(self.drive, utime.now_us - self.start_us)
+        self.drive = drive
+        if drive != 0:
+            driving       += 1
+            max_driving    = max(max_driving, driving)
+            self.start_us  = utime.now_us
+
+    def _ended(self, drive, length_us):
+        if length_us < MIN_PULSE_MS * 1000:
+            self.short += 1
+            return
+        if drive == self.last:
+            self.same += 1
+            return
+        self.last   = drive
+        self.hands  = (self.hands + 1) % 43200
+        self.steps += 1
+        edges = EDGES if (EDGES % 2 == 0) == (self.sense.level == self.white) else EDGES - 1 # End on the new colour
+        for _ in range(edges):
+            self.sense.set(1 - self.sense.level)
@@ -0,0 +1,81 @@
+""" MicroPython's _thread and gc, as the Loboris port has them, for modules CPython has built in
+
+_thread and gc are built into CPython, so a module of the same name in this directory would never be imported.
+install() puts these in sys.modules instead - call it after importing anything from the standard library which
+uses the real ones (threading, tempfile, ...).
+
+    _thread  start_new_thread(name, func, args) runs func there and then, so there are no real threads; a
+             thread's notifications are queued for it, and wait() returns the next one (or 0 if none is queued)
+    gc       The CPython collector, with mem_alloc() and mem_free() measured by tracemalloc if it is tracing
+             (otherwise mem_alloc() is always 0), and a threshold() which does nothing
+"""
+
+import _thread as _cpython_thread
+import gc as _cpython_gc
+import sys
+import tracemalloc
+import types
+
+HEAP = 100 * 1024   # What mem_alloc() + mem_free() add up to - about the heap left on a WROVER with the UI up
+
+def _make_thread():
+    module        = types.ModuleType("_thread", "The Loboris port's _thread, without real threads")
+    notifications = {}                  # Thread id -> notifications not yet waited for
+    current       = [0]                 # The thread running now - 0 for the main thread
+
+    def start_new_thread(name, func, args):
+        ident                = len(notifications) + 1
+        notifications[ident] = []
+        (caller, current[0]) = (current[0], ident)
+        try:
+            func(*args)
+        finally:
+            current[0] = caller
+        return ident
+
+    def notify(ident, value):
+        if ident in notifications:
+            notifications[ident].append(value)
+            return True
+        return False
+
+    def wait(timeout_ms = None):
+        queued = notifications.get(current[0], [])
+        return queued.pop(0) if queued else 0
+
+    def getnotification():
+        return wait()
+
+    def allowsuspend(allow):
+        pass
+
+    module.start_new_thread = start_new_thread
+    module.notify           = notify
+    module.wait             = wait
+    module.getnotification  = getnotification
+    module.allowsuspend     = allowsuspend
+    module.allocate_lock    = _cpython_thread.allocate_lock
+    module.get_ident        = _cpython_thread.get_ident
+    module.EXIT             = 1
+    module.SUSPEND          = 2
+    module.RESUME           = 3
+    return module
+
+def _make_gc():
+    module = types.ModuleType("gc", "CPython's gc with MicroPython's heap accounting")
+    for name in ("collect", "enable", "disable", "isenabled", "get_objects"):
+        setattr(module, name, getattr(_cpython_gc, name))
+
+    def mem_alloc():
+        return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+    module.mem_alloc = mem_alloc
+    module.mem_free  = lambda: HEAP - mem_alloc()
+    module.threshold = lambda amount = None: -1
+    return module
+
+def install():
+    """ Make _thread and gc the MicroPython ones, for everything imported from now on
+    """
+    sys.modules["_thread"] = _make_thread()
+    sys.modules["gc"]      = _make_gc()
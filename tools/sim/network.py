@@ -0,0 +1,41 @@
+""" The simulator's network module - a WLAN which is never connected unless told to be
+"""
+
+STA_IF = 0
+AP_IF  = 1
+
+_state = { "connected": False, "ip": "192.168.4.2" }
+
+class WLAN:
+    def __init__(self, interface = STA_IF):
+        self.interface = interface
+        self._active   = False
+
+    def __repr__(self):
+        return "WLAN({})".format(self.interface)
+
+    def active(self, on = None):
+        if on is None:
+            return self._active
+        self._active = bool(on)
+
+    def connect(self, *args, **kwargs):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def isconnected(self):
+        return self._active and _state["connected"]
+
+    def ifconfig(self):
+        return (_state["ip"], "255.255.255.0", "192.168.4.1", "192.168.4.1")
+
+    def scan(self):
+        return []
+
+    def config(self, *args, **kwargs):
+        return None
+
+    def status(self, *args):
+        return 0
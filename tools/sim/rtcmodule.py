@@ -0,0 +1,111 @@
+""" A simulated DS3231 RTC module: the DS3231 itself at 0x68, and the 24C32 EEPROM on the same board at 0x57
+
+The DS3231 keeps time against the simulator's virtual clock. Writing the seconds register restarts the second,
+as it does on the chip, and with INTCN clear the INT/SQW pin (if it is wired to one) falls as each second starts
+and rises half way through it. Its oscillator-stopped flag is set until the firmware clears it, as after a first
+power-up. The EEPROM is just memory - its write cycle time is the firmware's to wait for.
+
+Usage:
+    rtc = rtcmodule.DS3231(calendar.timegm((2024, 1, 1, 10, 9, 0)), sqw = 4)
+    machine.attach(0x68, rtc)
+    machine.attach(0x57, rtcmodule.AT24C32())
+"""
+
+import calendar
+import time as _time
+
+import utime
+from machine import Pin
+
+SECOND_US = 1000000
+
+def _bcd(n):
+    return ((n // 10) << 4) | (n % 10)
+
+def _dec(bcd):
+    return (bcd >> 4) * 10 + (bcd & 0x0f)
+
+class DS3231:
+    def __init__(self, utc = 0, sqw = None, temp = 21.25):
+        """ Start the RTC
+
+        Args:
+            utc  (int)  : Seconds since 1970 it shows now
+            sqw  (int)  : The pin its INT/SQW output is wired to, or None
+            temp (float): What the temperature sensor reads, to a quarter of a degree
+        """
+        self.regs     = bytearray(19)
+        self.regs[14] = 0x1c                # Power-on control: INTCN set, so no squarewave until asked for
+        self.regs[15] = 0x88                # Power-on status: OSF and EN32kHz set
+        self.temp     = temp
+        self.sqw      = None if sqw is None else Pin(sqw, Pin.IN) # Open drain, pulled up
+        self.writes   = 0
+        self._second  = 0                   # Which second the scheduled squarewave edges belong to
+        self._set(utc)
+
+    def __repr__(self):
+        return "DS3231({})".format(self.utc)
+
+    @property
+    def utc(self):
+        """ Seconds since 1970 it shows now
+        """
+        return self._base + (utime.now_us - self._start_us) // SECOND_US
+
+    def _set(self, utc):
+        """ Set the time, starting a new second now
+        """
+        self._base     = utc
+        self._start_us = utime.now_us
+        self._second  += 1                  # Any edges already scheduled belong to the old second
+        self._schedule(self._second, self._start_us + SECOND_US)
+
+    def _schedule(self, second, due_us):
+        utime.at(due_us, lambda: self._edge(second, due_us, 0))
+        utime.at(due_us + SECOND_US // 2, lambda: self._edge(second, due_us, 1))
+
+    def _edge(self, second, due_us, level):
+        if second != self._second:
+            return
+        if self.sqw is not None and not self.regs[0x0e] & 0x04:
+            self.sqw.set(level)
+        if level:
+            self._schedule(second, due_us + SECOND_US)
+
+    def read(self, memaddr, nbytes):
+        tm = _time.gmtime(self.utc)
+        self.regs[0:7] = bytes((_bcd(tm.tm_sec), _bcd(tm.tm_min), _bcd(tm.tm_hour), tm.tm_wday + 1, _bcd(tm.tm_mday),
+                                _bcd(tm.tm_mon) | (0x80 if tm.tm_year >= 2000 else 0), _bcd(tm.tm_year % 100)))
+        t = int(self.temp * 4)
+        self.regs[0x11:0x13] = bytes(((t >> 2) & 0xff, (t & 3) << 6))
+        return bytes(self.regs[memaddr + i] for i in range(nbytes))
+
+    def write(self, memaddr, data):
+        self.writes += 1
+        for i in range(len(data)):
+            self.regs[memaddr + i] = data[i]
+        if memaddr < 7:
+            r    = self.regs
+            year = _dec(r[6]) + (2000 if r[5] & 0x80 else 1900)
+            self._set(calendar.timegm((year, _dec(r[5] & 0x1f), _dec(r[4]), _dec(r[2] & 0x3f), _dec(r[1]), _dec(r[0]))))
+
+class AT24C32:
+    def __init__(self, size = 4096):
+        """ Start the EEPROM erased
+
+        Args:
+            size (int): Bytes
+        """
+        self.data   = bytearray(b"\xff" * size)
+        self.writes = 0
+
+    def __repr__(self):
+        return "AT24C32({})".format(len(self.data))
+
+    def read(self, memaddr, nbytes):
+        return bytes(self.data[(memaddr + i) % len(self.data)] for i in range(nbytes))
+
+    def write(self, memaddr, data):
+        self.writes += 1
+        for i in range(len(data)):
+            self.data[(memaddr + i) % len(self.data)] = data[i]
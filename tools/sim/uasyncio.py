@@ -0,0 +1,103 @@
+""" The simulator's uasyncio - the few parts the clock firmware uses, scheduled in virtual time
+
+CPython's asyncio sleeps in real time, so this is a small scheduler of its own: a task which sleeps is woken once
+the virtual clock reaches its time, moving the clock on if nothing else is ready first. Anything raised in a task
+(e.g. the KeyboardInterrupt a runner raises to stop the firmware) comes straight out of run().
+"""
+
+import utime
+
+_ready = []         # [due_us, seq, task] waiting to run, kept sorted
+_seq   = 0
+
+class _Yield:
+    """ What a task awaits to give up the CPU - the scheduler is told why with the value yielded
+    """
+    def __init__(self, why):
+        self.why = why
+
+    def __await__(self):
+        yield self.why
+
+class Task:
+    def __init__(self, coro):
+        self.coro    = coro
+        self.done    = False
+        self.result  = None
+        self.waiters = []
+
+    def __repr__(self):
+        return "Task({})".format(self.coro.__name__)
+
+    def __await__(self):
+        if not self.done:
+            yield self
+        return self.result
+
+def _schedule(task, due_us = None):
+    global _seq
+    _seq += 1
+    _ready.append([utime.now_us if due_us is None else due_us, _seq, task])
+    _ready.sort(key = lambda entry: entry[:2])
+
+def create_task(coro):
+    task = Task(coro)
+    _schedule(task)
+    return task
+
+async def sleep_ms(ms):
+    await _Yield(int(ms * 1000))
+
+async def sleep(secs):
+    await _Yield(int(secs * 1000000))
+
+class Event:
+    def __init__(self):
+        self.state   = False
+        self.waiters = []
+
+    def __repr__(self):
+        return "Event({})".format(self.state)
+
+    def is_set(self):
+        return self.state
+
+    def set(self):
+        self.state = True
+        for task in self.waiters:
+            _schedule(task)
+        self.waiters = []
+
+    def clear(self):
+        self.state = False
+
+    async def wait(self):
+        if not self.state:
+            await _Yield(self)
+
+async def gather(*tasks):
+    return [await task for task in tasks]
+
+def run(coro):
+    """ Run coro, and every task it creates, until coro returns
+
+    Returns:
+        Whatever coro returned
+    """
+    main = create_task(coro)
+    while not main.done:
+        (due_us, _, task) = _ready.pop(0)
+        utime.advance(due_us - utime.now_us)
+        try:
+            why = task.coro.send(None)
+        except StopIteration as e:
+            task.done   = True
+            task.result = e.value
+            for waiter in task.waiters:
+                _schedule(waiter)
+            continue
+        if isinstance(why, int):
+            _schedule(task, utime.now_us + why)   # Sleeping
+        else:
+            why.waiters.append(task)            # Waiting for an Event to be set or a Task to finish
+    return main.result
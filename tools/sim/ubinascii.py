@@ -0,0 +1,4 @@
+""" The simulator's ubinascii is CPython's binascii
+"""
+
+from binascii import *
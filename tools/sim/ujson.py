@@ -0,0 +1,4 @@
+""" The simulator's ujson is CPython's json
+"""
+
+from json import *
@@ -0,0 +1,4 @@
+""" The simulator's uos is CPython's os
+"""
+
+from os import *
@@ -0,0 +1,7 @@
+""" The simulator's usocket - there is no network, so every name lookup fails
+"""
+
+from socket import AF_INET, SOCK_DGRAM, SOCK_STREAM
+
+def getaddrinfo(host, port, *args):
+    raise OSError(-202) # As lwIP does when the name can't be resolved
@@ -0,0 +1,4 @@
+""" The simulator's ustruct is CPython's struct
+"""
+
+from struct import *
@@ -0,0 +1,79 @@
+""" Virtual time for the simulator - see README
+
+Time only moves when the firmware waits for it: sleep_ms() and friends jump ahead, and every ticks_us() call
+moves it on by one microsecond so that spin loops end. Callbacks can be scheduled against the virtual clock
+with at(), and run as the clock passes them. ticks wrap at 2**30 as they do on the ESP32.
+"""
+
+import calendar
+import time as _time
+
+TICKS_PERIOD = 1 << 30
+START        = 1704067200         # Virtual time starts at 2024-01-01 00:00:00 - the Loboris port counts from 1970
+
+now_us  = 0                       # Virtual microseconds since START
+_events = []                      # [due_us, seq, func] scheduled by at(), kept sorted
+_seq    = 0
+
+def advance(us):
+    """ Move the virtual clock on, running any callbacks which fall due on the way
+
+    Args:
+        us (int): Microseconds to move on by
+    """
+    global now_us
+    end = now_us + max(0, us)
+    while _events and _events[0][0] <= end:
+        (due, _, func) = _events.pop(0)
+        now_us = max(now_us, due)
+        func()
+    now_us = end
+
+def at(due_us, func):
+    """ Call func once the virtual clock reaches due_us
+
+    Args:
+        due_us (int)     : Virtual microseconds since START
+        func   (function): Called with no arguments
+    """
+    global _seq
+    _seq += 1
+    _events.append([due_us, _seq, func])
+    _events.sort()
+
+def ticks_us():
+    advance(1)
+    return now_us % TICKS_PERIOD
+
+def ticks_ms():
+    advance(1)
+    return (now_us // 1000) % TICKS_PERIOD
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) % TICKS_PERIOD
+
+def ticks_diff(new, old):
+    return ((new - old + TICKS_PERIOD // 2) % TICKS_PERIOD) - TICKS_PERIOD // 2
+
+def sleep_us(us):
+    advance(us)
+
+def sleep_ms(ms):
+    advance(ms * 1000)
+
+def sleep(secs):
+    advance(int(secs * 1000000))
+
+def time():
+    return START + now_us // 1000000
+
+def gmtime(secs = None):
+    if secs is None:
+        secs = time()
+    tm = _time.gmtime(secs)
+    return (tm.tm_year, tm.tm_mon, tm.tm_mday, tm.tm_hour, tm.tm_min, tm.tm_sec, tm.tm_wday, tm.tm_yday)
+
+localtime = gmtime
+
+def mktime(tm):
+    return calendar.timegm(tuple(tm[:6]) + (0, 0, 0))
@@ -0,0 +1,105 @@
+""" Run the main loop firmware (main_new) on a PC with tracemalloc, and show what each tick keeps - see tools/sim
+
+main_new counts the bytes allocated by idle iterations and by iterations which made a normal pulse, and prints
+both once a minute; here gc.mem_alloc() is tracemalloc's count, so those reports come out in CPython bytes. This
+also compares tracemalloc snapshots taken around tick iterations, and lists the lines in src which allocated
+what was still held at the end of the iteration.
+
+CPython frees an object as soon as nothing refers to it, whereas MicroPython leaves it on the heap until the next
+collection. So this sees only what an iteration keeps, and CPython's objects are bigger: a line which shows up
+here allocates on the ESP32 too, but one which doesn't may still allocate something short-lived - only the counts
+main_new prints on the clock itself show that.
+
+The loop doesn't wait for anything until the display is up, and in virtual time nothing takes any time, so each
+pass is taken to cost PASS_US as it would on the ESP32.
+
+Usage:
+    python tools/sim_allocs.py --seconds 200
+"""
+
+import argparse
+import calendar
+import collections
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+
+import sim_async    # Puts tools/sim and src on the path, and installs MicroPython's _thread and gc
+import utime
+import machine
+import movement
+import rtcmodule
+import ds3231
+import eeprom
+import todcounter
+import alloccount
+
+SRC     = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+PASS_US = 20 # How long a pass around the main loop takes
+
+class TickAllocs:
+    """ What the tick iterations measured by main_new kept, by the line in src which allocated it
+    """
+    def __init__(self, after_us):
+        self.after_us = after_us    # Leave the catch-up and boot stages alone
+        self.before   = None
+        self.ticks    = 0
+        self.lines    = collections.Counter()
+
+    def poll(self, tod, poll):
+        utime.advance(PASS_US)
+        ticked = poll(tod)
+        if ticked and utime.now_us > self.after_us:
+            self.before = tracemalloc.take_snapshot()
+        return ticked
+
+    def end(self, counter, end):
+        allocated = end(counter)
+        if counter.name == "Tick iteration" and self.before is not None:
+            for stat in tracemalloc.take_snapshot().compare_to(self.before, "lineno"):
+                frame = stat.traceback[0]
+                if stat.size_diff > 0 and os.path.normpath(frame.filename).startswith(SRC):
+                    self.lines["{}:{}".format(os.path.basename(frame.filename), frame.lineno)] += stat.size_diff
+            self.ticks += 1
+        self.before = None
+        return allocated
+
+    def report(self):
+        print("Kept by {} tick iterations, in bytes per tick:".format(self.ticks))
+        for (line, size) in self.lines.most_common():
+            print("{:6d}  {}".format(size // max(1, self.ticks), line))
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "main_new's allocations on a simulated movement and DS3231")
+    parser.add_argument("--seconds", type = int, default = 200, help = "virtual seconds to run for")
+    args   = parser.parse_args(argv)
+
+    os.chdir(tempfile.mkdtemp(prefix = "sim_allocs"))
+    sim_async.settings_files(sim_async.SQW)
+
+    rtc   = rtcmodule.DS3231(calendar.timegm((2024, 1, 1, 10, 9, 0)), sim_async.SQW)
+    machine.attach(ds3231.DS3231_I2C_ADDR, rtc)
+    machine.attach(eeprom.EEPROM_I2C_ADDR, rtcmodule.AT24C32())
+    hands = 10 * 3600 + 9 * 60
+    ds    = ds3231.DS3231(machine.I2C(0))
+    ds.alarm1 = hands
+    ds.status = ds.status & ~eeprom.OSF
+    movement.Movement(26, 25, 27, 36, hands)
+
+    ticks = TickAllocs(60 * 1000000)
+    (poll, end) = (todcounter.TimeOfDay.poll, alloccount.AllocCounter.end)
+    todcounter.TimeOfDay.poll  = lambda tod: ticks.poll(tod, poll)
+    alloccount.AllocCounter.end = lambda counter: ticks.end(counter, end)
+
+    import main_new
+    tracemalloc.start()
+    utime.at(utime.now_us + args.seconds * 1000000, sim_async.stop)
+    main_new.main()
+    tracemalloc.stop()
+    ticks.report()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+""" Run the asyncio firmware (main_async) on a PC against a simulated movement and RTC module - see tools/sim
+
+Writes clock.json, wifi.json and ntp.json to a scratch directory, puts a DS3231 module on the I2C bus with the
+hands saved in Alarm 1 some way behind the time, and starts main_async.main() with its tasks scheduled in virtual
+time. There's no network, so the radio and NTP tasks run but never get anywhere. After the given number of
+virtual seconds it is stopped as Ctrl-C would stop it, so the shutdown path runs, and then it checks that:
+    * the movement's hands (where the simulated hands really are) show the time, without a missed step
+    * Alarm 1 and the EEPROM journal (unless the module has none - --no-eeprom) hold where the hands were left
+With --fail the supply is sensed on a GPIO, and fails that many seconds in for the rest of the run (the reservoir
+lasting), and then it checks instead that the hands were saved as it failed and haven't moved since.
+
+Usage:
+    python tools/sim_async.py --seconds 600 --behind 30
+"""
+
+import argparse
+import calendar
+import json
+import os
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, "sim"), os.path.join(HERE, "..", "src")]
+
+import mpshims
+mpshims.install()
+
+import utime
+import machine
+import movement
+import rtcmodule
+import ds3231
+import eeprom
+
+SQW    = 34 # An input-only GPIO, free on the TTGO T-Display
+SUPPLY = 39 # Another, for the power-fail input
+
+def settings_files(sqw, supply = None):
+    """ Write the settings files the firmware reads, with the movement on the pins in src/clock.json
+    """
+    clock = { "Plus": 26, "Minus": 25, "Enable": 27, "Sense": 36, "Pulse": 200, "Stop": 40, "FastPulse": 180,
+              "FastStop": 20, "StepLog": True }
+    if sqw is not None:
+        clock["SQW"] = sqw
+    if supply is not None:
+        clock["PowerFail"] = supply
+    files = { "clock.json": clock,
+              "wifi.json":  [ { "SSID": "Nowhere", "Password": "secret", "Hostname": "dgclock" } ],
+              "ntp.json":   { "NTP": "pool.ntp.org" } }
+    for (filename, values) in files.items():
+        with open(filename, "w") as fd:
+            json.dump(values, fd)
+
+def stop():
+    raise KeyboardInterrupt # As Ctrl-C at the REPL
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "main_async on a simulated movement and DS3231")
+    parser.add_argument("--seconds", type = int, default = 600, help = "virtual seconds to run for")
+    parser.add_argument("--behind",  type = int, default = 30,  help = "how far the hands start behind the time")
+    parser.add_argument("--poll",    action = "store_true",     help = "poll the DS3231 instead of using its SQW")
+    parser.add_argument("--no-eeprom", action = "store_true",   help = "a DS3231 module without the 24C32")
+    parser.add_argument("--fail",    type = int, default = None, help = "virtual seconds in to fail the supply")
+    args   = parser.parse_args(argv)
+
+    os.chdir(tempfile.mkdtemp(prefix = "sim_async"))
+    settings_files(None if args.poll else SQW, None if args.fail is None else SUPPLY)
+
+    # January, so UTC is UK local time
+    rtc   = rtcmodule.DS3231(calendar.timegm((2024, 1, 1, 10, 9, 0)), None if args.poll else SQW)
+    chip  = rtcmodule.AT24C32()
+    machine.attach(ds3231.DS3231_I2C_ADDR, rtc)
+    if not args.no_eeprom:
+        machine.attach(eeprom.EEPROM_I2C_ADDR, chip)
+    hands = (10 * 3600 + 9 * 60 - args.behind) % 43200
+    ds    = ds3231.DS3231(machine.I2C(0))
+    ds.alarm1 = hands
+    ds.status = ds.status & ~eeprom.OSF        # Its battery has kept it going
+    moved = movement.Movement(26, 25, 27, 36, hands)
+
+    failed = []                                 # (hands, journal) as the supply failed
+    def check_saved():
+        failed.append((moved.hands, eeprom.HandJournal(eeprom.EEPROM(machine.I2C(0))).recover()))
+    if args.fail is not None:
+        supply = machine.Pin(SUPPLY, machine.Pin.IN)
+        utime.at(utime.now_us + args.fail * 1000000, lambda: supply.set(0))
+        utime.at(utime.now_us + args.fail * 1000000 + 100000, check_saved)
+
+    import main_async
+    utime.at(utime.now_us + args.seconds * 1000000, stop)
+    main_async.main()
+
+    wanted   = (rtc.utc % 86400) % 43200
+    last     = None if args.no_eeprom else eeprom.HandJournal(eeprom.EEPROM(machine.I2C(0))).recover()
+    problems = []
+    print("Time {} movement {} Alarm 1 {} journal {} - {} steps, {} short, {} same polarity, {} DS3231 writes, "
+          "{} EEPROM writes".format(wanted, moved.hands, ds.alarm1, last, moved.steps, moved.short, moved.same,
+                                    rtc.writes, chip.writes))
+    if args.fail is not None:
+        print("As the supply failed the hands were at {} and the journal had {}".format(*failed[0]))
+        if failed[0][1] is None or failed[0][1][0] != failed[0][0]:
+            problems.append("the hands weren't saved as the supply failed")
+        if moved.hands != failed[0][0]:
+            problems.append("the hands moved from {} to {} after the supply failed".format(failed[0][0], moved.hands))
+    elif abs(moved.hands - wanted) > 1:
+        problems.append("the hands show {} at {}".format(moved.hands, wanted))
+    if moved.short or moved.same:
+        problems.append("pulses which didn't step")
+    if ds.alarm1 != moved.hands:
+        problems.append("Alarm 1 has {} but the hands are at {}".format(ds.alarm1, moved.hands))
+    if not args.no_eeprom and (last is None or last[0] != moved.hands):
+        problems.append("the journal has {} but the hands are at {}".format(last, moved.hands))
+
+    for problem in problems:
+        print(problem)
+    print("FAIL" if problems else "OK")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+""" Run the UI on a PC against a fake TFT, and check the backlight dims, turns off and wakes - see tools/sim
+
+The clock is left alone for longer than the Dim and Off times, with the renderer polled as the main loop would.
+Then the bottom button is pressed twice: the first press must wake the screen as soon as it goes down, but do
+nothing else, and the second must act.
+At each stage the backlight PWM duty, the Backlight state and whether anything was drawn are checked.
+
+Usage:
+    python tools/sim_backlight.py --dim 60 --off 300
+"""
+
+import argparse
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, "sim"), os.path.join(HERE, "..", "src")]
+
+import utime
+import machine
+import backlight
+import dgui
+import renderer
+
+POLL_MS = 50 # How often the main loop polls the UI
+
+def run(ui, frames, seconds):
+    """ Poll the UI as the main loop would, submitting a new snapshot every second
+
+    Returns:
+        int: How many frames were drawn
+    """
+    drawn = frames.frames
+    for step in range(seconds * 1000 // POLL_MS):
+        if utime.now_us % 1000000 < POLL_MS * 1000:
+            tm = utime.gmtime()
+            frames.submit((tm, (0, 0, 0, tm[3] % 12, tm[4], tm[5], 0, 0), "Run", True))
+        ui.handle_buttons()
+        ui.power.poll()
+        frames.poll()
+        utime.sleep_ms(POLL_MS)
+    return frames.frames - drawn
+
+def press(ui, frames, pin):
+    """ Press and release a button, polling the UI as the main loop would whilst it's down
+
+    Returns:
+        int: The backlight state whilst the button was down
+    """
+    machine.Pin(pin).set(0)
+    ui.handle_buttons()
+    ui.power.poll()
+    held = ui.power.state
+    utime.sleep_ms(100)
+    machine.Pin(pin).set(1)
+    utime.sleep_ms(400) # Longer than a double press takes
+    run(ui, frames, 1)
+    return held
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Backlight dim/off/wake on a fake TFT")
+    parser.add_argument("--dim", type = int, default = 60,  help = "seconds before dimming, or 0 never to dim")
+    parser.add_argument("--off", type = int, default = 300, help = "seconds before turning off")
+    args   = parser.parse_args(argv)
+
+    ui       = dgui.DGUI((0, 0, 0, 10, 9, 0, 0, 0), args.dim, args.off)
+    frames   = renderer.RenderScheduler(ui)
+    pwm      = machine.pwm(4)
+    (bright, dim, off) = ui.power.levels
+    problems = []
+
+    def check(stage, state, duty, drew):
+        ok = ui.power.state == state and pwm.duty() == duty
+        print("{:28s} {:4s} duty {:3d} frames {:4d} {}".format(stage, backlight.STATES[ui.power.state], pwm.duty(),
+                                                               drew, "" if ok else "<- expected {} duty {}".format(
+                                                               backlight.STATES[state], duty)))
+        if not ok:
+            problems.append(stage)
+
+    if args.dim:
+        check("Just before Dim",        backlight.ON,  bright, run(ui, frames, args.dim - 1))
+        check("Dimmed",                 backlight.DIM, dim,    run(ui, frames, 2))
+        check("Just before Off",        backlight.DIM, dim,    run(ui, frames, args.off - args.dim - 2))
+    else:
+        check("Just before Off",        backlight.ON,  bright, run(ui, frames, args.off - 1))
+    check("Off",                        backlight.OFF, off,    run(ui, frames, 2))
+    drew = run(ui, frames, 60)
+    check("Still off",                  backlight.OFF, off,    drew)
+    if drew:
+        problems.append("frames drawn with the backlight off")
+
+    mode  = ui.mode
+    drawn = frames.frames
+    held  = press(ui, frames, 35)
+    check("Woken by a press",           backlight.ON,  bright, frames.frames - drawn)
+    if held != backlight.ON:
+        problems.append("the screen stayed {} until the button was released".format(backlight.STATES[held]))
+    if ui.mode != mode or ui.power.wakes != 1:
+        problems.append("the waking press did something: mode {} wakes {}".format(ui.mode, ui.power.wakes))
+    drawn = frames.frames
+    press(ui, frames, 35)
+    check("Second press",               backlight.ON,  bright, frames.frames - drawn)
+    if ui.mode == mode:
+        problems.append("the second press was ignored")
+    print("UI mode {} -> {}".format(mode, ui.mode))
+    if args.dim:
+        check("Dimmed again",           backlight.DIM, dim,    run(ui, frames, args.dim + 1))
+
+    print(ui.power.stats())
+    for problem in problems:
+        print(problem)
+    print("FAIL" if problems else "OK")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+""" Run MultiClock on a PC against simulated movements - see tools/sim
+
+Builds a multiclock.json for the given number of channels in a scratch directory, starts every movement a
+different distance behind the time, and runs the shared pulse schedule in virtual time with the step log on.
+At the end it checks that:
+    * no more than Budget H-bridges were ever driving at once
+    * every movement's hands (where the simulated hands really are) show the time, as does its DGClock
+    * every channel's step log records are its own - one per step, each one second on from the last, except
+      where DGClock checks the second hand at :30
+
+Usage:
+    python tools/sim_multiclock.py --channels 16 --budget 4 --seconds 600
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, "sim"), os.path.join(HERE, "..", "src")]
+
+import utime
+import movement
+import multiclock
+import steplog
+
+def config(channels, budget):
+    """ A multiclock.json for the given number of channels, with made-up pin numbers
+    """
+    result = { "Budget": budget, "Pulse": 200, "Stop": 40, "FastPulse": 180, "FastStop": 20, "Spin": 500,
+               "SaveEvery": 60, "Channels": [] }
+    for i in range(channels):
+        pins = 100 + i * 4
+        result["Channels"].append({ "Plus": pins, "Minus": pins + 1, "Enable": pins + 2, "Sense": pins + 3,
+                                    "State": "hands{}.txt".format(i) })
+    return result
+
+def check_log(filename, channels, movements):
+    """ Check each channel's step log records follow on from each other
+
+    Returns:
+        list: A description of each problem found
+    """
+    with open(filename, "rb") as fd:
+        data = fd.read()
+    last     = [None] * channels
+    counts   = [0] * channels
+    problems = []
+    for (when, hands, sec_pos, edges, flags, correction, pulse, temp, stop) in struct.iter_unpack(steplog.RECORD,
+                                                                                                  data):
+        channel = flags >> steplog.CHANNEL_SHIFT
+        if channel >= channels:
+            problems.append("record for channel {}".format(channel))
+            continue
+        if last[channel] is not None and (hands - last[channel]) % 43200 != 1 and last[channel] % 60 != 29:
+            problems.append("channel {} hands went from {} to {}".format(channel, last[channel], hands))
+        last[channel]    = hands
+        counts[channel] += 1
+    for i in range(channels):
+        if counts[i] < movements[i].steps - 1: # The last step's outcome isn't known yet
+            problems.append("channel {} made {} steps but logged {}".format(i, movements[i].steps, counts[i]))
+    return problems
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "MultiClock on simulated movements")
+    parser.add_argument("--channels", type = int, default = 16, help = "movements (at most 16)")
+    parser.add_argument("--budget",   type = int, default = 4,  help = "most H-bridges driving at once")
+    parser.add_argument("--seconds",  type = int, default = 600, help = "virtual seconds to run for")
+    args   = parser.parse_args(argv)
+
+    os.chdir(tempfile.mkdtemp(prefix = "sim_multiclock"))
+    with open("multiclock.json", "w") as fd:
+        json.dump(config(args.channels, args.budget), fd)
+
+    start     = 10 * 3600 + 9 * 60                      # The time the clocks should show when the run starts
+    movements = []
+    for i in range(args.channels):
+        behind = (i * 7) % 60                           # Some right, some up to a minute behind
+        with open("hands{}.txt".format(i), "w") as fd:
+            fd.write(str(start - behind))
+        pins = 100 + i * 4
+        movements.append(movement.Movement(pins, pins + 1, pins + 2, pins + 3, start - behind))
+
+    steplog.start("steps.bin", max_bytes = 1 << 30)
+    clocks = multiclock.MultiClock("multiclock.json")
+    began  = utime.time()
+    while utime.time() - began < args.seconds:
+        wanted = (start + utime.time() - began) % 43200
+        clocks.move(wanted)
+        steplog.log.poll()
+        if clocks.mode != "Fast":                       # Wait for the next second, as the RTC tick would
+            utime.sleep_us(1000000 - utime.now_us % 1000000)
+    steplog.log.flush()
+
+    problems = []
+    print("Channel  Movement  DGClock  Steps  Short  Same")
+    for i in range(args.channels):
+        (moved, clock) = (movements[i], clocks.channels[i])
+        print("{:7d}  {:8d}  {:7d}  {:5d}  {:5d}  {:4d}".format(i, moved.hands, clock.hands, moved.steps, moved.short,
+                                                              moved.same))
+        if moved.hands != clock.hands or abs(moved.hands - wanted) > 1:
+            problems.append("channel {} shows {} (DGClock {}) at {}".format(i, moved.hands, clock.hands, wanted))
+    print("Most H-bridges driving at once: {} (budget {})".format(movement.max_driving, args.budget))
+    if movement.max_driving > args.budget:
+        problems.append("budget exceeded")
+    problems += check_log("steps.bin", args.channels, movements)
+
+    for problem in problems:
+        print(problem)
+    print("FAIL" if problems else "OK")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())